@@ -1,37 +1,33 @@
+from sqlalchemy import select
 from config.settings import ADMIN_IDS
-from database.models import User, SessionLocal
+from database.models import User, AsyncSessionLocal
 
 
-def is_admin(user_id: int) -> bool:
+async def is_admin(user_id: int) -> bool:
     if user_id in ADMIN_IDS:
         return True
 
-    db = SessionLocal()
-    user = db.query(User).filter(User.telegram_id == user_id).first()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).where(User.telegram_id == user_id))
 
     return user and user.is_admin
 
 
-def add_admin(user_id: int) -> bool:
-    db = SessionLocal()
-    user = db.query(User).filter(User.telegram_id == user_id).first()
-    if user:
-        user.is_admin = True
-        db.commit()
-        db.close()
-        return True
-    db.close()
+async def add_admin(user_id: int) -> bool:
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).where(User.telegram_id == user_id))
+        if user:
+            user.is_admin = True
+            await db.commit()
+            return True
     return False
 
 
-def remove_admin(user_id: int) -> bool:
-    db = SessionLocal()
-    user = db.query(User).filter(User.telegram_id == user_id).first()
-    if user:
-        user.is_admin = False
-        db.commit()
-        db.close()
-        return True
-    db.close()
+async def remove_admin(user_id: int) -> bool:
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).where(User.telegram_id == user_id))
+        if user:
+            user.is_admin = False
+            await db.commit()
+            return True
     return False
@@ -1,23 +1,23 @@
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.filters import Command
+from sqlalchemy import func, select
 from sqlalchemy.orm import joinedload
 from admin.auth import is_admin
-from database.models import SessionLocal, Channel, RSSSource, Post, User
-import json
+from database.models import AsyncSessionLocal, Channel, RSSSource, Post, User
+from core.token_budget import usage_tracker
 
 admin_router = Router()
 
 
-def get_stats_text():
-    db = SessionLocal()
-    total_users = db.query(User).count()
-    total_channels = db.query(Channel).count()
-    active_channels = db.query(Channel).filter(Channel.is_active == True).count()
-    total_sources = db.query(RSSSource).count()
-    total_posts = db.query(Post).count()
-    pending_posts = db.query(Post).filter(Post.status == "pending").count()
-    db.close()
+async def get_stats_text():
+    async with AsyncSessionLocal() as db:
+        total_users = await db.scalar(select(func.count(User.id)))
+        total_channels = await db.scalar(select(func.count(Channel.id)))
+        active_channels = await db.scalar(select(func.count(Channel.id)).where(Channel.is_active == True))
+        total_sources = await db.scalar(select(func.count(RSSSource.id)))
+        total_posts = await db.scalar(select(func.count(Post.id)))
+        pending_posts = await db.scalar(select(func.count(Post.id)).where(Post.status == "pending"))
 
     return (
         f"<b>📊 Статистика системы:</b>\n\n"
@@ -30,16 +30,17 @@ def get_stats_text():
 
 @admin_router.message(Command("admin"))
 async def admin_panel(message: Message):
-    if not is_admin(message.from_user.id):
+    if not await is_admin(message.from_user.id):
         await message.answer("❌ У вас нет прав администратора")
         return
 
-    text = get_stats_text()
+    text = await get_stats_text()
 
     keyboard = [
         [InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh_stats")],
         [InlineKeyboardButton(text="📢 Все каналы", callback_data="all_channels")],
-        [InlineKeyboardButton(text="👥 Пользователи", callback_data="all_users")]
+        [InlineKeyboardButton(text="👥 Пользователи", callback_data="all_users")],
+        [InlineKeyboardButton(text="🤖 Расход AI", callback_data="ai_usage")]
     ]
 
     await message.answer(
@@ -51,11 +52,11 @@ async def admin_panel(message: Message):
 
 @admin_router.callback_query(F.data == "refresh_stats")
 async def refresh_stats_callback(callback: CallbackQuery):
-    if not is_admin(callback.from_user.id):
+    if not await is_admin(callback.from_user.id):
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
 
-    text = get_stats_text()
+    text = await get_stats_text()
 
     try:
         await callback.message.edit_text(
@@ -70,13 +71,12 @@ async def refresh_stats_callback(callback: CallbackQuery):
 
 @admin_router.callback_query(F.data == "all_channels")
 async def show_all_channels(callback: CallbackQuery):
-    if not is_admin(callback.from_user.id):
+    if not await is_admin(callback.from_user.id):
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
 
-    db = SessionLocal()
-    channels = db.query(Channel).options(joinedload(Channel.owner)).all()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        channels = (await db.scalars(select(Channel).options(joinedload(Channel.owner)))).all()
 
     if not channels:
         await callback.message.edit_text("В системе нет ни одного канала.")
@@ -91,3 +91,28 @@ async def show_all_channels(callback: CallbackQuery):
         text += f"   - Тема: {channel.topic}\n\n"
 
     await callback.message.edit_text(text, parse_mode="HTML")
+
+
+@admin_router.callback_query(F.data == "ai_usage")
+async def show_ai_usage(callback: CallbackQuery):
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+
+    stats = usage_tracker.snapshot()
+    if not stats:
+        await callback.answer("С момента запуска запросов к AI не было.", show_alert=True)
+        return
+
+    async with AsyncSessionLocal() as db:
+        names = dict((await db.execute(select(Channel.id, Channel.channel_name))).all())
+
+    text = "<b>🤖 Расход AI с момента запуска:</b>\n\n"
+    for key, item in sorted(stats.items(), key=lambda kv: kv[1]["cost"], reverse=True)[:20]:
+        name = names.get(int(key), key) if key.isdigit() else key
+        avg_latency = item["latency_total"] / item["calls"]
+        text += f"<b>{name}</b>: {item['calls']} запросов, ${item['cost']:.4f}\n"
+        text += f"   - Токены: {item['prompt_tokens']} вх. (из кэша {item['cached_tokens']}) / {item['completion_tokens']} вых.\n"
+        text += f"   - Задержка: средняя {avg_latency:.2f} сек, макс. {item['latency_max']:.2f} сек\n\n"
+
+    await callback.message.edit_text(text, parse_mode="HTML")
@@ -0,0 +1,70 @@
+"""Микробенчмарк core/formatter.py против прежнего форматирования из AIProcessor.
+
+    python benchmarks/bench_formatter.py               # сравнить скорость на корпусе
+    python benchmarks/bench_formatter.py --update-golden
+
+--update-golden пересобирает ожидаемые ответы tests/fixtures/formatter_corpus.json
+по прежней реализации (benchmarks/legacy_formatter.py).
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.legacy_formatter import legacy_format_fallback_post, legacy_format_plain_post, legacy_format_post
+from core.formatter import format_fallback_post, format_plain_post, format_post
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "tests", "fixtures", "formatter_corpus.json")
+
+
+def load_corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def update_golden(cases) -> None:
+    for case in cases:
+        case["expected_post"] = legacy_format_post(case["raw"], case["topic"], case["emoji"], case["hashtags"])
+        case["expected_plain"] = legacy_format_plain_post(case["raw"], case["emoji"], case["hashtags"])
+        case["expected_fallback"] = legacy_format_fallback_post(case["title"], case["raw"], case["emoji"],
+                                                                case["hashtags"])
+    with open(CORPUS, "w", encoding="utf-8") as f:
+        json.dump(cases, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+    print(f"Обновлено примеров: {len(cases)}")
+
+
+def run_all(post, plain, fallback, cases) -> None:
+    for case in cases:
+        post(case["raw"], case["topic"], case["emoji"], case["hashtags"])
+        plain(case["raw"], case["emoji"], case["hashtags"])
+        fallback(case["title"], case["raw"], case["emoji"], case["hashtags"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--update-golden", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = load_corpus()
+    if args.update_golden:
+        update_golden(cases)
+        return
+
+    results = {}
+    for name, funcs in [("legacy", (legacy_format_post, legacy_format_plain_post, legacy_format_fallback_post)),
+                        ("formatter", (format_post, format_plain_post, format_fallback_post))]:
+        best = min(timeit.repeat(lambda: run_all(*funcs, cases), repeat=args.repeat, number=args.number))
+        results[name] = best / (args.number * len(cases)) * 1e6
+        print(f"{name:>10}: {results[name]:.1f} мкс на пример")
+    print(f"ускорение: {results['legacy'] / results['formatter']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""CPU-время подготовки изображения: core.images.optimize_image против прежнего полного перекодирования.
+
+    python benchmarks/bench_images.py                 # синтетический набор
+    python benchmarks/bench_images.py --dir photos/   # свои файлы (jpg, png, webp)
+
+Время считается по time.process_time, то есть это CPU процесса, а не время ожидания.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from core.images import optimize_image
+
+
+def legacy_optimize_image(data: bytes) -> bytes:
+    """Publisher._optimize_image до user-035: всегда декодирует и перекодирует."""
+    try:
+        img = Image.open(io.BytesIO(data))
+        if img.mode in ("RGBA", "P"):
+            img = img.convert("RGB")
+        img.thumbnail((1280, 1280), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=85, optimize=True)
+        return out.getvalue()
+    except Exception:
+        return data
+
+
+def _photo_like(width: int, height: int, mode: str = "RGB") -> Image.Image:
+    # Градиент с шумом сжимается примерно как фотография, в отличие от однотонной заливки
+    rng = np.random.default_rng(width * height)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 18, base.shape), 0, 255).astype(np.uint8)
+    img = Image.fromarray(pixels, "RGB")
+    return img.convert(mode) if mode != "RGB" else img
+
+
+def _encode(img: Image.Image, fmt: str, **params) -> bytes:
+    out = io.BytesIO()
+    img.save(out, format=fmt, **params)
+    return out.getvalue()
+
+
+def synthetic_corpus():
+    return [
+        ("jpeg 800x600, уже подходит", _encode(_photo_like(800, 600), "JPEG", quality=80)),
+        ("jpeg 1280x960, уже подходит", _encode(_photo_like(1280, 960), "JPEG", quality=75)),
+        ("jpeg 4000x3000", _encode(_photo_like(4000, 3000), "JPEG", quality=85)),
+        ("jpeg 2400x1600", _encode(_photo_like(2400, 1600), "JPEG", quality=90)),
+        ("jpeg 1200x900, тяжелее лимита", _encode(_photo_like(1200, 900), "JPEG", quality=100)),
+        ("png 1600x1200 rgba", _encode(_photo_like(1600, 1200, "RGBA"), "PNG")),
+        ("png 900x600 palette", _encode(_photo_like(900, 600).quantize(256), "PNG")),
+        ("webp 1920x1080", _encode(_photo_like(1920, 1080), "WEBP", quality=80)),
+    ]
+
+
+def directory_corpus(path: str):
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+            with open(os.path.join(path, name), "rb") as f:
+                yield name, f.read()
+
+
+def cpu_ms(func, data: bytes, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.process_time()
+        func(data)
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", help="каталог с изображениями вместо синтетического набора")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = list(directory_corpus(args.dir)) if args.dir else synthetic_corpus()
+    total_legacy = total_new = 0.0
+    print(f"{'изображение':<32}{'размер':>10}{'прежний, мс':>14}{'новый, мс':>12}{'результат':>12}")
+    for name, data in corpus:
+        legacy = cpu_ms(legacy_optimize_image, data, args.repeat)
+        new = cpu_ms(optimize_image, data, args.repeat)
+        total_legacy += legacy
+        total_new += new
+        result = "как есть" if optimize_image(data) is data else f"{len(optimize_image(data)) // 1024} КБ"
+        print(f"{name:<32}{len(data) // 1024:>8} КБ{legacy:>14.1f}{new:>12.1f}{result:>12}")
+    count = len(corpus)
+    print(f"\nв среднем на изображение: прежний {total_legacy / count:.1f} мс, новый {total_new / count:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Запись постов (как при проверке RSS) одновременно с чтениями обработчиков: SQLite с профилем и без.
+
+    python benchmarks/bench_sqlite.py
+    python benchmarks/bench_sqlite.py --batches 100 --readers 8
+
+Каждый вариант запускается в отдельном процессе на своей временной базе: настройки
+(SQLITE_PERFORMANCE, DATABASE_URL) читаются при импорте config.settings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def _writer(channel_id: int, batches: int, batch_size: int, offset: int) -> None:
+    from database.crud import bulk_create_posts
+    from database.models import AsyncSessionLocal
+
+    for batch in range(batches):
+        entries = [{
+            "source_url": "http://bench", "title": f"Новость {offset}-{batch}-{i}", "content": "текст " * 40,
+            "processed": "<b>пост</b>", "media": [], "scheduled": datetime.utcnow() + timedelta(minutes=i),
+        } for i in range(batch_size)]
+        async with AsyncSessionLocal() as db:
+            await bulk_create_posts(db, channel_id, entries)
+
+
+async def _reader(channel_id: int, owner_id: int, stop: asyncio.Event, latencies: list) -> None:
+    from database.crud import get_channel_queue, get_user_channels
+    from database.models import AsyncSessionLocal
+
+    while not stop.is_set():
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            await get_user_channels(db, owner_id)
+            await get_channel_queue(db, channel_id)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0)
+
+
+async def _run(batches: int, batch_size: int, writers: int, readers: int) -> dict:
+    from database.crud import create_channel, get_or_create_user
+    from database.models import AsyncSessionLocal, async_engine
+
+    async with AsyncSessionLocal() as db:
+        user = await get_or_create_user(db, 1, "bench")
+        channel = await create_channel(db, user.id, "@bench", "bench", "Технологии")
+
+    stop = asyncio.Event()
+    latencies: list = []
+    reader_tasks = [asyncio.create_task(_reader(channel.id, user.id, stop, latencies)) for _ in range(readers)]
+    started = time.perf_counter()
+    await asyncio.gather(*(_writer(channel.id, batches, batch_size, n) for n in range(writers)))
+    write_seconds = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*reader_tasks)
+    await async_engine.dispose()
+
+    latencies = sorted(latencies) or [0.0]
+    return {
+        "posts_per_second": writers * batches * batch_size / write_seconds,
+        "reads": len(latencies) if readers else 0,
+        "read_p50_ms": latencies[len(latencies) // 2] * 1000,
+        "read_p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def _child(args) -> None:
+    sys.path.insert(0, ROOT)
+    result = asyncio.run(_run(args.batches, args.batch_size, args.writers, args.readers))
+    print(json.dumps(result))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args)
+        return
+
+    for profile in ("", "1"):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, SQLITE_PERFORMANCE=profile, GROQ_API_KEY=os.getenv("GROQ_API_KEY") or "bench",
+                       DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}")
+            output = subprocess.run([sys.executable, __file__, "--child"] + sys.argv[1:], env=env, cwd=directory,
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+        name = "с профилем" if profile else "по умолчанию"
+        print(f"{name:>13}: запись {result['posts_per_second']:.0f} постов/с, чтений {result['reads']}, "
+              f"p50 {result['read_p50_ms']:.1f} мс, p99 {result['read_p99_ms']:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
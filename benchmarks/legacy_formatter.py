@@ -0,0 +1,136 @@
+"""Форматирование поста в том виде, в каком оно было в AIProcessor до core/formatter.py.
+
+Эталон для сравнения: по нему собран tests/fixtures/formatter_corpus.json и с ним
+сравнивается скорость в bench_formatter.py. Код перенесён без изменений.
+"""
+import re
+from typing import List
+
+
+def legacy_format_post(raw_text: str, topic: str, emoji: str, hashtags: List[str]) -> str:
+    text = raw_text.strip()
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+
+    title = ""
+    content_lines = []
+
+    if lines:
+        first_line = lines[0]
+        first_line = re.sub(r'^[#\*]+\s*', '', first_line)
+        first_line = re.sub(r'[\*#_]+$', '', first_line)
+
+        if '<b>' in first_line and '</b>' in first_line:
+            title_match = re.search(r'<b>(.*?)</b>', first_line)
+            if title_match:
+                title = title_match.group(1).strip()
+        else:
+            title = first_line
+
+        title = re.sub(r'^[^\wа-яА-ЯёЁ]+', '', title)
+        title = re.sub(r'[^\wа-яА-ЯёЁ\s.,!?;:()\-\"\'—–-]+$', '', title)
+        content_lines = lines[1:]
+
+    if not title and content_lines:
+        for i, line in enumerate(content_lines):
+            if len(line) < 100 and (
+                    line.endswith('.') or line.endswith('!') or line.endswith('?') or len(line) < 50):
+                title = line
+                content_lines = content_lines[i + 1:]
+                break
+
+    if not title:
+        first_sentence = re.split(r'[.!?]', text)[0].strip()
+        if len(first_sentence) > 20 and len(first_sentence) < 100:
+            title = first_sentence + ("" if first_sentence.endswith(("?", "!", ".")) else ".")
+        else:
+            title = "Новости по теме: " + topic
+
+    content = "\n".join(content_lines).strip()
+
+    paragraphs = []
+    raw_paragraphs = re.split(r'\n{2,}', content)
+
+    if len(raw_paragraphs) < 2:
+        sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', content) if s.strip()]
+        if sentences:
+            para_sentences = []
+            for sentence in sentences:
+                para_sentences.append(sentence)
+                if len(para_sentences) >= 2 or (len(para_sentences) == 1 and len(sentence) > 150):
+                    paragraphs.append(" ".join(para_sentences))
+                    para_sentences = []
+            if para_sentences:
+                paragraphs.append(" ".join(para_sentences))
+    else:
+        paragraphs = [p.strip() for p in raw_paragraphs if p.strip()]
+
+    paragraphs = paragraphs[:3]
+
+    clean_paragraphs = []
+    for para in paragraphs:
+        para = re.sub(r'^[\-\•\*]\s*', '', para)
+        para = re.sub(r'^\d+[\.\)]\s*', '', para)
+        para = re.sub(r'\s+', ' ', para).strip()
+        if para and len(para) > 30:
+            clean_paragraphs.append(para)
+
+    if not clean_paragraphs:
+        first_part = re.split(r'[.!?]', content)[0].strip()
+        if len(first_part) > 50:
+            clean_paragraphs.append(first_part + ".")
+        else:
+            clean_paragraphs.append(content[:300] + ("..." if len(content) > 300 else ""))
+
+    if not re.match(
+            r'^[\U0001F300-\U0001F6FF\U0001F900-\U0001F9FF\U0001FA00-\U0001FA6F\U0001FA70-\U0001FAFF\U00002702-\U000027B0]',
+            title):
+        title = f"{emoji} {title}"
+
+    final_post = f"<b>{title}</b>\n\n"
+    final_post += "\n\n".join(clean_paragraphs) + "\n\n"
+    final_post += " ".join(hashtags)
+
+    final_post = re.sub(r'\n{3,}', '\n\n', final_post)
+    final_post = re.sub(r' +', ' ', final_post)
+    return final_post.strip()
+
+
+def legacy_format_plain_post(raw_text: str, emoji: str, hashtags: List[str]) -> str:
+    clean_text = re.sub(r'\s+', ' ', raw_text.strip())
+    return f"<b>{emoji} Новость</b>\n\n{clean_text[:600]}...\n\n{' '.join(hashtags)}"
+
+
+def legacy_format_fallback_post(title: str, text: str, emoji: str, hashtags: List[str]) -> str:
+    paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
+
+    formatted_paragraphs = []
+    current_para = ""
+
+    for para in paragraphs:
+        if len(para) < 30:
+            current_para += para + " "
+        else:
+            if current_para:
+                formatted_paragraphs.append(current_para.strip())
+                current_para = ""
+            formatted_paragraphs.append(para)
+
+    if current_para:
+        formatted_paragraphs.append(current_para.strip())
+
+    description = "\n\n".join(formatted_paragraphs[:3])
+
+    if len(description) < 200:
+        sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
+        if len(sentences) > 3:
+            description = sentences[0] + " " + sentences[1] + "\n\n" + sentences[2]
+
+    if len(description) > 800:
+        description = description[:800] + "..."
+
+    clean_title = title.strip(' "\'')
+    return (
+        f"<b>{emoji} {clean_title}</b>\n\n"
+        f"{description}\n\n"
+        f"{' '.join(hashtags)}"
+    )
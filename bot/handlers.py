@@ -3,15 +3,20 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from sqlalchemy import select
 from bot.keyboards import Keyboards
 from database.crud import *
 from database import crud
-from database.models import SessionLocal, Channel, RSSSource, Post
+from database.models import AsyncSessionLocal, Channel, RSSSource
 from core.publisher import Publisher
+from core.publish_timer import publish_timer
+from core.catchup import CATCHUP_AGES, CATCHUP_MODES, catchup_policy
 from core.ai_processor import AIProcessor
-from config.settings import ADMIN_IDS
-from datetime import datetime, timedelta
-import random
+from core.relevance import rank_entries
+from core.entry_filter import get_filter_stats, parse_filter_rules, format_filter_rules
+from config.settings import ADMIN_IDS, RELEVANCE_HISTORY_SIZE
+from datetime import datetime
+import html
 
 router = Router()
 keyboards = Keyboards()
@@ -26,19 +31,18 @@ class ChannelStates(StatesGroup):
     waiting_ai_prompt = State()
     editing_post = State()
     waiting_manual_rss = State()
+    waiting_filters = State()
 
 
 @router.message(Command("start"))
 async def start_command(message: Message, state: FSMContext):
     await state.clear()
-    db = SessionLocal()
-    user = get_or_create_user(db, message.from_user.id, message.from_user.username)
+    async with AsyncSessionLocal() as db:
+        user = await get_or_create_user(db, message.from_user.id, message.from_user.username)
 
-    if message.from_user.id in ADMIN_IDS and not user.is_admin:
-        user.is_admin = True
-        db.commit()
-
-    db.close()
+        if message.from_user.id in ADMIN_IDS and not user.is_admin:
+            user.is_admin = True
+            await db.commit()
 
     await message.answer(
         "👋 Добро пожаловать в Channel Manager Bot!\n\n"
@@ -59,10 +63,9 @@ async def back_to_main_menu(callback: CallbackQuery, state: FSMContext):
 @router.message(Command("my_channels"))
 @router.callback_query(F.data == "my_channels")
 async def show_channels(event: Message | CallbackQuery):
-    db = SessionLocal()
-    user = get_or_create_user(db, event.from_user.id, event.from_user.username)
-    channels = get_user_channels(db, user.id)
-    db.close()
+    async with AsyncSessionLocal() as db:
+        user = await get_or_create_user(db, event.from_user.id, event.from_user.username)
+        channels = await get_user_channels(db, user.id)
 
     text = "У вас пока нет каналов. Хотите добавить первый?" if not channels else "📊 Ваши каналы:"
 
@@ -136,9 +139,8 @@ async def process_channel_id(message: Message, state: FSMContext, bot: Bot):
         return
 
     if channel_id:
-        db = SessionLocal()
-        existing_channel = db.query(Channel).filter(Channel.channel_id == channel_id).first()
-        db.close()
+        async with AsyncSessionLocal() as db:
+            existing_channel = await db.scalar(select(Channel.id).where(Channel.channel_id == channel_id))
         if existing_channel:
             await message.answer(
                 f"Канал '{channel_name}' уже добавлен в систему. Вы можете управлять им через меню /my_channels.")
@@ -154,14 +156,13 @@ async def process_channel_id(message: Message, state: FSMContext, bot: Bot):
 @router.message(StateFilter(ChannelStates.waiting_channel_topic))
 async def process_channel_topic(message: Message, state: FSMContext):
     data = await state.get_data()
-    db = SessionLocal()
-    user = get_or_create_user(db, message.from_user.id, message.from_user.username)
+    async with AsyncSessionLocal() as db:
+        user = await get_or_create_user(db, message.from_user.id, message.from_user.username)
 
-    channel = create_channel(
-        db, user.id, data['channel_id'],
-        data['channel_name'], message.text
-    )
-    db.close()
+        channel = await create_channel(
+            db, user.id, data['channel_id'],
+            data['channel_name'], message.text
+        )
 
     await state.clear()
 
@@ -177,9 +178,8 @@ async def channel_menu(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     channel_id = int(callback.data.split("_")[1])
 
-    db = SessionLocal()
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
 
     if not channel:
         await callback.answer("Канал не найден!", show_alert=True)
@@ -205,9 +205,8 @@ async def channel_menu(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("rss_"))
 async def rss_sources_menu(callback: CallbackQuery):
     channel_id = int(callback.data.split("_")[1])
-    db = SessionLocal()
-    sources = db.query(RSSSource).filter(RSSSource.channel_id == channel_id).all()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        sources = (await db.scalars(select(RSSSource).where(RSSSource.channel_id == channel_id))).all()
 
     text = "📰 У вас пока нет RSS-источников." if not sources else "📰 Ваши RSS-источники:"
     await callback.message.edit_text(
@@ -219,9 +218,8 @@ async def rss_sources_menu(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("source_"))
 async def source_menu(callback: CallbackQuery):
     source_id = int(callback.data.split("_")[1])
-    db = SessionLocal()
-    source = db.query(RSSSource).filter(RSSSource.id == source_id).first()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        source = await db.get(RSSSource, source_id)
 
     if not source:
         await callback.answer("Источник не найден!", show_alert=True)
@@ -250,16 +248,14 @@ async def source_menu(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("toggle_source_"))
 async def toggle_source_active(callback: CallbackQuery):
     source_id = int(callback.data.split("_")[2])
-    db = SessionLocal()
-    source = toggle_rss_source(db, source_id)
-    db.close()
+    async with AsyncSessionLocal() as db:
+        source = await toggle_rss_source(db, source_id)
 
     if source:
         status = "включен" if source.is_active else "отключен"
         await callback.answer(f"Источник {status}")
-        # Refresh меню источников
-        callback.data = f"rss_{source.channel_id}"
-        await rss_sources_menu(callback)
+        # Refresh меню источников; CallbackQuery неизменяем, поэтому меню получает копию с другим data
+        await rss_sources_menu(callback.model_copy(update={"data": f"rss_{source.channel_id}"}))
     else:
         await callback.answer("Ошибка при переключении!", show_alert=True)
 
@@ -267,9 +263,8 @@ async def toggle_source_active(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("delete_source_confirm_"))
 async def delete_source_confirm(callback: CallbackQuery):
     source_id = int(callback.data.split("_")[3])
-    db = SessionLocal()
-    source = db.query(RSSSource).filter(RSSSource.id == source_id).first()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        source = await db.get(RSSSource, source_id)
 
     if not source:
         await callback.answer("Источник не найден!", show_alert=True)
@@ -293,17 +288,15 @@ async def delete_source_confirm(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("confirm_delete_source_"))
 async def delete_source_execute(callback: CallbackQuery):
     source_id = int(callback.data.split("_")[3])
-    db = SessionLocal()
-    source = db.query(RSSSource).filter(RSSSource.id == source_id).first()
-    channel_id = source.channel_id if source else None
-    deleted = delete_rss_source(db, source_id)
-    db.close()
+    async with AsyncSessionLocal() as db:
+        source = await db.get(RSSSource, source_id)
+        channel_id = source.channel_id if source else None
+        deleted = await delete_rss_source(db, source_id)
 
     if deleted:
         await callback.answer("Источник успешно удален", show_alert=True)
         if channel_id:
-            callback.data = f"rss_{channel_id}"
-            await rss_sources_menu(callback)
+            await rss_sources_menu(callback.model_copy(update={"data": f"rss_{channel_id}"}))
     else:
         await callback.answer("Ошибка при удалении!", show_alert=True)
 
@@ -338,11 +331,10 @@ async def process_manual_rss(message: Message, state: FSMContext):
     feed = feedparser.parse(formatted_url)
 
     if feed.entries:
-        db = SessionLocal()
         title = feed.feed.get('title', formatted_url[:50])
-        add_rss_source(db, channel_id, formatted_url, title)
-        sources = db.query(RSSSource).filter_by(channel_id=channel_id).all()
-        db.close()
+        async with AsyncSessionLocal() as db:
+            await add_rss_source(db, channel_id, formatted_url, title)
+            sources = (await db.scalars(select(RSSSource).filter_by(channel_id=channel_id))).all()
 
         await message.answer(
             f"✅ RSS источник '{title}' успешно добавлен!",
@@ -356,22 +348,100 @@ async def process_manual_rss(message: Message, state: FSMContext):
     await state.clear()
 
 
+@router.callback_query(F.data.startswith("filters_"))
+async def filters_menu(callback: CallbackQuery):
+    channel_id = int(callback.data.split("_")[1])
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
+
+    if not channel:
+        await callback.answer("Канал не найден!", show_alert=True)
+        return
+
+    rules = (channel.settings or {}).get("filters")
+    rules_text = format_filter_rules(rules)
+    text = "<b>🧹 Фильтры записей</b>\n\n"
+    text += f"<pre>{html.escape(rules_text)}</pre>\n\n" if rules_text else "Фильтры не заданы.\n\n"
+
+    entry_filter = get_filter_stats(channel_id)
+    if entry_filter and entry_filter.stats["checked"]:
+        stats = entry_filter.stats
+        text += (
+            f"<b>С момента запуска:</b> проверено {stats['checked']}, пропущено {stats['passed']}, "
+            f"стоп-слова {stats['stop_word']}, без обязательных слов {stats['missing_required']}, "
+            f"шаблоны {stats['source_pattern']}\n"
+        )
+        for rule, hits in entry_filter.rule_hits.most_common(5):
+            text += f"   - {html.escape(rule)}: {hits}\n"
+
+    await callback.message.edit_text(
+        text,
+        reply_markup=keyboards.filters_menu(channel_id, bool(rules_text))
+    )
+
+
+@router.callback_query(F.data.startswith("edit_filters_"))
+async def edit_filters_start(callback: CallbackQuery, state: FSMContext):
+    channel_id = int(callback.data.split("_")[2])
+    await state.update_data(channel_id=channel_id)
+    await callback.message.edit_text(
+        "Отправьте правила фильтрации, по одному в строке:\n\n"
+        "• <code>-слово</code> — отбрасывать записи со стоп-словом\n"
+        "• <code>+слово</code> — брать только записи хотя бы с одним таким словом\n"
+        "• <code>habr.com: регулярное выражение</code> — отбрасывать записи источника по шаблону "
+        "(<code>*</code> — для всех источников)\n\n"
+        "Слова совпадают по началу слова: <code>-санкци</code> отбросит и «санкции», и «санкциями»."
+    )
+    await state.set_state(ChannelStates.waiting_filters)
+
+
+@router.message(StateFilter(ChannelStates.waiting_filters))
+async def process_filters(message: Message, state: FSMContext):
+    data = await state.get_data()
+    channel_id = data['channel_id']
+
+    try:
+        rules = parse_filter_rules(message.text or "")
+    except ValueError as e:
+        await message.answer(f"❌ {html.escape(str(e))}\nИсправьте правила и отправьте их снова.")
+        return
+
+    async with AsyncSessionLocal() as db:
+        await set_channel_setting(db, channel_id, "filters", rules)
+    await state.clear()
+
+    await message.answer(
+        f"✅ Фильтры сохранены: стоп-слов {len(rules['stop_words'])}, обязательных слов "
+        f"{len(rules['required_words'])}, шаблонов {sum(len(p) for p in rules['source_patterns'].values())}.",
+        reply_markup=keyboards.filters_menu(channel_id, True)
+    )
+
+
+@router.callback_query(F.data.startswith("reset_filters_"))
+async def reset_filters(callback: CallbackQuery):
+    channel_id = int(callback.data.split("_")[2])
+    async with AsyncSessionLocal() as db:
+        await set_channel_setting(db, channel_id, "filters", None)
+
+    await callback.answer("Фильтры сброшены")
+    # CallbackQuery неизменяем: меню перерисовывается копией с другим data
+    await filters_menu(callback.model_copy(update={"data": f"filters_{channel_id}"}))
+
+
 @router.callback_query(F.data.startswith("create_"))
 async def create_post_start(callback: CallbackQuery, bot: Bot):
     channel_id = int(callback.data.split("_")[1])
 
-    db = SessionLocal()
-    channel = db.query(Channel).filter_by(id=channel_id).first()
-    sources = db.query(RSSSource).filter_by(channel_id=channel_id, is_active=True).all()
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
+        sources = (await db.scalars(select(RSSSource).filter_by(channel_id=channel_id, is_active=True))).all()
 
     if not channel:
         await callback.answer("Канал не найден!", show_alert=True)
-        db.close()
         return
 
     if not sources:
         await callback.answer("Сначала добавьте RSS источники!", show_alert=True)
-        db.close()
         return
 
     msg = await callback.message.edit_text("⏳ Ищу свежие новости...")
@@ -382,7 +452,7 @@ async def create_post_start(callback: CallbackQuery, bot: Bot):
         publisher = Publisher(bot)
 
         parser = RSSParser()
-        async with parser:
+        async with parser, publisher:
             all_entries = []
             for source in sources:
                 entries = await parser.parse_feed(source.url)
@@ -391,18 +461,20 @@ async def create_post_start(callback: CallbackQuery, bot: Bot):
 
             if not all_entries:
                 await msg.edit_text("❌ Не найдено новых новостей в источниках.")
-                db.close()
                 return
 
             await msg.edit_text("🧠 Обрабатываю новость с помощью AI...")
-            entry = random.choice(all_entries)
+            async with AsyncSessionLocal() as db:
+                history = await get_recent_post_texts(db, channel_id, RELEVANCE_HISTORY_SIZE)
+                profile = await get_topic_profile(db, channel)
+            entry = rank_entries(all_entries, profile["topic"], history, top_n=1)[0]
 
             processed_content = await ai_processor.process_content(
                 entry,
                 {
+                    'channel_id': channel.id,
                     'ai_model': channel.ai_model,
-                    'ai_prompt': channel.ai_prompt,
-                    'topic': channel.topic
+                    'profile': profile
                 }
             )
 
@@ -412,18 +484,20 @@ async def create_post_start(callback: CallbackQuery, bot: Bot):
             message_id = await publisher.publish_post(
                 channel.channel_id,
                 processed_content,
-                media_urls
+                media_urls,
+                category=profile["category"]
             )
 
             if message_id:
-                new_post = create_post(
-                    db, channel_id, sources[0].url,
-                    entry['title'], entry['content'],
-                    processed_content, media_urls,
-                    datetime.utcnow()
-                )
-                if new_post:  # Проверяем, не дубль ли
-                    update_post_status(db, new_post.id, "published", message_id)
+                async with AsyncSessionLocal() as db:
+                    new_post = await create_post(
+                        db, channel_id, sources[0].url,
+                        entry['title'], entry['content'],
+                        processed_content, media_urls,
+                        datetime.utcnow()
+                    )
+                    if new_post:  # Проверяем, не дубль ли
+                        await update_post_status(db, new_post.id, "published", message_id)
                 await msg.edit_text(
                     "✅ Пост успешно опубликован!",
                     reply_markup=keyboards.channel_menu(channel_id)
@@ -434,16 +508,13 @@ async def create_post_start(callback: CallbackQuery, bot: Bot):
 
     except Exception as e:
         await msg.edit_text(f"❌ Произошла ошибка: {str(e)[:100]}")
-    finally:
-        db.close()
 
 
 @router.callback_query(F.data.startswith("queue_"))
 async def show_queue(callback: CallbackQuery):
     channel_id = int(callback.data.split("_")[1])
-    db = SessionLocal()
-    posts = get_channel_queue(db, channel_id)
-    db.close()
+    async with AsyncSessionLocal() as db:
+        posts = await get_channel_queue(db, channel_id)
 
     if not posts:
         await callback.message.edit_text(
@@ -462,9 +533,12 @@ async def show_queue(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("toggle_"))
 async def toggle_channel_active(callback: CallbackQuery, state: FSMContext):
     channel_id = int(callback.data.split("_")[1])
-    db = SessionLocal()
-    channel = crud.toggle_channel_active(db, channel_id)
-    db.close()
+    async with AsyncSessionLocal() as db:
+        channel = await crud.toggle_channel_active(db, channel_id)
+
+    if channel and channel.is_active:
+        # Посты, накопившиеся за время паузы, публикуются сразу, не дожидаясь полного прохода
+        publish_timer.schedule(channel_id, datetime.utcnow())
 
     if channel:
         status = "запущен" if channel.is_active else "поставлен на паузу"
@@ -475,17 +549,22 @@ async def toggle_channel_active(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("schedule_"))
 async def schedule_menu(callback: CallbackQuery):
     channel_id = int(callback.data.split("_")[1])
-    db = SessionLocal()
-    channel = db.query(Channel).filter_by(id=channel_id).first()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
     if not channel:
         await callback.answer("Канал не найден", show_alert=True)
         return
 
-    text = f"⏰ Текущий интервал между постами: ~{channel.post_interval // 60} минут.\n\nВыберите новый интервал:"
+    catchup_mode, max_age_hours = catchup_policy(channel.settings)
+    text = (
+        f"⏰ Текущий интервал между постами: ~{channel.post_interval // 60} минут.\n\n"
+        f"♻️ Посты, накопившиеся за время простоя: {CATCHUP_MODES[catchup_mode]}"
+        f"{f' (старше {max_age_hours} ч)' if catchup_mode == 'drop' else ''}.\n\n"
+        "Выберите новый интервал:"
+    )
     await callback.message.edit_text(
         text,
-        reply_markup=keyboards.schedule_menu(channel_id, channel.post_interval)
+        reply_markup=keyboards.schedule_menu(channel_id, channel.post_interval, catchup_mode, max_age_hours)
     )
 
 
@@ -499,22 +578,53 @@ async def set_schedule(callback: CallbackQuery):
         await callback.answer("Ошибка данных. Попробуйте снова.", show_alert=True)
         return
 
-    db = SessionLocal()
-    update_channel_settings(db, channel_id, post_interval=interval)
-    db.close()
+    async with AsyncSessionLocal() as db:
+        await update_channel_settings(db, channel_id, post_interval=interval)
 
     await callback.answer(f"Интервал изменен на ~{interval // 60} минут.", show_alert=True)
 
-    callback.data = f"schedule_{channel_id}"
-    await schedule_menu(callback)
+    await schedule_menu(callback.model_copy(update={"data": f"schedule_{channel_id}"}))
+
+
+@router.callback_query(F.data.startswith("catchup_mode_"))
+async def toggle_catchup_mode(callback: CallbackQuery):
+    channel_id = int(callback.data.split("_")[2])
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
+        if not channel:
+            return
+        mode, max_age_hours = catchup_policy(channel.settings)
+        modes = list(CATCHUP_MODES)
+        new_mode = modes[(modes.index(mode) + 1) % len(modes)]
+        await set_channel_setting(db, channel_id, "catchup", {"mode": new_mode, "max_age_hours": max_age_hours})
+
+    await callback.answer(f"После простоя: {CATCHUP_MODES[new_mode]}")
+    # CallbackQuery неизменяем: меню перерисовывается копией с другим data
+    await schedule_menu(callback.model_copy(update={"data": f"schedule_{channel_id}"}))
+
+
+@router.callback_query(F.data.startswith("catchup_age_"))
+async def toggle_catchup_age(callback: CallbackQuery):
+    channel_id = int(callback.data.split("_")[2])
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
+        if not channel:
+            return
+        mode, max_age_hours = catchup_policy(channel.settings)
+        ages = [age for age in CATCHUP_AGES if age > max_age_hours]
+        new_age = ages[0] if ages else CATCHUP_AGES[0]
+        await set_channel_setting(db, channel_id, "catchup", {"mode": mode, "max_age_hours": new_age})
+
+    await callback.answer(f"Отбрасывать посты старше {new_age} ч")
+    # CallbackQuery неизменяем: меню перерисовывается копией с другим data
+    await schedule_menu(callback.model_copy(update={"data": f"schedule_{channel_id}"}))
 
 
 @router.callback_query(F.data.startswith("delete_"))
 async def delete_channel_confirm(callback: CallbackQuery):
     channel_id = int(callback.data.split("_")[1])
-    db = SessionLocal()
-    channel = db.query(Channel).filter_by(id=channel_id).first()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
     if not channel:
         await callback.answer("Канал не найден", show_alert=True)
         return
@@ -528,9 +638,8 @@ async def delete_channel_confirm(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("confirm_delete_"))
 async def delete_channel_execute(callback: CallbackQuery):
     channel_id = int(callback.data.split("_")[2])
-    db = SessionLocal()
-    delete_channel(db, channel_id)
-    db.close()
+    async with AsyncSessionLocal() as db:
+        await delete_channel(db, channel_id)
 
     await callback.answer("Канал успешно удален", show_alert=True)
     await show_channels(callback)
@@ -539,32 +648,33 @@ async def delete_channel_execute(callback: CallbackQuery):
 @router.callback_query(F.data.regexp(r"^ai_\d+$"))
 async def ai_settings_menu(callback: CallbackQuery):
     channel_id = int(callback.data.split("_")[1])
-    db = SessionLocal()
-    channel = db.query(Channel).filter_by(id=channel_id).first()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
 
     if not channel:
         await callback.answer("Канал не найден!", show_alert=True)
         return
 
+    compact_prompt = bool((channel.settings or {}).get("compact_prompt"))
+    prompt_tokens = (channel.topic_profile or {}).get("system_prompt_tokens")
     text = (
         f"<b>Настройки AI для канала «{channel.channel_name}»</b>\n\n"
         f"<b>Текущая модель:</b> <code>{channel.ai_model}</code>\n"
-        f"<b>Режим модерации:</b> {'Включен' if channel.moderation_mode else 'Выключен'}\n\n"
+        f"<b>Режим модерации:</b> {'Включен' if channel.moderation_mode else 'Выключен'}\n"
+        f"<b>Системный промпт:</b> ~{prompt_tokens or '?'} токенов{' (компактный)' if compact_prompt else ''}\n\n"
         "Здесь вы можете изменить модель, которая будет обрабатывать тексты, или отредактировать системный промпт."
     )
     await callback.message.edit_text(
         text,
-        reply_markup=keyboards.ai_settings_menu(channel_id, channel.moderation_mode)
+        reply_markup=keyboards.ai_settings_menu(channel_id, channel.moderation_mode, compact_prompt)
     )
 
 
 @router.callback_query(F.data.startswith("ai_model_"))
 async def choose_ai_model(callback: CallbackQuery):
     channel_id = int(callback.data.split("_")[2])
-    db = SessionLocal()
-    channel = db.query(Channel).filter_by(id=channel_id).first()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
 
     if not channel:
         await callback.answer("Канал не найден!", show_alert=True)
@@ -579,9 +689,8 @@ async def choose_ai_model(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("ai_prompt_"))
 async def ai_prompt_change_start(callback: CallbackQuery, state: FSMContext):
     channel_id = int(callback.data.split("_")[2])
-    db = SessionLocal()
-    channel = db.query(Channel).filter_by(id=channel_id).first()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
 
     if not channel:
         await callback.answer("Канал не найден!", show_alert=True)
@@ -602,17 +711,12 @@ async def process_ai_prompt(message: Message, state: FSMContext):
     data = await state.get_data()
     channel_id = data['channel_id']
 
-    db = SessionLocal()
-    update_channel_settings(db, channel_id, ai_prompt=message.text)
-    channel = db.query(Channel).filter_by(id=channel_id).first()
-    db.close()
+    async with AsyncSessionLocal() as db:
+        await update_channel_settings(db, channel_id, ai_prompt=message.text)
 
     await message.answer("✅ Системный промпт успешно обновлен!")
     await state.clear()
 
-    from aiogram.types.user import User
-    from aiogram.types.chat import Chat
-
     callback_to_return = CallbackQuery(
         id="return_to_ai_menu",
         from_user=message.from_user,
@@ -629,23 +733,39 @@ async def set_ai_model(callback: CallbackQuery):
     channel_id = int(parts[2])
     model = "-".join(parts[3:])
 
-    db = SessionLocal()
-    update_channel_settings(db, channel_id, ai_model=model)
-    db.close()
+    async with AsyncSessionLocal() as db:
+        await update_channel_settings(db, channel_id, ai_model=model)
 
     await callback.answer(f"Модель изменена на {model}", show_alert=True)
     await ai_settings_menu(callback)
 
 
+@router.callback_query(F.data.startswith("compact_prompt_"))
+async def toggle_compact_prompt(callback: CallbackQuery):
+    channel_id = int(callback.data.split("_")[2])
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
+        if not channel:
+            return
+        new_mode = not (channel.settings or {}).get("compact_prompt")
+        await set_channel_setting(db, channel_id, "compact_prompt", new_mode)
+
+    mode_text = "включен" if new_mode else "выключен"
+    await callback.answer(f"Компактный промпт {mode_text}")
+    # CallbackQuery неизменяем: меню перерисовывается копией с другим data
+    await ai_settings_menu(callback.model_copy(update={"data": f"ai_{channel_id}"}))
+
+
 @router.callback_query(F.data.startswith("moderation_"))
 async def toggle_moderation(callback: CallbackQuery):
     channel_id = int(callback.data.split("_")[1])
-    db = SessionLocal()
-    channel = db.query(Channel).filter_by(id=channel_id).first()
-    if channel:
+    async with AsyncSessionLocal() as db:
+        channel = await db.get(Channel, channel_id)
+        if not channel:
+            return
         new_mode = not channel.moderation_mode
-        update_channel_settings(db, channel_id, moderation_mode=new_mode)
-        mode_text = "включен" if new_mode else "выключен"
-        await callback.answer(f"Режим модерации {mode_text}")
-        await ai_settings_menu(callback)
-    db.close()
\ No newline at end of file
+        await update_channel_settings(db, channel_id, moderation_mode=new_mode)
+
+    mode_text = "включен" if new_mode else "выключен"
+    await callback.answer(f"Режим модерации {mode_text}")
+    await ai_settings_menu(callback)
\ No newline at end of file
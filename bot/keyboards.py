@@ -1,6 +1,7 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from typing import List, Optional
 from database.models import Post, RSSSource
+from core.catchup import CATCHUP_MODES
 
 
 
@@ -18,6 +19,7 @@ class Keyboards:
         keyboard = [
             [InlineKeyboardButton(text="📝 Очередь постов", callback_data=f"queue_{channel_id}")],
             [InlineKeyboardButton(text="📰 RSS источники", callback_data=f"rss_{channel_id}")],
+            [InlineKeyboardButton(text="🧹 Фильтры", callback_data=f"filters_{channel_id}")],
             [InlineKeyboardButton(text="🤖 Настройки AI", callback_data=f"ai_{channel_id}")],
             [InlineKeyboardButton(text="⏰ Расписание", callback_data=f"schedule_{channel_id}")],
             [InlineKeyboardButton(text="✍️ Создать пост", callback_data=f"create_{channel_id}")],
@@ -47,7 +49,15 @@ class Keyboards:
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
     @staticmethod
-    def schedule_menu(channel_id: int, current_interval: int):
+    def filters_menu(channel_id: int, has_rules: bool):
+        keyboard = [[InlineKeyboardButton(text="✏️ Изменить фильтры", callback_data=f"edit_filters_{channel_id}")]]
+        if has_rules:
+            keyboard.append([InlineKeyboardButton(text="🗑️ Сбросить фильтры", callback_data=f"reset_filters_{channel_id}")])
+        keyboard.append([InlineKeyboardButton(text="◀️ Назад", callback_data=f"channel_{channel_id}")])
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+    @staticmethod
+    def schedule_menu(channel_id: int, current_interval: int, catchup_mode: str = "spread", max_age_hours: int = 24):
         intervals = {
             "30 минут": 1800,
             "1 час": 3600,
@@ -70,6 +80,16 @@ class Keyboards:
         if row:
             keyboard.append(row)
 
+        keyboard.append([InlineKeyboardButton(
+            text=f"♻️ После простоя: {CATCHUP_MODES[catchup_mode]}",
+            callback_data=f"catchup_mode_{channel_id}"
+        )])
+        if catchup_mode == "drop":
+            keyboard.append([InlineKeyboardButton(
+                text=f"⌛ Отбрасывать старше {max_age_hours} ч",
+                callback_data=f"catchup_age_{channel_id}"
+            )])
+
         keyboard.append([InlineKeyboardButton(text="◀️ Назад", callback_data=f"channel_{channel_id}")])
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
@@ -108,11 +128,13 @@ class Keyboards:
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
     @staticmethod
-    def ai_settings_menu(channel_id: int, moderation_on: bool):
+    def ai_settings_menu(channel_id: int, moderation_on: bool, compact_prompt: bool = False):
         moderation_text = "Выключить модерацию 🟢" if moderation_on else "Включить модерацию 🔴"
+        compact_text = "📉 Компактный промпт: вкл" if compact_prompt else "📉 Компактный промпт: выкл"
         keyboard = [
             [InlineKeyboardButton(text="🤖 Изменить модель AI", callback_data=f"ai_model_{channel_id}")],
             [InlineKeyboardButton(text="📝 Изменить промпт", callback_data=f"ai_prompt_{channel_id}")],
+            [InlineKeyboardButton(text=compact_text, callback_data=f"compact_prompt_{channel_id}")],
             [InlineKeyboardButton(text=moderation_text, callback_data=f"moderation_{channel_id}")],
             [InlineKeyboardButton(text="◀️ Назад", callback_data=f"channel_{channel_id}")]
         ]
@@ -1,9 +1,20 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///bot.db")
+# Пул соединений (для PostgreSQL/MySQL, а для SQLite — только с SQLITE_PERFORMANCE)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Профиль производительности SQLite: WAL (чтение не ждёт записи), synchronous=NORMAL (fsync только
+# на контрольных точках WAL), mmap и увеличенный кэш страниц, пул соединений; включается явно
+SQLITE_PERFORMANCE = os.getenv("SQLITE_PERFORMANCE", "").lower() in ("1", "true", "yes")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_MB", "256")) * 1024 * 1024
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_MB", "64")) * 1024
 ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x]
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
@@ -20,4 +31,79 @@ GROQ_MODELS = [
     "mistral-saba-24b",
     "meta-llama/llama-4-scout-17b-16e-instruct"
 ]
-DEFAULT_AI_MODEL = "llama-3.1-8b-instant"
\ No newline at end of file
+DEFAULT_AI_MODEL = "llama-3.1-8b-instant"
+
+# Цены Groq в долларах за 1M токенов: (вход, выход)
+GROQ_MODEL_PRICES = {
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "qwen/qwen3-32b": (0.29, 0.59),
+    "mistral-saba-24b": (0.79, 0.79),
+    "meta-llama/llama-4-scout-17b-16e-instruct": (0.11, 0.34)
+}
+# Сколько токенов исходного текста новости отправлять в модель
+AI_CONTENT_TOKEN_BUDGET = int(os.getenv("AI_CONTENT_TOKEN_BUDGET", "350"))
+
+# После стольких неудачных вызовов подряд LLM считается недоступной на LLM_CIRCUIT_COOLDOWN секунд
+LLM_FAILURE_THRESHOLD = int(os.getenv("LLM_FAILURE_THRESHOLD", "3"))
+LLM_CIRCUIT_COOLDOWN = int(os.getenv("LLM_CIRCUIT_COOLDOWN", "300"))
+
+# Сколько самых релевантных новых записей канала за проверку отправлять в AI
+MAX_AI_ENTRIES_PER_CHANNEL = int(os.getenv("MAX_AI_ENTRIES_PER_CHANNEL", "3"))
+# Сколько последних опубликованных постов учитывать в профиле релевантности
+RELEVANCE_HISTORY_SIZE = 50
+
+# Кэш подготовленных изображений на диске
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_MB", "500")) * 1024 * 1024
+
+# Пул для обработки изображений Pillow: "thread" или "process"
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_EXECUTOR = os.getenv("IMAGE_EXECUTOR", "thread")
+# JPEG не больше 1280px и не тяжелее этого размера отправляются без перекодирования
+IMAGE_PASSTHROUGH_MAX_BYTES = int(os.getenv("IMAGE_PASSTHROUGH_MAX_KB", "1024")) * 1024
+
+# Свои заглушки по категориям темы: <категория>.jpg (tech, news, business, ...); без них рисуется градиент
+PLACEHOLDER_DIR = os.getenv("PLACEHOLDER_DIR", "assets/placeholders")
+
+# Сколько изображений может скачиваться одновременно (ограничивает память на буферы)
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "8"))
+
+# Лимиты Telegram: всего сообщений в секунду и минимальный интервал между сообщениями в один чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "3"))
+# RetryAfter дольше этого (в секундах) не ждём, а считаем отправку неудачной
+TELEGRAM_MAX_RETRY_AFTER = int(os.getenv("TELEGRAM_MAX_RETRY_AFTER", "60"))
+# Сколько каналов публикуются одновременно
+PUBLISH_CONCURRENCY = int(os.getenv("PUBLISH_CONCURRENCY", "10"))
+
+# Как часто (в секундах) делать полный проход по наступившим постам в дополнение к таймеру публикаций
+PUBLISH_RECONCILE_INTERVAL = int(os.getenv("PUBLISH_RECONCILE_INTERVAL", "600"))
+
+# Идентификатор процесса для аренды источников и постов, когда запущено несколько экземпляров бота
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Срок аренды в секундах; пока работа идёт, аренда продлевается каждую треть срока
+LEASE_TTL = int(os.getenv("LEASE_TTL", "300"))
+# Сколько источников воркер захватывает за раз
+SOURCE_CLAIM_BATCH = int(os.getenv("SOURCE_CLAIM_BATCH", "50"))
+
+# Конвейер обработки RSS: число воркеров на стадиях и ёмкость очередей между ними
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+PARSE_CONCURRENCY = int(os.getenv("PARSE_CONCURRENCY", "2"))
+AI_CONCURRENCY = int(os.getenv("AI_CONCURRENCY", "2"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "100"))
+
+# Эндпоинт /metrics для Prometheus; 0 — не поднимать
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Политика для постов, накопившихся за время простоя: spread, drop или digest (настраивается для каждого канала)
+CATCHUP_DEFAULT_MODE = os.getenv("CATCHUP_DEFAULT_MODE", "spread")
+# В режиме drop посты, опоздавшие больше чем на столько часов, не публикуются
+CATCHUP_MAX_AGE_HOURS = int(os.getenv("CATCHUP_MAX_AGE_HOURS", "24"))
+
+# Повторы публикации после временных ошибок Telegram/сети: задержка PUBLISH_RETRY_BASE * 2^попытка,
+# не больше PUBLISH_RETRY_MAX_DELAY секунд; после PUBLISH_MAX_RETRIES попыток пост считается неудачным
+PUBLISH_MAX_RETRIES = int(os.getenv("PUBLISH_MAX_RETRIES", "5"))
+PUBLISH_RETRY_BASE = int(os.getenv("PUBLISH_RETRY_BASE", "60"))
+PUBLISH_RETRY_MAX_DELAY = int(os.getenv("PUBLISH_RETRY_MAX_DELAY", "3600"))
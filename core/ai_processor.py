@@ -1,13 +1,19 @@
 import asyncio
-import random
 import re
 import logging
+import time
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from urllib.parse import urlparse
 from groq import Groq, GroqError
-from config.settings import GROQ_API_KEY, DEFAULT_AI_MODEL, GROQ_MODELS
+from config.settings import (GROQ_API_KEY, DEFAULT_AI_MODEL, GROQ_MODELS, AI_CONTENT_TOKEN_BUDGET,
+                             LLM_FAILURE_THRESHOLD, LLM_CIRCUIT_COOLDOWN)
 from utils.helpers import sanitize_html, clean_rss_content
+from core.formatter import format_post, format_plain_post, format_fallback_post
+from core.topic_profile import DEFAULT_PROMPT, build_topic_profile, pick_emoji, pick_hashtags
+from core.token_budget import estimate_tokens, trim_to_token_budget, usage_tracker
+from core.summarizer import summarize
+from core.metrics import GROQ_REQUEST_SECONDS, GROQ_REQUESTS_TOTAL, GROQ_TOKENS_TOTAL
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +39,39 @@ def md_to_html(text: str) -> str:
     return html
 
 
+class LLMUnavailableError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Размыкается после серии неудачных вызовов LLM и не пускает запросы до конца паузы."""
+
+    def __init__(self, failure_threshold: int, cooldown: int):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._open_until = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._open_until = 0.0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._failures >= self.failure_threshold and not self.is_open:
+            self._open_until = time.monotonic() + self.cooldown
+            logger.warning(
+                f"LLM недоступна ({self._failures} ошибок подряд), переходим в офлайн-режим на {self.cooldown} сек")
+
+
+# Общий для всех экземпляров AIProcessor: состояние провайдера не зависит от того, кто его вызывает
+llm_circuit = CircuitBreaker(LLM_FAILURE_THRESHOLD, LLM_CIRCUIT_COOLDOWN)
+
+
 class AIProcessor:
 
 
@@ -46,19 +85,15 @@ class AIProcessor:
             raise ValueError("GROQ_API_KEY is required")
 
         self.client = Groq(api_key=GROQ_API_KEY)
-        self.emojis = {
-            "tech": ["💻", "🚀", "🔧", "⚡", "🌐", "📱", "🤖"],
-            "news": ["📰", "🗞️", "🔥", "⚠️", "💡", "✨", "🎯"],
-            "business": ["💼", "📈", "💰", "🏢", "📊", "🤝", "💵"],
-            "entertainment": ["🎬", "🎭", "🎪", "🎨", "🎤", "🎧", "🌟"],
-            "sports": ["⚽", "🏀", "🎾", "🏃", "🏊", "🏋️", "🏆"],
-            "politics": ["🏛️", "⚖️", "🌍", "🤝", "📜", "🗳️", "🎖️"],
-            "science": ["🔬", "🔭", "🧪", "🧠", "🧬", "🌱", "⚙️"]
-        }
         logger.info(f"AIProcessor инициализирован. Модель по умолчанию: {self.SAFE_MODEL}")
 
     async def process_content(self, entry: Dict, ch_settings: Dict) -> str:
 
+        profile = self._profile_for(ch_settings)
+        usage_key = str(ch_settings.get("channel_id") or "")
+        if llm_circuit.is_open:
+            logger.info("LLM недоступна, пост собирается локально")
+            return self._offline_format(entry, profile)
         try:
             model = ch_settings.get("ai_model") or self.SAFE_MODEL
             if model not in self.SUPPORTED_MODELS:
@@ -67,34 +102,35 @@ class AIProcessor:
                 logger.info(f"Используем модель по умолчанию: {self.SAFE_MODEL}")
                 model = self.SAFE_MODEL
 
-            topic = ch_settings.get("topic", "новости")
-            sys_prompt = (ch_settings.get("ai_prompt") or self._default_prompt().format(topic=topic))
+            topic = profile["topic"]
+            sys_prompt = profile["system_prompt"]
 
 
-            clean_content = clean_rss_content(entry['content'])
-            user_prompt = f"Переработай эту новость в пост для Telegram (700-900 символов): Title: {entry['title']}. Content: {clean_content[:700]}"
+            clean_content = trim_to_token_budget(clean_rss_content(entry['content']), AI_CONTENT_TOKEN_BUDGET)
+            # Неизменная часть запроса идёт первой, чтобы префикс совпадал между постами
+            user_prompt = f"Переработай эту новость в пост для Telegram (700-900 символов): Title: {entry['title']}. Content: {clean_content}"
 
             logger.info(f"Запрос к Groq API для обработки контента. Модель: {model}, Тема: {topic}")
             logger.debug(f"System prompt (первые 100 символов): {sys_prompt[:100]}...")
             logger.debug(f"User prompt (первые 100 символов): {user_prompt[:100]}...")
 
-            raw_response = await self._call_groq(model, sys_prompt, user_prompt)
+            raw_response = await self._call_groq(model, sys_prompt, user_prompt, usage_key=usage_key)
 
 
             if not raw_response or len(raw_response.strip()) < 100:
                 logger.warning(
                     f"Получен короткий ответ от Groq ({len(raw_response.strip())} символов), используем улучшенный fallback")
-                return await self._enhanced_fallback_format(entry, topic)
+                return await self._enhanced_fallback_format(entry, profile, usage_key)
 
 
             if any(prompt_word in raw_response.lower() for prompt_word in
                    ["system:", "user:", "assistant:", "instruct", "you are", "твоя задача", "правила:", "пример:",
                     "формат:"]):
                 logger.warning("В ответе обнаружены признаки промпта, используем улучшенный fallback")
-                return await self._enhanced_fallback_format(entry, topic)
+                return await self._enhanced_fallback_format(entry, profile, usage_key)
 
 
-            final_post = self._guaranteed_formatting(raw_response, topic)
+            final_post = self._guaranteed_formatting(raw_response, profile)
             logger.info(f"Успешно обработан контент для поста. Длина: {len(final_post)} символов")
             logger.debug(f"Финальный пост: {final_post}")
             return final_post[:1500]  # Увеличенное ограничение длины
@@ -102,9 +138,9 @@ class AIProcessor:
         except Exception as e:
             logger.error(f"Ошибка при обработке контента: {str(e)}", exc_info=True)
             logger.info("Используем улучшенное fallback форматирование")
-            return await self._enhanced_fallback_format(entry, topic)
+            return await self._enhanced_fallback_format(entry, profile, usage_key)
 
-    async def simple_translate(self, text: str) -> str:
+    async def simple_translate(self, text: str, usage_key: Optional[str] = None) -> str:
 
         try:
             if not text or len(text.strip()) < 3:
@@ -114,44 +150,63 @@ class AIProcessor:
             response = await self._call_groq(
                 self.SAFE_MODEL,
                 "You are a professional translator. Translate the text to Russian accurately and naturally. Keep company names and product names untranslated. Return ONLY the translated text without any additional comments.",
-                f"Translate to Russian: {text[:500]}"
+                f"Translate to Russian: {text[:500]}",
+                usage_key=usage_key
             )
             return response.strip() if response else text
         except Exception as e:
             logger.error(f"Ошибка при переводе: {str(e)}", exc_info=True)
             return text
 
-    async def _call_groq(self, model: str, system_prompt: str, user_prompt: str, max_retries: int = 3) -> str:
+    async def _call_groq(self, model: str, system_prompt: str, user_prompt: str, max_retries: int = 3,
+                         usage_key: Optional[str] = None) -> str:
+
+        if llm_circuit.is_open:
+            raise LLMUnavailableError("LLM circuit is open")
 
         retry_delay = 1  # секунд
+        estimated_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
 
         for attempt in range(max_retries):
             try:
                 logger.debug(f"Попытка {attempt + 1}/{max_retries} вызова Groq API с моделью {model}")
 
                 loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(None, lambda: self.client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.4,
-                    max_tokens=1200,
-                    top_p=0.9,
-                    timeout=45
-                ))
+                started = time.monotonic()
+                try:
+                    response = await loop.run_in_executor(None, lambda: self.client.chat.completions.create(
+                        model=model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        temperature=0.4,
+                        max_tokens=1200,
+                        top_p=0.9,
+                        timeout=45
+                    ))
+                finally:
+                    GROQ_REQUEST_SECONDS.observe(time.monotonic() - started, model=model)
 
                 if not response or not response.choices:
                     raise ValueError("Пустой ответ от Groq API")
 
+                usage_tracker.record(usage_key, model, time.monotonic() - started, estimated_tokens,
+                                     getattr(response, "usage", None))
                 result = response.choices[0].message.content.strip()
+                llm_circuit.record_success()
+                GROQ_REQUESTS_TOTAL.inc(model=model, result="ok")
+                usage = getattr(response, "usage", None)
+                if usage:
+                    GROQ_TOKENS_TOTAL.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+                    GROQ_TOKENS_TOTAL.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
                 logger.debug(f"Получен ответ от Groq (первые 200 символов): {result[:200]}...")
                 return result
 
             except GroqError as e:
                 error_msg = str(e)
                 logger.error(f"Groq API ошибка на попытке {attempt + 1}: {error_msg}")
+                GROQ_REQUESTS_TOTAL.inc(model=model, result="rate_limited" if "rate_limit" in error_msg.lower() else "error")
                 if "rate_limit" in error_msg.lower() and attempt < max_retries - 1:
                     logger.warning(f"Достигнут лимит запросов, ждем {retry_delay} секунд")
                     await asyncio.sleep(retry_delay)
@@ -162,74 +217,40 @@ class AIProcessor:
                     logger.warning(f"Модель {model} устарела, пробуем использовать {self.SAFE_MODEL}")
                     model = self.SAFE_MODEL
                     continue
+                llm_circuit.record_failure()
                 raise
             except Exception as e:
                 logger.error(f"Неожиданная ошибка на попытке {attempt + 1}: {str(e)}", exc_info=True)
+                GROQ_REQUESTS_TOTAL.inc(model=model, result="error")
                 if attempt < max_retries - 1:
                     await asyncio.sleep(retry_delay)
                     retry_delay *= 2
                     continue
+                llm_circuit.record_failure()
                 raise
 
+        llm_circuit.record_failure()
         logger.error("Все попытки вызова Groq API исчерпаны")
         raise Exception("Max retries exceeded for Groq API call")
 
-    async def _enhanced_fallback_format(self, entry: Dict, topic: str) -> str:
+    async def _enhanced_fallback_format(self, entry: Dict, profile: Dict, usage_key: Optional[str] = None) -> str:
+
+        if llm_circuit.is_open:
+            return self._offline_format(entry, profile)
 
         logger.info("Используется УЛУЧШЕННОЕ резервное форматирование контента")
         try:
 
-            title_ru = await self.simple_translate(entry['title'])
+            title_ru = await self.simple_translate(entry['title'], usage_key)
 
 
             clean_content = clean_rss_content(entry['content'])
-            cont_ru = await self.simple_translate(clean_content)
+            cont_ru = await self.simple_translate(clean_content, usage_key)
             cont_ru = cont_ru.replace("\\n", "\n").strip()
 
 
-            paragraphs = [p.strip() for p in cont_ru.split('\n') if p.strip()]
-
-
-            formatted_paragraphs = []
-            current_para = ""
-
-            for para in paragraphs:
-                if len(para) < 30:
-                    current_para += para + " "
-                else:
-                    if current_para:
-                        formatted_paragraphs.append(current_para.strip())
-                        current_para = ""
-                    formatted_paragraphs.append(para)
-
-            if current_para:
-                formatted_paragraphs.append(current_para.strip())
-
-
-            description_paragraphs = formatted_paragraphs[:3]
-            description = "\n\n".join(description_paragraphs)
-
-
-            if len(description) < 200:
-
-                sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', cont_ru) if s.strip()]
-                if len(sentences) > 3:
-                    description = sentences[0] + " " + sentences[1] + "\n\n" + sentences[2]
-
-
-            if len(description) > 800:
-                description = description[:800] + "..."
-
-            emoji = random.choice(self._emojis_for(topic))
-            hashtags = " ".join(self._hashtags_for(topic))
-            clean_title = title_ru.strip(' "\'')
-
-
-            result = (
-                f"<b>{emoji} {clean_title}</b>\n\n"
-                f"{description}\n\n"
-                f"{hashtags}"
-            )
+            emoji = pick_emoji(profile)
+            result = format_fallback_post(title_ru, cont_ru, emoji, pick_hashtags(profile))
 
             logger.info(f"Улучшенное резервное форматирование завершено. Длина: {len(result)}")
             logger.debug(f"Резервный пост: {result}")
@@ -243,127 +264,25 @@ class AIProcessor:
                 f"#новости #аварийныйрежим"
             )
 
-    def _guaranteed_formatting(self, raw_text: str, topic: str) -> str:
-
-        try:
-            text = raw_text.strip()
-            logger.debug(
-                f"Начало гарантированного форматирования. Исходный текст (первые 200 символов): {text[:200]}...")
-
-
-            lines = [line.strip() for line in text.split('\n') if line.strip()]
-
-            title = ""
-            content_lines = []
-
-            if lines:
-
-                first_line = lines[0]
-
-
-                first_line = re.sub(r'^[#\*]+\s*', '', first_line)
-                first_line = re.sub(r'[\*#_]+$', '', first_line)
+    def _offline_format(self, entry: Dict, profile: Dict) -> str:
+        """Пост без обращения к сети: извлекающее резюме очищенного текста в обычной вёрстке."""
 
+        clean_content = clean_rss_content(entry.get('content', ''))
+        sentences = summarize(clean_content, max_sentences=3)
+        text = "\n".join(sentences) if sentences else clean_content
+        result = format_fallback_post(entry.get('title', 'Новость'), text, pick_emoji(profile), pick_hashtags(profile))
+        logger.info(f"Офлайн-форматирование завершено. Длина: {len(result)}")
+        return result[:1500]
 
-                if '<b>' in first_line and '</b>' in first_line:
-                    title_match = re.search(r'<b>(.*?)</b>', first_line)
-                    if title_match:
-                        title = title_match.group(1).strip()
-                else:
-                    title = first_line
-
-
-                title = re.sub(r'^[^\wа-яА-ЯёЁ]+', '', title)
-                title = re.sub(r'[^\wа-яА-ЯёЁ\s.,!?;:()\-\"\'—–-]+$', '', title)
-
-
-                content_lines = lines[1:]
-
-
-            if not title and content_lines:
-                for i, line in enumerate(content_lines):
-                    if len(line) < 100 and (
-                            line.endswith('.') or line.endswith('!') or line.endswith('?') or len(line) < 50):
-                        title = line
-                        content_lines = content_lines[i + 1:]
-                        break
-
-
-            if not title:
-                first_sentence = re.split(r'[.!?]', text)[0].strip()
-                if len(first_sentence) > 20 and len(first_sentence) < 100:
-                    title = first_sentence + ("" if first_sentence.endswith(("?", "!", ".")) else ".")
-                else:
-                    title = "Новости по теме: " + topic
-
-
-            content = "\n".join(content_lines).strip()
-
-            paragraphs = []
-
-
-            raw_paragraphs = re.split(r'\n{2,}', content)
-
-            if len(raw_paragraphs) < 2:
-
-                sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', content) if s.strip()]
-                if sentences:
-
-                    para_sentences = []
-                    for sentence in sentences:
-                        para_sentences.append(sentence)
-                        if len(para_sentences) >= 2 or (len(para_sentences) == 1 and len(sentence) > 150):
-                            paragraphs.append(" ".join(para_sentences))
-                            para_sentences = []
-                    if para_sentences:
-                        paragraphs.append(" ".join(para_sentences))
-            else:
-                paragraphs = [p.strip() for p in raw_paragraphs if p.strip()]
-
-
-            paragraphs = paragraphs[:3]
-
-
-            clean_paragraphs = []
-            for para in paragraphs:
-
-                para = re.sub(r'^[\-\•\*]\s*', '', para)
-
-                para = re.sub(r'^\d+[\.\)]\s*', '', para)
-
-                para = re.sub(r'\s+', ' ', para).strip()
-                if para and len(para) > 30:
-                    clean_paragraphs.append(para)
-
-
-            if not clean_paragraphs:
-                first_part = re.split(r'[.!?]', content)[0].strip()
-                if len(first_part) > 50:
-                    clean_paragraphs.append(first_part + ".")
-                else:
-                    clean_paragraphs.append(content[:300] + ("..." if len(content) > 300 else ""))
-
-
-            emoji = random.choice(self._emojis_for(topic))
-
-
-            if not re.match(
-                    r'^[\U0001F300-\U0001F6FF\U0001F900-\U0001F9FF\U0001FA00-\U0001FA6F\U0001FA70-\U0001FAFF\U00002702-\U000027B0]',
-                    title):
-                title = f"{emoji} {title}"
-
-
-            hashtags = " ".join(self._hashtags_for(topic))
-
-
-            final_post = f"<b>{title}</b>\n\n"
-            final_post += "\n\n".join(clean_paragraphs) + "\n\n"
-            final_post += hashtags
+    def _guaranteed_formatting(self, raw_text: str, profile: Dict) -> str:
 
+        emoji = pick_emoji(profile)
+        hashtags = pick_hashtags(profile)
+        try:
+            logger.debug(
+                f"Начало гарантированного форматирования. Исходный текст (первые 200 символов): {raw_text.strip()[:200]}...")
 
-            final_post = re.sub(r'\n{3,}', '\n\n', final_post)
-            final_post = re.sub(r' +', ' ', final_post)
-            final_post = final_post.strip()
+            final_post = format_post(raw_text, profile["topic"], emoji, hashtags)
 
             logger.info(f"Гарантированное форматирование завершено. Длина: {len(final_post)} символов")
             logger.debug(f"Отформатированный пост (первые 300 символов): {final_post[:300]}...")
@@ -372,88 +291,18 @@ class AIProcessor:
         except Exception as e:
             logger.error(f"Ошибка в гарантированном форматировании: {str(e)}", exc_info=True)
             logger.warning("Используем простое форматирование")
+            return format_plain_post(raw_text, emoji, hashtags)
+
+    @staticmethod
+    def _profile_for(ch_settings: Dict) -> Dict:
+        """Профиль канала, посчитанный заранее; для старых вызовов без профиля собираем на месте."""
 
-            emoji = random.choice(self._emojis_for(topic))
-            hashtags = " ".join(self._hashtags_for(topic))
-            clean_text = re.sub(r'\s+', ' ', raw_text.strip())
-            return f"<b>{emoji} Новость</b>\n\n{clean_text[:600]}...\n\n{hashtags}"
-
-    def _emojis_for(self, topic: str) -> List[str]:
-
-        t = topic.lower()
-        if any(w in t for w in
-               ("политик", "государств", "власть", "президент", "минист", "дипломат", "альянс", "союз")):
-            return self.emojis["politics"]
-        if any(w in t for w in ("развлечени", "кино", "музык", "звезд", "шоу", "юмор", "сатир")):
-            return self.emojis["entertainment"]
-        if any(w in t for w in ("спорт", "матч", "чемпион", "турнир", "игрок", "команда")):
-            return self.emojis["sports"]
-        if any(w in t for w in
-               ("it", "tech", "технолог", "программ", "код", "разработка", "робот", "наука", "исследован", "открыт")):
-            return self.emojis["science"]
-        if any(w in t for w in ("бизнес", "финанс", "экономик", "рынок", "маркет", "стартап", "компания", "корпораци")):
-            return self.emojis["business"]
-        return self.emojis["news"]
-
-    def _hashtags_for(self, topic: str) -> List[str]:
-
-        base = {
-            "политика": ["#политика", "#геополитика", "#международныеотношения"],
-            "россия": ["#россия", "#российскаяполитика", "#новостироссии"],
-            "сша": ["#сша", "#америка", "#внешняяполитика"],
-            "европа": ["#европа", "#евросоюз", "#европейскаяполитика"],
-            "украина": ["#украина", "#киев", "#киевскийрежим"],
-            "германия": ["#германия", "#берлин", "#немецкаяполитика"],
-            "польша": ["#польша", "#варшава", "#польскаяполитика"],
-            "военные": ["#армия", "#вооруженныесилы", "#оборона"],
-            "дипломатия": ["#дипломатия", "#переговоры", "#мирныепроцессы"],
-            "наука": ["#наука", "#технологии", "#инновации"],
-            "экономика": ["#экономика", "#финансы", "#бизнес"],
-            "культура": ["#культура", "#искусство", "#история"],
-            "спорт": ["#спорт", "#чемпионат", "#олимпиада"],
-            "здоровье": ["#здоровье", "#медицина", "#образжизни"]
-        }
-
-        t = topic.lower()
-        for k, tags in base.items():
-            if k in t:
-                return random.sample(tags, min(3, len(tags)))
-
-
-        clean_topic = re.sub(r'[^\w\s]', '', topic.lower()).strip()
-        clean_words = clean_topic.split()
-
-        hashtags = ["#новости"]
-
-        if clean_words:
-            main_word = clean_words[0]
-            if len(main_word) > 3 and len(main_word) < 15:
-                hashtags.append(f"#{main_word}")
-
-        if len(clean_words) > 1:
-            second_word = clean_words[1]
-            if len(second_word) > 3 and len(second_word) < 15 and second_word not in ["и", "в", "на", "с", "по"]:
-                hashtags.append(f"#{second_word}")
-
-        return hashtags[:3]
+        profile = ch_settings.get("profile")
+        if profile:
+            return profile
+        return build_topic_profile(ch_settings.get("topic"), ch_settings.get("ai_prompt"))
 
     @staticmethod
     def _default_prompt() -> str:
 
-        return (
-            "Ты — профессиональный редактор русскоязычного Telegram-канала. "
-            "Твоя задача — переработать новость в привлекательный пост для Telegram.\n\n"
-            "ИНСТРУКЦИИ ПО ФОРМАТИРОВАНИЮ (СТРОГО СЛЕДУЙ ЭТИМ ПРАВИЛАМ):\n"
-            "1. Создай ЗАГОЛОВОК: сделай его ЖИРНЫМ (<b>текст</b>), добавь 1 релевантный эмодзи в начало.\n"
-            "2. После заголовка добавь ОДИН ПУСТОЙ АБЗАЦ (два символа перевода строки).\n"
-            "3. Основной текст: 2-3 информативных абзаца с ОТСТУПАМИ МЕЖДУ НИМИ (два символа перевода строки).\n"
-            "4. В конце добавь 2-3 релевантных хештега с ОТСТУПОМ ПЕРЕД НИМИ (один пустой абзац).\n"
-            "5. НИКОГДА не добавляй нумерацию, маркеры списка, подзаголовки или дополнительные форматирования.\n"
-            "6. НИКОГДА не включай в ответ части этого промпта, инструкции или метаинформацию.\n\n"
-            "ПРИМЕР ИДЕАЛЬНОГО ПОСТА:\n"
-            "<b>💡 Россиянам напомнили о шестидневной рабочей неделе</b>\n\n"
-            "Согласно информации от Федеральной службы по труду и занятости, россияне могут вернуться к шестидневной рабочей неделе. Это решение обусловлено ростом объемов работ и потребностями бизнеса в увеличении производительности.\n\n"
-            "В службе отметили, что такая форма рабочей организации может применяться только при согласии работников и соблюдении всех трудовых норм. Также поднимался вопрос о необходимости адаптации законодательства под изменения в трудовых отношениях.\n\n"
-            "Сейчас многие компании рассматривают возможность внедрения новых графиков, учитывая мнение сотрудников и состояние рынка.\n\n"
-            "#труд #работа #россия"
-        )
\ No newline at end of file
+        return DEFAULT_PROMPT
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import CATCHUP_DEFAULT_MODE, CATCHUP_MAX_AGE_HOURS
+
+# Что делать с постами, накопившимися за время простоя
+CATCHUP_MODES = {
+    "spread": "распределить по интервалу",
+    "drop": "отбросить старые",
+    "digest": "объединить в дайджест",
+}
+CATCHUP_AGES = (6, 12, 24, 48)
+
+
+def catchup_policy(settings: Optional[dict]) -> Tuple[str, int]:
+    """Режим догоняющей публикации и возраст (в часах), старше которого посты отбрасываются."""
+
+    policy = (settings or {}).get("catchup") or {}
+    mode = policy.get("mode", CATCHUP_DEFAULT_MODE)
+    if mode not in CATCHUP_MODES:
+        mode = "spread"
+    return mode, int(policy.get("max_age_hours", CATCHUP_MAX_AGE_HOURS))
+
+
+class CatchupPlan:
+    """Что сделать с наступившими постами канала: опубликовать сейчас, перенести, отбросить или свести в дайджест."""
+
+    def __init__(self):
+        self.publish_now: List = []
+        self.reschedule: Dict[int, datetime] = {}
+        self.expired: List = []
+        self.digest: List = []
+
+
+def plan_catchup(due: List, queued: List, now: datetime, interval: int, mode: str, max_age_hours: int) -> CatchupPlan:
+    """Раскладывает наступившие посты (due) по политике канала.
+
+    В обычной работе таймер публикует посты по одному, и план сводится к «опубликовать сейчас».
+    Если наступивших постов несколько (после простоя), сразу уходит только один: остальные
+    и следующие за ними посты из очереди (queued) сдвигаются так, чтобы между публикациями
+    было не меньше interval секунд; в режиме digest они сводятся в один пост.
+    """
+
+    plan = CatchupPlan()
+    due = sorted(due, key=lambda post: post.scheduled_time)
+    due_ids = {post.id for post in due}
+    if mode == "drop":
+        cutoff = now - timedelta(hours=max_age_hours)
+        plan.expired = [post for post in due if post.scheduled_time < cutoff]
+        due = [post for post in due if post.scheduled_time >= cutoff]
+
+    plan.publish_now = due[:1]
+    if len(due) <= 1:
+        return plan
+
+    if mode == "digest":
+        plan.publish_now = []
+        plan.digest = due
+        return plan
+
+    previous = now
+    later = [post for post in sorted(queued, key=lambda post: post.scheduled_time) if post.id not in due_ids]
+    for post in due[1:] + later:
+        slot = max(post.scheduled_time, previous + timedelta(seconds=interval))
+        if slot != post.scheduled_time:
+            plan.reschedule[post.id] = slot
+        previous = slot
+    return plan
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import aiohttp
+
+from config.settings import DOWNLOAD_CONCURRENCY
+from core.metrics import IMAGE_DOWNLOAD_SECONDS, IMAGE_DOWNLOAD_TOTAL
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 64 * 1024
+_SNIFF_BYTES = 12
+# Серверы часто отдают картинки с неопределённым типом, такие ответы проверяем по сигнатуре
+_GENERIC_CONTENT_TYPES = ("application/octet-stream", "binary/octet-stream", "")
+
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Определяет формат изображения по сигнатуре первых байтов."""
+
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"BM"):
+        return "bmp"
+    return None
+
+
+async def download_image(session: aiohttp.ClientSession, url: str, max_bytes: int,
+                         timeout: int = 10) -> Optional[bytes]:
+    """Скачивает изображение потоком и прерывает загрузку, как только ясно, что оно не подходит.
+
+    Заголовки Content-Type и Content-Length проверяются до чтения тела, тело читается кусками
+    не больше лимита, а первые байты сверяются с сигнатурами форматов. Число одновременных
+    загрузок ограничено, поэтому память на буферы не превышает DOWNLOAD_CONCURRENCY * max_bytes.
+    """
+
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+    async with _slots:
+        result = "error"
+        started = time.monotonic()
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status != 200:
+                    logger.debug(f"Изображение {url}: статус {response.status}")
+                    result = "http_error"
+                    return None
+
+                content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                if not content_type.startswith("image/") and content_type not in _GENERIC_CONTENT_TYPES:
+                    logger.debug(f"Изображение {url}: неподходящий Content-Type {content_type}")
+                    result = "bad_type"
+                    return None
+
+                if response.content_length and response.content_length > max_bytes:
+                    logger.debug(f"Изображение {url}: Content-Length {response.content_length} больше лимита")
+                    result = "too_large"
+                    return None
+
+                buf = bytearray()
+                sniffed = False
+                async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+                    buf.extend(chunk)
+                    if len(buf) > max_bytes:
+                        logger.debug(f"Изображение {url}: превышен лимит {max_bytes} байт")
+                        result = "too_large"
+                        return None
+                    if not sniffed and len(buf) >= _SNIFF_BYTES:
+                        if not sniff_image_type(bytes(buf[:_SNIFF_BYTES])):
+                            logger.debug(f"Изображение {url}: содержимое не похоже на картинку")
+                            result = "bad_type"
+                            return None
+                        sniffed = True
+
+                if not sniffed:
+                    # Тело короче сигнатуры — изображением оно быть не может
+                    result = "bad_type"
+                    return None
+                result = "ok"
+                return bytes(buf)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug(f"Ошибка загрузки изображения {url}: {str(e)}")
+            return None
+        finally:
+            IMAGE_DOWNLOAD_SECONDS.observe(time.monotonic() - started)
+            IMAGE_DOWNLOAD_TOTAL.inc(result=result)
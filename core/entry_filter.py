@@ -0,0 +1,160 @@
+import json
+import logging
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ключ шаблона, который применяется ко всем источникам канала
+ALL_SOURCES = "*"
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """Собирает из слов регулярное выражение по префиксному дереву.
+
+    Движок re перебирает альтернативы по очереди, а дерево сводит проверку
+    к одному проходу по общим префиксам, как в Aho-Corasick.
+    """
+
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        end = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 and not end else "(?:" + "|".join(branches) + ")"
+        return body + "?" if end else body
+
+    return build(trie)
+
+
+def _words_regex(words: List[str]) -> Optional[re.Pattern]:
+
+    words = sorted({w.strip().lower() for w in words if w and w.strip()})
+    if not words:
+        return None
+    # Слово совпадает как начало слова в тексте: «санкци» найдёт и «санкции», и «санкциями»
+    return re.compile(r'(?<!\w)' + _trie_pattern(words), re.IGNORECASE)
+
+
+class EntryFilter:
+    """Скомпилированные правила фильтрации записей одного канала со статистикой срабатываний."""
+
+    def __init__(self, rules: Dict):
+        self.rules = rules or {}
+        self.stop_words = _words_regex(self.rules.get("stop_words", []))
+        self.required_words = _words_regex(self.rules.get("required_words", []))
+        self.source_patterns: List[Tuple[str, re.Pattern, List[str]]] = []
+        for source_key, patterns in self.rules.get("source_patterns", {}).items():
+            valid = []
+            for pattern in patterns:
+                try:
+                    # Проверяем в том же виде, в каком шаблон попадёт в общее выражение
+                    re.compile(f"(?P<p0>{pattern})")
+                    valid.append(pattern)
+                except re.error as e:
+                    logger.warning(f"Некорректный шаблон фильтра '{pattern}' для {source_key}: {str(e)}")
+            if valid:
+                # Все шаблоны источника объединяются в одно выражение с именованными группами
+                combined = "|".join(f"(?P<p{i}>{p})" for i, p in enumerate(valid))
+                self.source_patterns.append((source_key, re.compile(combined, re.IGNORECASE), valid))
+
+        self.stats: Counter = Counter()
+        self.rule_hits: Counter = Counter()
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.stop_words or self.required_words or self.source_patterns)
+
+    def check(self, entry: Dict, source_url: str = "") -> Optional[str]:
+        """Возвращает причину отбрасывания записи или None, если запись проходит."""
+
+        self.stats["checked"] += 1
+        text = f"{entry.get('title', '')}\n{entry.get('content', '')}"
+
+        if self.stop_words:
+            match = self.stop_words.search(text)
+            if match:
+                return self._reject("stop_word", f"стоп-слово «{match.group(0).lower()}»")
+
+        if self.required_words and not self.required_words.search(text):
+            return self._reject("missing_required", "нет обязательных слов")
+
+        for source_key, regex, patterns in self.source_patterns:
+            if source_key != ALL_SOURCES and source_key not in source_url:
+                continue
+            match = regex.search(text)
+            if match:
+                pattern = patterns[int(match.lastgroup[1:])]
+                return self._reject("source_pattern", f"шаблон «{pattern}» ({source_key})")
+
+        self.stats["passed"] += 1
+        return None
+
+    def _reject(self, kind: str, rule: str) -> str:
+        self.stats[kind] += 1
+        self.rule_hits[rule] += 1
+        return rule
+
+
+# Скомпилированные фильтры по каналам; пересобираются только при изменении правил
+_filters: Dict[int, Tuple[str, EntryFilter]] = {}
+
+
+def get_channel_filter(channel_id: int, rules: Optional[Dict]) -> EntryFilter:
+
+    key = json.dumps(rules or {}, sort_keys=True, ensure_ascii=False)
+    cached = _filters.get(channel_id)
+    if cached and cached[0] == key:
+        return cached[1]
+    entry_filter = EntryFilter(rules or {})
+    _filters[channel_id] = (key, entry_filter)
+    return entry_filter
+
+
+def get_filter_stats(channel_id: int) -> Optional[EntryFilter]:
+
+    cached = _filters.get(channel_id)
+    return cached[1] if cached else None
+
+
+def parse_filter_rules(text: str) -> Dict:
+    """Разбирает правила из сообщения пользователя: по одному правилу в строке.
+
+    -слово — стоп-слово, +слово — обязательное слово,
+    источник: регулярное выражение — шаблон для источника (* — для всех).
+    """
+
+    rules = {"stop_words": [], "required_words": [], "source_patterns": {}}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("-"):
+            rules["stop_words"].append(line[1:].strip())
+        elif line.startswith("+"):
+            rules["required_words"].append(line[1:].strip())
+        elif ": " in line:
+            source_key, pattern = line.split(": ", 1)
+            if source_key.strip() and pattern.strip():
+                rules["source_patterns"].setdefault(source_key.strip(), []).append(pattern.strip())
+        else:
+            raise ValueError(f"Не удалось разобрать строку: {line}")
+    return rules
+
+
+def format_filter_rules(rules: Optional[Dict]) -> str:
+
+    rules = rules or {}
+    lines = [f"-{w}" for w in rules.get("stop_words", [])]
+    lines += [f"+{w}" for w in rules.get("required_words", [])]
+    for source_key, patterns in rules.get("source_patterns", {}).items():
+        lines += [f"{source_key}: {p}" for p in patterns]
+    return "\n".join(lines)
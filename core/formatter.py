@@ -0,0 +1,192 @@
+import html
+import re
+from typing import List, Tuple
+
+# Все шаблоны компилируются один раз при импорте модуля
+_LEADING_MARKUP = re.compile(r'^[#\*]+\s*')
+_TRAILING_MARKUP = re.compile(r'[\*#_]+$')
+_BOLD = re.compile(r'<b>(.*?)</b>')
+_TITLE_LEADING_JUNK = re.compile(r'^[^\wа-яА-ЯёЁ]+')
+_TITLE_TRAILING_JUNK = re.compile(r'[^\wа-яА-ЯёЁ\s.,!?;:()\-\"\'—–-]+$')
+_SENTENCE_END = re.compile(r'[.!?]')
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+_LIST_BULLET = re.compile(r'^[\-\•\*]\s*')
+_LIST_NUMBER = re.compile(r'^\d+[\.\)]\s*')
+_WHITESPACE = re.compile(r'\s+')
+_MULTI_NEWLINE = re.compile(r'\n{3,}')
+_MULTI_SPACE = re.compile(r' +')
+_TAG = re.compile(r'<[^>]+>')
+_LEADING_EMOJI = re.compile(
+    r'^[\U0001F300-\U0001F6FF\U0001F900-\U0001F9FF\U0001FA00-\U0001FA6F\U0001FA70-\U0001FAFF\U00002702-\U000027B0]'
+)
+
+
+def _first_sentence(text: str) -> str:
+
+    match = _SENTENCE_END.search(text)
+    return (text[:match.start()] if match else text).strip()
+
+
+def _extract_title(lines: List[str], text: str, topic: str) -> Tuple[str, List[str]]:
+
+    title = ""
+    content_lines: List[str] = []
+
+    if lines:
+        first_line = _TRAILING_MARKUP.sub('', _LEADING_MARKUP.sub('', lines[0]))
+
+        if '<b>' in first_line and '</b>' in first_line:
+            title_match = _BOLD.search(first_line)
+            if title_match:
+                title = title_match.group(1).strip()
+        else:
+            title = first_line
+
+        title = _TITLE_TRAILING_JUNK.sub('', _TITLE_LEADING_JUNK.sub('', title))
+        content_lines = lines[1:]
+
+    if not title and content_lines:
+        for i, line in enumerate(content_lines):
+            if len(line) < 100 and (line.endswith(('.', '!', '?')) or len(line) < 50):
+                title = line
+                content_lines = content_lines[i + 1:]
+                break
+
+    if not title:
+        first_sentence = _first_sentence(text)
+        if 20 < len(first_sentence) < 100:
+            title = first_sentence + ("" if first_sentence.endswith(("?", "!", ".")) else ".")
+        else:
+            title = "Новости по теме: " + topic
+
+    return title, content_lines
+
+
+def _group_sentences(content: str) -> List[str]:
+    """Собирает абзацы по два предложения; длинное предложение идёт отдельным абзацем."""
+
+    paragraphs = []
+    para_sentences = []
+    for sentence in _SENTENCE_SPLIT.split(content):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        para_sentences.append(sentence)
+        if len(para_sentences) >= 2 or len(sentence) > 150:
+            paragraphs.append(" ".join(para_sentences))
+            para_sentences = []
+            if len(paragraphs) == 3:
+                return paragraphs
+    if para_sentences:
+        paragraphs.append(" ".join(para_sentences))
+    return paragraphs
+
+
+def format_post(raw_text: str, topic: str, emoji: str, hashtags: List[str]) -> str:
+    """Приводит ответ модели к виду: жирный заголовок, до трёх абзацев, хештеги."""
+
+    text = raw_text.strip()
+    lines = [stripped for stripped in (line.strip() for line in text.split('\n')) if stripped]
+
+    title, content_lines = _extract_title(lines, text, topic)
+
+    # Строки уже очищены и склеены одним переводом строки, поэтому абзацы
+    # всегда собираются из предложений.
+    content = "\n".join(content_lines).strip()
+
+    clean_paragraphs = []
+    for para in _group_sentences(content):
+        para = _LIST_NUMBER.sub('', _LIST_BULLET.sub('', para))
+        para = _WHITESPACE.sub(' ', para).strip()
+        if len(para) > 30:
+            clean_paragraphs.append(para)
+
+    if not clean_paragraphs:
+        first_part = _first_sentence(content)
+        if len(first_part) > 50:
+            clean_paragraphs.append(first_part + ".")
+        else:
+            clean_paragraphs.append(content[:300] + ("..." if len(content) > 300 else ""))
+
+    if not _LEADING_EMOJI.match(title):
+        title = f"{emoji} {title}"
+
+    final_post = f"<b>{title}</b>\n\n" + "\n\n".join(clean_paragraphs) + "\n\n" + " ".join(hashtags)
+    final_post = _MULTI_SPACE.sub(' ', _MULTI_NEWLINE.sub('\n\n', final_post))
+    return final_post.strip()
+
+
+def format_plain_post(raw_text: str, emoji: str, hashtags: List[str]) -> str:
+
+    clean_text = _WHITESPACE.sub(' ', raw_text.strip())
+    return f"<b>{emoji} Новость</b>\n\n{clean_text[:600]}...\n\n{' '.join(hashtags)}"
+
+
+def build_description(text: str) -> str:
+    """Собирает описание для резервного поста: до трёх абзацев, не длиннее 800 символов."""
+
+    formatted_paragraphs = []
+    current_para = ""
+
+    for para in text.split('\n'):
+        para = para.strip()
+        if not para:
+            continue
+        if len(para) < 30:
+            current_para += para + " "
+        else:
+            if current_para:
+                formatted_paragraphs.append(current_para.strip())
+                current_para = ""
+            formatted_paragraphs.append(para)
+
+    if current_para:
+        formatted_paragraphs.append(current_para.strip())
+
+    description = "\n\n".join(formatted_paragraphs[:3])
+
+    if len(description) < 200:
+        sentences = [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+        if len(sentences) > 3:
+            description = sentences[0] + " " + sentences[1] + "\n\n" + sentences[2]
+
+    if len(description) > 800:
+        description = description[:800] + "..."
+
+    return description
+
+
+def format_fallback_post(title: str, text: str, emoji: str, hashtags: List[str]) -> str:
+
+    clean_title = title.strip(' "\'')
+    return (
+        f"<b>{emoji} {clean_title}</b>\n\n"
+        f"{build_description(text)}\n\n"
+        f"{' '.join(hashtags)}"
+    )
+
+
+def post_title(processed: str) -> str:
+    """Заголовок готового поста — текст первого <b>…</b> без эмодзи и разметки; "" если его нет."""
+
+    match = _BOLD.search(processed or "")
+    if not match:
+        return ""
+    title = html.unescape(_TAG.sub('', match.group(1)))
+    return _TITLE_LEADING_JUNK.sub('', _WHITESPACE.sub(' ', title)).strip()
+
+
+def format_digest(titles: List[str], emoji: str, hashtags: List[str], limit: int = 4096) -> str:
+    """Собирает несколько пропущенных новостей в один пост-дайджест, не длиннее limit символов."""
+
+    header = f"<b>{emoji} Главное за время паузы</b>\n\n"
+    footer = f"\n\n{' '.join(hashtags)}" if hashtags else ""
+    lines: List[str] = []
+    size = len(header) + len(footer)
+    for title in titles:
+        line = "• " + html.escape(_WHITESPACE.sub(' ', title).strip())
+        if size + len(line) + 1 > limit:
+            break
+        lines.append(line)
+        size += len(line) + 1
+    return header + "\n".join(lines) + footer
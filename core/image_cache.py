@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from typing import Optional
+from config.settings import IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class ImageCache:
+    """Дисковый кэш подготовленных изображений с адресацией по содержимому (sha256).
+
+    Когда общий размер превышает лимит, удаляются файлы, к которым дольше всего не обращались.
+    Дисковые операции put/get выполняются в потоке, чтобы не блокировать event loop.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._total: Optional[int] = None
+        # put из нескольких потоков меняет общий размер и может одновременно запустить вытеснение
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def digest_for(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.jpg")
+
+    async def put(self, data: bytes) -> str:
+        """Сохраняет байты в кэш; возвращает их адрес (sha256)."""
+        return await asyncio.to_thread(self._put, data)
+
+    async def get(self, digest: Optional[str]) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, digest)
+
+    def _put(self, data: bytes) -> str:
+
+        digest = self.digest_for(data)
+        path = self._path(digest)
+        if os.path.exists(path):
+            os.utime(path)
+            return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Пишем во временный файл и переименовываем, чтобы читатель не увидел недописанный файл
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            if self._total is not None:
+                self._total += len(data)
+            self._evict_if_needed()
+        return digest
+
+    def _get(self, digest: Optional[str]) -> Optional[bytes]:
+
+        if not digest:
+            return None
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".jpg"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _evict_if_needed(self) -> None:
+
+        if self._total is None:
+            self._total = sum(size for _, size, _ in self._files())
+        if self._total <= self.max_bytes:
+            return
+
+        removed = 0
+        for path, size, _ in sorted(self._files(), key=lambda f: f[2]):
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self._total -= size
+                removed += 1
+            except FileNotFoundError:
+                continue
+        logger.info(f"Кэш изображений: удалено {removed} старых файлов, занято {self._total} байт")
+
+
+image_cache = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
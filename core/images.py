@@ -0,0 +1,87 @@
+import asyncio
+import io
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from PIL import Image
+
+from config.settings import IMAGE_WORKERS, IMAGE_EXECUTOR, IMAGE_PASSTHROUGH_MAX_BYTES
+from core.metrics import IMAGE_OPTIMIZE_SECONDS
+
+MAX_IMAGE_SIDE = 1280
+
+
+def needs_transcoding(img: Image.Image, size_bytes: int) -> bool:
+    """Решает по заголовку, без декодирования пикселей: подходящий JPEG отправляется как есть."""
+
+    return not (
+        img.format == "JPEG"
+        and img.mode in ("RGB", "L")
+        and max(img.size) <= MAX_IMAGE_SIDE
+        and size_bytes <= IMAGE_PASSTHROUGH_MAX_BYTES
+    )
+
+
+def optimize_image(data: bytes) -> bytes:
+    """Уменьшает изображение до 1280px по большей стороне и перекодирует в JPEG.
+
+    Image.open читает только заголовок, поэтому подходящие JPEG возвращаются без декодирования,
+    а большие JPEG декодируются сразу в уменьшенном масштабе (draft mode libjpeg).
+    """
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        if not needs_transcoding(img, len(data)):
+            return data
+        if img.format == "JPEG" and max(img.size) > MAX_IMAGE_SIDE:
+            img.draft("RGB", (MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=85, optimize=True)
+        return out.getvalue()
+    except Exception:
+        return data
+
+
+_executor: Optional[Executor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def _get_executor() -> Executor:
+
+    global _executor
+    if _executor is None:
+        if IMAGE_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+    return _executor
+
+
+async def optimize_image_async(data: bytes) -> bytes:
+    """Выполняет optimize_image в пуле воркеров, не блокируя event loop.
+
+    Число одновременно ожидающих задач ограничено, чтобы очередь не копила скачанные картинки в памяти.
+    """
+
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(IMAGE_WORKERS * 2)
+
+    async with _slots:
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(_get_executor(), optimize_image, data)
+        IMAGE_OPTIMIZE_SECONDS.observe(time.monotonic() - started)
+        return result
+
+
+def shutdown_image_workers() -> None:
+
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
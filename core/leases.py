@@ -0,0 +1,39 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Tuple
+
+from config.settings import WORKER_ID, LEASE_TTL
+from database.crud import renew_leases, release_leases
+from database.models import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+async def _renew_forever(model, held: List[Tuple[int, int]]) -> None:
+    while True:
+        await asyncio.sleep(LEASE_TTL / 3)
+        try:
+            async with AsyncSessionLocal() as db:
+                renewed = await renew_leases(db, model, WORKER_ID, held, LEASE_TTL)
+            if renewed < len(held):
+                logger.warning(f"{model.__tablename__}: потеряна аренда {len(held) - renewed} из {len(held)} строк")
+        except Exception as e:
+            logger.error(f"Не удалось продлить аренду {model.__tablename__}: {str(e)}")
+
+
+@asynccontextmanager
+async def hold_leases(model, rows):
+    """Держит аренду захваченных строк, пока идёт работа, и освобождает её на выходе."""
+
+    held = [(row.id, row.lease_token) for row in rows]
+    renewer = asyncio.create_task(_renew_forever(model, held))
+    try:
+        yield
+    finally:
+        renewer.cancel()
+        try:
+            async with AsyncSessionLocal() as db:
+                await release_leases(db, model, WORKER_ID, held)
+        except Exception as e:
+            logger.error(f"Не удалось освободить аренду {model.__tablename__}: {str(e)}")
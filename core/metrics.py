@@ -0,0 +1,222 @@
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+_registry: List["_Metric"] = []
+_collectors: List[Callable[[], Awaitable[None]]] = []
+
+
+def _escape(value: object) -> str:
+
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    """Семейство метрик в формате Prometheus; значения хранятся по кортежу значений меток."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        # Гистограммы обновляются и из пула потоков (разбор лент), поэтому изменения под блокировкой
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: Tuple[str, ...], value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value:g}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def replace(self, values: Dict[Tuple[str, ...], float]) -> None:
+        """Заменяет все значения разом — для снимков, где исчезнувшие метки тоже должны пропасть."""
+        with self._lock:
+            self._values = dict(values)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # [счётчики по корзинам (последняя — +Inf), сумма, количество]
+            state = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def _render_value(self, key: Tuple[str, ...], value) -> List[str]:
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames + ('le',), key + (le,))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:g}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+FEED_FETCH_SECONDS = Histogram("newsbot_feed_fetch_seconds", "Время загрузки RSS-ленты")
+FEED_FETCH_TOTAL = Counter("newsbot_feed_fetch_total", "Загрузки RSS-лент по результату", ["result"])
+FEED_PARSE_SECONDS = Histogram("newsbot_feed_parse_seconds", "Время разбора RSS-ленты")
+GROQ_REQUEST_SECONDS = Histogram("newsbot_groq_request_seconds", "Время запроса к Groq", ["model"])
+GROQ_REQUESTS_TOTAL = Counter("newsbot_groq_requests_total", "Запросы к Groq по результату", ["model", "result"])
+GROQ_TOKENS_TOTAL = Counter("newsbot_groq_tokens_total", "Токены Groq по данным API", ["model", "kind"])
+IMAGE_DOWNLOAD_SECONDS = Histogram("newsbot_image_download_seconds", "Время загрузки изображения")
+IMAGE_DOWNLOAD_TOTAL = Counter("newsbot_image_download_total", "Загрузки изображений по результату", ["result"])
+IMAGE_OPTIMIZE_SECONDS = Histogram("newsbot_image_optimize_seconds", "Время оптимизации изображения в пуле")
+TELEGRAM_REQUEST_SECONDS = Histogram("newsbot_telegram_request_seconds", "Время запроса к Telegram", ["method"])
+TELEGRAM_REQUESTS_TOTAL = Counter("newsbot_telegram_requests_total", "Запросы к Telegram по результату",
+                                  ["method", "result"])
+DB_QUERY_SECONDS = Histogram("newsbot_db_query_seconds", "Время SQL-запроса", ["operation"],
+                             buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+STAGE_SECONDS = Histogram("newsbot_pipeline_stage_seconds", "Время обработки элемента на стадии конвейера",
+                          ["stage"])
+QUEUE_DEPTH = Gauge("newsbot_pipeline_queue_depth", "Элементов во входной очереди стадии", ["stage"])
+PENDING_POSTS = Gauge("newsbot_pending_posts", "Постов в очереди публикации", ["channel"])
+EVENT_LOOP_LAG_SECONDS = Histogram("newsbot_event_loop_lag_seconds", "Запаздывание event loop")
+
+
+def register_collector(collector: Callable[[], Awaitable[None]]) -> None:
+    """Функция, обновляющая метрики-снимки (например, число ожидающих постов) перед каждым сбором."""
+
+    _collectors.append(collector)
+
+
+async def render_metrics() -> str:
+
+    for collector in _collectors:
+        try:
+            await collector()
+        except Exception as e:
+            logger.error(f"Ошибка сборщика метрик: {str(e)}")
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class LoopLagMonitor:
+    """Измеряет, насколько позже запланированного просыпается event loop.
+
+    Если синхронная работа блокирует цикл, опрос Telegram и колбэки ждут столько же.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.monotonic() - expected))
+
+
+def instrument_engine(engine) -> None:
+    """Замеряет время каждого SQL-запроса движка SQLAlchemy."""
+
+    from sqlalchemy import event
+
+    # Время начала хранится в контексте выполнения: after_cursor_execute не вызывается, если запрос
+    # упал, и общий для соединения стек начал после ошибки разошёлся бы с запросами
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.newsbot_query_started = time.monotonic()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "newsbot_query_started", None)
+        if started is not None:
+            DB_QUERY_SECONDS.observe(time.monotonic() - started, operation=statement.split(None, 1)[0].upper())
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Поднимает HTTP-эндпоинт /metrics в формате Prometheus."""
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=await render_metrics(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+from core.metrics import QUEUE_DEPTH, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Обработчик стадии получает один элемент и возвращает элементы для следующей стадии (или ничего)
+Handler = Callable[[Any], Awaitable[Optional[Iterable[Any]]]]
+
+
+class Stage:
+    """Стадия конвейера: входная очередь и concurrency воркеров, вызывающих handler.
+
+    Очередь ограничена maxsize, поэтому медленная стадия притормаживает предыдущие
+    (put ждёт свободного места), а не копит элементы в памяти.
+    """
+
+    def __init__(self, name: str, handler: Handler, concurrency: int = 1, maxsize: int = 0):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.inbox: asyncio.Queue = asyncio.Queue(maxsize)
+        self.next: Optional["Stage"] = None
+        self.processed = 0
+        self.busy = 0.0
+        self._workers: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def put(self, item: Any) -> None:
+        await self.inbox.put(item)
+        QUEUE_DEPTH.set(self.inbox.qsize(), stage=self.name)
+
+    async def drain(self) -> None:
+        """Ждёт, пока обработаны все поступившие элементы, и останавливает воркеров."""
+
+        await self.inbox.join()
+        await self.stop()
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self) -> None:
+        while True:
+            item = await self.inbox.get()
+            QUEUE_DEPTH.set(self.inbox.qsize(), stage=self.name)
+            started = time.monotonic()
+            try:
+                results = await self.handler(item)
+                # Время стадии — без ожидания места в следующей очереди, иначе не видно, кто узкое место
+                self._record(time.monotonic() - started)
+                # Выход передаём дальше до task_done: к концу drain() всё уже лежит в следующей очереди
+                if self.next:
+                    for result in results or ():
+                        await self.next.put(result)
+            except Exception as e:
+                self._record(time.monotonic() - started)
+                logger.error(f"Ошибка на стадии {self.name}: {str(e)}", exc_info=True)
+            finally:
+                self.processed += 1
+                self.inbox.task_done()
+
+    def _record(self, elapsed: float) -> None:
+        STAGE_SECONDS.observe(elapsed, stage=self.name)
+        self.busy += elapsed
+
+
+class Pipeline:
+    """Цепочка стадий, связанных ограниченными очередями."""
+
+    def __init__(self, *stages: Stage):
+        self.stages = stages
+        for current, following in zip(stages, stages[1:]):
+            current.next = following
+
+    async def run(self, items: Iterable[Any]) -> None:
+        started = time.monotonic()
+        for stage in self.stages:
+            stage.start()
+        try:
+            for item in items:
+                await self.stages[0].put(item)
+            # Стадии завершаются по порядку: когда пуста очередь стадии, её выход уже у следующей
+            for stage in self.stages:
+                await stage.drain()
+        finally:
+            for stage in self.stages:
+                await stage.stop()
+
+        total = time.monotonic() - started
+        for stage in self.stages:
+            logger.info(
+                f"Стадия {stage.name}: элементов {stage.processed}, занята {stage.busy:.2f} сек "
+                f"({stage.busy / max(total * stage.concurrency, 1e-9):.0%} от {stage.concurrency} воркеров)")
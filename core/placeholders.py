@@ -0,0 +1,67 @@
+import io
+import logging
+import os
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+from config.settings import PLACEHOLDER_DIR
+from core.images import optimize_image
+from core.topic_profile import EMOJIS
+
+logger = logging.getLogger(__name__)
+
+_SIZE = (1280, 720)
+
+# Цвета градиента для категорий, у которых нет своей картинки в PLACEHOLDER_DIR
+_COLORS = {
+    "tech": ((20, 30, 60), (40, 110, 200)),
+    "news": ((30, 30, 35), (120, 120, 130)),
+    "business": ((15, 45, 35), (40, 150, 100)),
+    "entertainment": ((60, 15, 60), (210, 70, 150)),
+    "sports": ((60, 25, 10), (230, 120, 30)),
+    "politics": ((35, 20, 20), (150, 40, 40)),
+    "science": ((10, 40, 50), (30, 160, 170)),
+}
+
+_placeholders: Dict[str, bytes] = {}
+
+
+def _gradient(top, bottom) -> Image.Image:
+
+    t = np.linspace(0.0, 1.0, _SIZE[1], dtype=np.float32)[:, None]
+    column = (np.array(top, dtype=np.float32) * (1 - t) + np.array(bottom, dtype=np.float32) * t).astype(np.uint8)
+    return Image.fromarray(np.repeat(column[:, None, :], _SIZE[0], axis=1), "RGB")
+
+
+def _load_category(category: str) -> bytes:
+
+    for ext in ("jpg", "jpeg", "png", "webp"):
+        path = os.path.join(PLACEHOLDER_DIR, f"{category}.{ext}")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return optimize_image(f.read())
+
+    top, bottom = _COLORS.get(category, _COLORS["news"])
+    out = io.BytesIO()
+    _gradient(top, bottom).save(out, format="JPEG", quality=85, optimize=True)
+    return out.getvalue()
+
+
+def load_placeholders() -> None:
+    """Загружает и оптимизирует заглушки всех категорий один раз; дальше они берутся из памяти."""
+
+    for category in EMOJIS:
+        try:
+            _placeholders[category] = _load_category(category)
+        except Exception as e:
+            logger.error(f"Не удалось подготовить заглушку для категории {category}: {str(e)}", exc_info=True)
+    logger.info(f"Заглушки изображений загружены: {len(_placeholders)}")
+
+
+def get_placeholder(category: str = "news") -> Optional[bytes]:
+
+    if not _placeholders:
+        load_placeholders()
+    return _placeholders.get(category) or _placeholders.get("news")
@@ -0,0 +1,108 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PublishTimer:
+    """Куча «канал → время ближайшего поста», будящая публикацию ровно в scheduled_time.
+
+    В куче могут лежать устаревшие записи: актуальное время канала хранится в _due,
+    а несовпадающие с ним записи просто отбрасываются при извлечении.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int]] = []
+        self._due: Dict[int, datetime] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._callback: Optional[Callable[[int], Awaitable[None]]] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def start(self, callback: Callable[[int], Awaitable[None]]) -> None:
+        self._callback = callback
+        self._wakeup = asyncio.Event()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def schedule(self, channel_id: int, when: datetime) -> None:
+        """Учитывает новый пост канала: таймер сдвигается, только если пост раньше текущего."""
+
+        current = self._due.get(channel_id)
+        if current is not None and current <= when:
+            return
+        self._set(channel_id, when)
+
+    def replace(self, next_times: Dict[int, datetime], channel_ids: Optional[Iterable[int]] = None) -> None:
+        """Заменяет время каналов данными из БД; без channel_ids — для всех каналов сразу."""
+
+        if channel_ids is None:
+            self._due = dict(next_times)
+            self._heap = [(when, channel_id) for channel_id, when in next_times.items()]
+            heapq.heapify(self._heap)
+            self._notify()
+            return
+
+        for channel_id in channel_ids:
+            if channel_id in next_times:
+                self._set(channel_id, next_times[channel_id])
+            else:
+                self._due.pop(channel_id, None)
+
+    def next_due(self) -> Optional[Tuple[datetime, int]]:
+
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0] if self._heap else None
+
+    def _set(self, channel_id: int, when: datetime) -> None:
+
+        self._due[channel_id] = when
+        heapq.heappush(self._heap, (when, channel_id))
+        self._notify()
+
+    def _notify(self) -> None:
+
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            head = self.next_due()
+            if head is None:
+                await self._wakeup.wait()
+                continue
+
+            when, channel_id = head
+            delay = (when - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                # Просыпаемся к сроку или раньше, если появился более ранний пост
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            del self._due[channel_id]
+            task = asyncio.create_task(self._fire(channel_id))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _fire(self, channel_id: int) -> None:
+        try:
+            await self._callback(channel_id)
+        except Exception as e:
+            logger.error(f"Ошибка публикации по таймеру для канала {channel_id}: {str(e)}", exc_info=True)
+
+
+publish_timer = PublishTimer()
@@ -1,14 +1,62 @@
-import io
 import logging
 from typing import List, Optional
 
 import aiohttp
 from aiogram import Bot
+from aiogram.exceptions import (TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramRetryAfter,
+                                TelegramUnauthorizedError, TelegramEntityTooLarge, TelegramMigrateToChat)
 from aiogram.types import BufferedInputFile
-from PIL import Image
+
+from core.image_cache import image_cache
+from core.images import optimize_image_async
+from core.downloader import download_image
+from core.placeholders import get_placeholder
+from core.rate_limiter import telegram_limiter
+from database.crud import get_media_file_id, save_media_file_id, delete_media_file_id
+from database.models import AsyncSessionLocal
 
 _MAX_IMG_SIZE = 8000000
-_PLACEHOLDER_IMG = "https://source.unsplash.com/1280x720/?news,technology"
+# Фрагменты ответов Telegram, означающие, что сохранённый file_id больше не годится
+_INVALID_FILE_ID_ERRORS = ("wrong file identifier", "file_id", "file reference", "wrong remote file")
+# Ошибки, которые не исправятся повтором: бота удалили из канала, нет прав, канал не найден, битый HTML
+_PERMANENT_ERRORS = (TelegramForbiddenError, TelegramNotFound, TelegramUnauthorizedError, TelegramBadRequest,
+                     TelegramEntityTooLarge, TelegramMigrateToChat)
+# Фрагменты ответов Telegram, означающие, что отклонено само изображение: фото точно не опубликовано,
+# можно пробовать другое или текст. Прочие 400 (канал не найден, нет прав, битый HTML) заменой картинки
+# не исправить, а после таймаута или сетевой ошибки сообщение могло дойти — такие ошибки идут в try_publish
+_BAD_MEDIA_ERRORS = (
+    "image_process_failed", "photo_invalid_dimensions", "photo_save_file_invalid", "photo_ext_invalid",
+    "photo_content_type_invalid", "photo_content_url_empty", "media_empty", "webpage_media_empty",
+    "wrong file identifier", "wrong remote file", "failed to get http url content",
+    "wrong type of the web page content", "invalid file http url", "file is too big", "type of file mismatch",
+)
+
+
+def _is_bad_media(error: TelegramBadRequest | TelegramEntityTooLarge) -> bool:
+    if isinstance(error, TelegramEntityTooLarge):
+        return True
+    return any(marker in str(error).lower() for marker in _BAD_MEDIA_ERRORS)
+
+
+class PublishResult:
+    """Итог попытки публикации: message_id при успехе, иначе вид ошибки ("retryable" или "permanent")."""
+
+    def __init__(self, message_id: Optional[int] = None, error_kind: Optional[str] = None, error: str = "",
+                 retry_after: int = 0):
+        self.message_id = message_id
+        self.error_kind = error_kind
+        self.error = error
+        self.retry_after = retry_after
+
+
+def classify_publish_error(error: BaseException) -> str:
+    """Временные сбои (сеть, 5xx, flood control) стоит повторить; остальные ошибки API — нет."""
+
+    if isinstance(error, TelegramRetryAfter):
+        return "retryable"
+    if isinstance(error, _PERMANENT_ERRORS):
+        return "permanent"
+    return "retryable"
 
 
 class Publisher:
@@ -16,87 +64,171 @@ class Publisher:
         self.bot = bot
         self._http: Optional[aiohttp.ClientSession] = None
 
-    async def publish_post(self, channel_id: str, content: str, media_urls: List[str] | None = None) -> Optional[int]:
+    async def publish_post(self, channel_id: str, content: str, media_urls: List[str] | None = None,
+                           image_digest: Optional[str] = None, category: str = "news") -> Optional[int]:
+        result = await self.try_publish(channel_id, content, media_urls, image_digest, category)
+        return result.message_id
+
+    async def try_publish(self, channel_id: str, content: str, media_urls: List[str] | None = None,
+                          image_digest: Optional[str] = None, category: str = "news") -> PublishResult:
+        """Как publish_post, но вместо None возвращает классифицированную ошибку последней отправки."""
         try:
+            if image_digest:
+                message_id = await self._publish_prepared(channel_id, content, image_digest)
+                if message_id:
+                    return PublishResult(message_id)
             if media_urls:
-                return await self._publish_with_media(channel_id, content, media_urls)
-            msg = await self.bot.send_message(channel_id, content, parse_mode="HTML")
-            return msg.message_id
+                return PublishResult(await self._publish_with_media(channel_id, content, media_urls, category))
+            msg = await telegram_limiter.call(
+                channel_id, lambda: self.bot.send_message(channel_id, content, parse_mode="HTML"),
+                "send_message")
+            return PublishResult(msg.message_id)
         except Exception as e:
             logging.getLogger(__name__).exception("Publish failed: %s", e)
-            return None
+            return PublishResult(error_kind=classify_publish_error(e), error=f"{type(e).__name__}: {e}",
+                                 retry_after=getattr(e, "retry_after", 0) or 0)
 
     async def edit_post(self, channel_id: str, message_id: int, html: str) -> bool:
         try:
-            await self.bot.edit_message_text(chat_id=channel_id, message_id=message_id, text=html, parse_mode="HTML")
+            await telegram_limiter.call(channel_id, lambda: self.bot.edit_message_text(
+                chat_id=channel_id, message_id=message_id, text=html, parse_mode="HTML"), "edit_message_text")
             return True
         except Exception:
             return False
 
     async def delete_post(self, channel_id: str, message_id: int) -> bool:
         try:
-            await self.bot.delete_message(channel_id, message_id)
+            await telegram_limiter.call(channel_id, lambda: self.bot.delete_message(channel_id, message_id),
+                                        "delete_message")
             return True
         except Exception:
             return False
 
-    async def _publish_with_media(self, channel_id: str, content: str, media_urls: List[str]) -> Optional[int]:
+    async def prepare_image(self, media_urls: List[str] | None) -> Optional[str]:
+        """Скачивает и оптимизирует изображение заранее; возвращает его адрес в кэше."""
+        for url in media_urls or []:
+            img_bytes = await self._download_image(url)
+            if img_bytes:
+                try:
+                    return await image_cache.put(img_bytes)
+                except OSError as e:
+                    logging.warning("Image cache write failed (%s): %s", url, e)
+                    return None
+            logging.getLogger(__name__).info("Image prefetch failed: %s", url)
+        return None
+
+    async def _publish_prepared(self, channel_id: str, content: str, image_digest: str) -> Optional[int]:
+        try:
+            return await self._send_photo(channel_id, content, image_digest)
+        except (TelegramBadRequest, TelegramEntityTooLarge) as e:
+            if not _is_bad_media(e):
+                raise
+            logging.warning("Send prepared photo failed (%s): %s", image_digest[:12], e)
+            return None
+
+    async def _send_photo(self, channel_id: str, content: str, digest: str, img_bytes: Optional[bytes] = None,
+                          filename: str = "image.jpg") -> Optional[int]:
+        """Отправляет фото по сохранённому file_id, а если его нет или он устарел — загружает байты."""
+        file_id = await self._cached_file_id(digest)
+        if file_id:
+            try:
+                msg = await telegram_limiter.call(channel_id, lambda: self.bot.send_photo(
+                    channel_id, photo=file_id, caption=content[:1024], parse_mode="HTML"), "send_photo")
+                return msg.message_id
+            except TelegramBadRequest as e:
+                if not any(marker in str(e).lower() for marker in _INVALID_FILE_ID_ERRORS):
+                    raise
+                logging.info("Cached file_id for %s rejected, re-uploading: %s", digest[:12], e)
+                await self._forget_file_id(digest)
+
+        img_bytes = img_bytes or await image_cache.get(digest)
+        if not img_bytes:
+            return None
+        photo = BufferedInputFile(img_bytes, filename=filename)
+        msg = await telegram_limiter.call(channel_id, lambda: self.bot.send_photo(
+            channel_id, photo=photo, caption=content[:1024], parse_mode="HTML"), "send_photo")
+        if msg.photo:
+            # Последний размер — самый большой, его и переиспользуем
+            await self._remember_file_id(digest, msg.photo[-1].file_id)
+        return msg.message_id
+
+    @staticmethod
+    async def _cached_file_id(digest: str) -> Optional[str]:
+        try:
+            async with AsyncSessionLocal() as db:
+                return await get_media_file_id(db, digest)
+        except Exception as e:
+            logging.debug("file_id lookup failed: %s", e)
+            return None
+
+    @staticmethod
+    async def _remember_file_id(digest: str, file_id: str) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await save_media_file_id(db, digest, file_id)
+        except Exception as e:
+            logging.debug("file_id save failed: %s", e)
+
+    @staticmethod
+    async def _forget_file_id(digest: str) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await delete_media_file_id(db, digest)
+        except Exception as e:
+            logging.debug("file_id delete failed: %s", e)
+
+    async def _publish_with_media(self, channel_id: str, content: str, media_urls: List[str],
+                                  category: str = "news") -> Optional[int]:
         for url in media_urls:
             img_bytes = await self._download_image(url)
             if not img_bytes:
                 logging.warning("Image download failed: %s", url)
                 continue
-            photo = BufferedInputFile(img_bytes, filename="image.jpg")
             try:
-                msg = await self.bot.send_photo(channel_id, photo=photo, caption=content[:1024], parse_mode="HTML")
-                return msg.message_id
-            except Exception as e:
+                return await self._send_photo(channel_id, content, image_cache.digest_for(img_bytes), img_bytes)
+            except (TelegramBadRequest, TelegramEntityTooLarge) as e:
+                if not _is_bad_media(e):
+                    raise
                 logging.warning("Send photo failed (%s): %s", url, e)
-        return await self._fallback_with_placeholder(channel_id, content)
+        return await self._fallback_with_placeholder(channel_id, content, category)
 
-    async def _fallback_with_placeholder(self, channel_id: str, content: str) -> Optional[int]:
-        img_bytes = await self._download_image(_PLACEHOLDER_IMG)
+    async def _fallback_with_placeholder(self, channel_id: str, content: str, category: str = "news") -> Optional[int]:
+        # Заглушки лежат в памяти, а их file_id переиспользуется, так что запасной путь не ходит в сеть за картинкой
+        img_bytes = get_placeholder(category)
         if img_bytes:
-            photo = BufferedInputFile(img_bytes, filename="placeholder.jpg")
             try:
-                msg = await self.bot.send_photo(channel_id, photo=photo, caption=content[:1024], parse_mode="HTML")
-                return msg.message_id
-            except Exception:
-                pass
-        try:
-            msg = await self.bot.send_message(channel_id, content, parse_mode="HTML")
-            return msg.message_id
-        except Exception:
-            return None
+                return await self._send_photo(channel_id, content, image_cache.digest_for(img_bytes), img_bytes,
+                                              filename="placeholder.jpg")
+            except (TelegramBadRequest, TelegramEntityTooLarge) as e:
+                if not _is_bad_media(e):
+                    raise
+                logging.warning("Send placeholder failed: %s", e)
+        # Ошибку последней попытки не глотаем: по ней try_publish решает, повторять ли публикацию
+        msg = await telegram_limiter.call(
+            channel_id, lambda: self.bot.send_message(channel_id, content, parse_mode="HTML"),
+            "send_message")
+        return msg.message_id
 
     async def _download_image(self, url: str) -> Optional[bytes]:
         if self._http is None:
             self._http = aiohttp.ClientSession()
         try:
-            async with self._http.get(url, timeout=aiohttp.ClientTimeout(total=10)) as r:
-                if r.status != 200:
-                    return None
-                data = await r.read()
-                if len(data) > _MAX_IMG_SIZE:
-                    return None
-                return self._optimize_image(data)
+            data = await download_image(self._http, url, _MAX_IMG_SIZE)
+            if not data:
+                return None
+            return await optimize_image_async(data)
         except Exception as e:
             logging.debug("Download error %s: %s", url, e)
             return None
 
-    @staticmethod
-    def _optimize_image(data: bytes) -> bytes:
-        try:
-            img = Image.open(io.BytesIO(data))
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-            img.thumbnail((1280, 1280), Image.Resampling.LANCZOS)
-            out = io.BytesIO()
-            img.save(out, format="JPEG", quality=85, optimize=True)
-            return out.getvalue()
-        except Exception:
-            return data
-
-    async def __aexit__(self, *exc):
+    async def close(self) -> None:
+        """Закрывает HTTP-сессию для скачивания изображений; она создаётся при первой загрузке."""
         if self._http:
             await self._http.close()
+            self._http = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from core.metrics import TELEGRAM_REQUEST_SECONDS, TELEGRAM_REQUESTS_TOTAL
+from config.settings import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_INTERVAL, TELEGRAM_MAX_RETRY_AFTER
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class TelegramRateLimiter:
+    """Распределяет отправки по времени с учётом лимитов Telegram.
+
+    Глобально — не больше TELEGRAM_GLOBAL_RATE сообщений в секунду, в один чат — не чаще
+    раза в TELEGRAM_CHAT_INTERVAL секунд. Слоты резервируются синхронно (между чтением
+    и записью нет await), поэтому блокировки не нужны.
+    """
+
+    def __init__(self, global_rate: float, chat_interval: float):
+        self.global_interval = 1.0 / global_rate
+        self.chat_interval = chat_interval
+        self._next_global = 0.0
+        self._next_chat: Dict[str, float] = {}
+
+    def _reserve_chat(self, chat_id: str) -> float:
+
+        now = time.monotonic()
+        slot = max(now, self._next_chat.get(chat_id, 0.0))
+        self._next_chat[chat_id] = slot + self.chat_interval
+        return slot - now
+
+    def _reserve_global(self) -> float:
+
+        now = time.monotonic()
+        slot = max(now, self._next_global)
+        self._next_global = slot + self.global_interval
+        return slot - now
+
+    async def acquire(self, chat_id: str) -> None:
+        # Сначала ждём очереди в своём чате и только потом занимаем глобальный слот,
+        # иначе медленный чат сдвигал бы глобальную очередь для всех остальных
+        delay = self._reserve_chat(str(chat_id))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        delay = self._reserve_global()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def penalize(self, chat_id: str, seconds: float) -> None:
+        """Telegram попросил подождать (RetryAfter): сдвигаем ближайший слот чата."""
+
+        chat_id = str(chat_id)
+        self._next_chat[chat_id] = max(self._next_chat.get(chat_id, 0.0), time.monotonic() + seconds)
+
+    async def call(self, chat_id: str, request: Callable[[], Awaitable[T]], method: str = "request",
+                   max_attempts: int = 3) -> T:
+        """Выполняет запрос к Telegram в своём слоте и повторяет его после RetryAfter."""
+
+        for attempt in range(max_attempts):
+            await self.acquire(chat_id)
+            started = time.monotonic()
+            result = "error"
+            try:
+                response = await request()
+                result = "ok"
+                return response
+            except TelegramRetryAfter as e:
+                result = "retry_after"
+                if attempt == max_attempts - 1 or e.retry_after > TELEGRAM_MAX_RETRY_AFTER:
+                    raise
+                logger.warning(f"Flood control в чате {chat_id}: ждём {e.retry_after} сек")
+                self.penalize(chat_id, e.retry_after)
+            finally:
+                TELEGRAM_REQUEST_SECONDS.observe(time.monotonic() - started, method=method)
+                TELEGRAM_REQUESTS_TOTAL.inc(method=method, result=result)
+        raise RuntimeError("unreachable")
+
+
+telegram_limiter = TelegramRateLimiter(TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_INTERVAL)
@@ -0,0 +1,73 @@
+import re
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+_WORD = re.compile(r'[a-zа-яё0-9]{3,}')
+# Грубый стемминг по префиксу: для русской морфологии этого хватает, чтобы «выборы» и «выборов» совпали
+_STEM_LENGTH = 5
+_N_FEATURES = 1 << 12
+# Насколько тема канала важнее истории опубликованных постов
+_TOPIC_WEIGHT = 3.0
+
+
+def _tokens(text: str) -> List[int]:
+
+    return [zlib.crc32(w[:_STEM_LENGTH].encode('utf-8')) % _N_FEATURES for w in _WORD.findall(text.lower())]
+
+
+def _hashed_counts(texts: Sequence[str]) -> np.ndarray:
+    """Матрица «документ × признак» с количеством слов, признаки — хэши основ слов."""
+
+    matrix = np.zeros((len(texts), _N_FEATURES), dtype=np.float32)
+    for row, text in enumerate(texts):
+        features = _tokens(text)
+        if features:
+            np.add.at(matrix[row], features, 1.0)
+    return matrix
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def score_entries(entries: List[Dict], topic: str, history: Sequence[str] = ()) -> np.ndarray:
+    """Косинусная близость TF-IDF каждой записи к профилю канала (тема + опубликованные посты)."""
+
+    if not entries:
+        return np.zeros(0, dtype=np.float32)
+
+    docs = [f"{e.get('title', '')} {e.get('content', '')}" for e in entries]
+    counts = _hashed_counts(docs + [topic] + list(history))
+    n_entries = len(docs)
+
+    # IDF считаем по всем документам сразу: слова, которые есть везде, не отличают записи друг от друга
+    df = np.count_nonzero(counts, axis=0)
+    idf = np.log((1.0 + counts.shape[0]) / (1.0 + df)) + 1.0
+    tfidf = _normalize(np.log1p(counts) * idf)
+
+    profile = _TOPIC_WEIGHT * tfidf[n_entries]
+    if history:
+        profile = profile + tfidf[n_entries + 1:].mean(axis=0)
+    profile = _normalize(profile)
+
+    return tfidf[:n_entries] @ profile
+
+
+def rank_indices(entries: List[Dict], topic: str, history: Sequence[str] = (), top_n: Optional[int] = None) -> List[int]:
+    """Индексы записей по убыванию релевантности каналу; при равенстве сохраняется исходный порядок."""
+
+    scores = score_entries(entries, topic, history)
+    order = np.argsort(-scores, kind='stable')
+    if top_n is not None:
+        order = order[:top_n]
+    return order.tolist()
+
+
+def rank_entries(entries: List[Dict], topic: str, history: Sequence[str] = (), top_n: Optional[int] = None) -> List[Dict]:
+
+    return [entries[i] for i in rank_indices(entries, topic, history, top_n)]
@@ -5,6 +5,13 @@ from datetime import datetime
 from typing import List, Dict, Optional
 from bs4 import BeautifulSoup
 import hashlib
+from core.downloader import download_image
+from core.metrics import FEED_FETCH_SECONDS, FEED_FETCH_TOTAL, FEED_PARSE_SECONDS
+
+_MAX_IMG_SIZE = 5000000
+_MAX_FEED_SIZE = 5000000
+_FEED_CHUNK_SIZE = 65536
+_FEED_TIMEOUT = 20
 
 
 class RSSParser:
@@ -20,8 +27,48 @@ class RSSParser:
             await self.session.close()
 
     async def parse_feed(self, url: str, last_guid: Optional[str] = None) -> List[Dict]:
+        data = await self.fetch_feed(url)
+        if not data:
+            return []
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.parse_content, data, last_guid)
+        except Exception:
+            return []
+
+    async def fetch_feed(self, url: str) -> Optional[bytes]:
+        """Скачивает ленту через aiohttp; feedparser.parse(url) делал это синхронно, блокируя event loop."""
+        if not self.session:
+            self.session = aiohttp.ClientSession()
+        result = "error"
         try:
-            feed = feedparser.parse(url)
+            with FEED_FETCH_SECONDS.time():
+                async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=_FEED_TIMEOUT)) as response:
+                    if response.status != 200:
+                        result = f"http_{response.status}"
+                        return None
+                    if response.content_length and response.content_length > _MAX_FEED_SIZE:
+                        result = "too_large"
+                        return None
+                    # content.read(n) отдаёт только то, что уже пришло в буфер, поэтому тело читается
+                    # по частям до конца или до превышения лимита
+                    data = bytearray()
+                    async for chunk in response.content.iter_chunked(_FEED_CHUNK_SIZE):
+                        data += chunk
+                        if len(data) > _MAX_FEED_SIZE:
+                            result = "too_large"
+                            return None
+                    result = "ok"
+                    return bytes(data)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+        finally:
+            FEED_FETCH_TOTAL.inc(result=result)
+
+    def parse_content(self, data: bytes, last_guid: Optional[str] = None) -> List[Dict]:
+        """Разбирает уже скачанную ленту; работает синхронно, поэтому вызывается в пуле потоков."""
+        with FEED_PARSE_SECONDS.time():
+            feed = feedparser.parse(data)
             if not feed.entries:
                 return []
 
@@ -37,8 +84,6 @@ class RSSParser:
                     new_entries.append(parsed_entry)
 
             return new_entries
-        except Exception:
-            return []
 
     def parse_entry(self, entry) -> Optional[Dict]:
         try:
@@ -107,12 +152,4 @@ class RSSParser:
         if not self.session:
             self.session = aiohttp.ClientSession()
 
-        try:
-            async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                if response.status == 200:
-                    content = await response.read()
-                    if len(content) < 5000000:
-                        return content
-        except:
-            pass
-        return None
+        return await download_image(self.session, url, _MAX_IMG_SIZE)
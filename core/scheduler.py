@@ -1,18 +1,33 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime, timedelta
-from typing import Dict, Callable
+from typing import Dict, List, Optional, Set, Tuple
+from collections import Counter, defaultdict
 import asyncio
 import logging
+import random
 from database.crud import *
-from database.models import SessionLocal, Post
+from database.models import AsyncSessionLocal, Channel, Post, RSSSource
 from core.rss_parser import RSSParser
 from core.ai_processor import AIProcessor
-from core.publisher import Publisher
-from config.settings import GROQ_API_KEY
+from core.publisher import Publisher, PublishResult
+from core.relevance import rank_indices
+from core.entry_filter import get_channel_filter
+from core.publish_timer import publish_timer
+from core.leases import hold_leases
+from core.pipeline import Pipeline, Stage
+from core.catchup import catchup_policy, plan_catchup
+from core.formatter import format_digest, post_title
+from core.topic_profile import pick_emoji, pick_hashtags
+from config.settings import MAX_AI_ENTRIES_PER_CHANNEL, RELEVANCE_HISTORY_SIZE, PUBLISH_CONCURRENCY, \
+    PUBLISH_RECONCILE_INTERVAL, WORKER_ID, LEASE_TTL, SOURCE_CLAIM_BATCH, \
+    FETCH_CONCURRENCY, PARSE_CONCURRENCY, AI_CONCURRENCY, PIPELINE_QUEUE_SIZE, PUBLISH_MAX_RETRIES, \
+    PUBLISH_RETRY_BASE, PUBLISH_RETRY_MAX_DELAY
 
 logger = logging.getLogger(__name__)
 
+_RSS_CHECK_SECONDS = 1800
+
 
 class Scheduler:
     def __init__(self, bot):
@@ -20,6 +35,7 @@ class Scheduler:
         self.bot = bot
         self.publisher = Publisher(bot)
         self.ai_processor = AIProcessor()
+        self._publish_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
         logger.info("Scheduler инициализирован")
 
     def start(self):
@@ -28,19 +44,23 @@ class Scheduler:
 
         self.scheduler.add_job(
             self.check_rss_sources,
-            IntervalTrigger(seconds=1800),
+            IntervalTrigger(seconds=_RSS_CHECK_SECONDS),
             id='rss_checker',
             replace_existing=True,
             max_instances=1
         )
         logger.info("Задача check_rss_sources добавлена в планировщик")
 
+        # Посты публикует таймер точно в scheduled_time; редкий полный проход подбирает всё,
+        # что таймер мог пропустить, и заново загружает его из БД (первый раз — сразу при старте)
+        publish_timer.start(self.publish_scheduled_posts)
         self.scheduler.add_job(
             self.publish_scheduled_posts,
-            IntervalTrigger(seconds=60),
+            IntervalTrigger(seconds=PUBLISH_RECONCILE_INTERVAL),
             id='post_publisher',
             replace_existing=True,
-            max_instances=1
+            max_instances=1,
+            next_run_time=datetime.now()
         )
         logger.info("Задача publish_scheduled_posts добавлена в планировщик")
 
@@ -52,177 +72,415 @@ class Scheduler:
         logger.info("=== НАЧАЛО ПРОВЕРКИ RSS-ИСТОЧНИКОВ ===")
         start_time = datetime.utcnow()
 
-        db = SessionLocal()
         try:
-            sources = get_active_sources(db)
-            logger.info(f"Найдено активных RSS-источников: {len(sources)}")
-
-            if not sources:
-                logger.info("Нет активных RSS-источников для проверки")
-                return
-
+            # Источник, проверенный любым воркером в этом интервале, повторно не берётся
+            checked_before = start_time - timedelta(seconds=_RSS_CHECK_SECONDS - 60)
+            seen = set()
             parser = RSSParser()
             async with parser:
-                processed_count = 0
-                for source in sources:
-                    try:
-                        logger.info(f"Проверка источника: {source.name} ({source.url})")
-                        entries = await parser.parse_feed(source.url, source.last_guid)
-
-                        if entries:
-                            logger.info(f"Найдено новых записей в {source.name}: {len(entries)}")
-                            await self._process_new_entries(entries, source, db)
-                            processed_count += len(entries)
-                        else:
-                            logger.debug(f"В источнике {source.name} нет новых записей")
-
-
-                        update_source_check(db, source.id, error=False)
-
-                    except Exception as e:
-                        logger.error(f"Ошибка при обработке источника {source.name}: {str(e)}", exc_info=True)
-                        update_source_check(db, source.id, error=True)
-
-                logger.info(f"Обработано новых записей всего: {processed_count}")
+                while True:
+                    # Сессия только на захват: во время конвейера соединение ей не нужно
+                    async with AsyncSessionLocal() as db:
+                        sources = await claim_sources(db, WORKER_ID, LEASE_TTL, checked_before, SOURCE_CLAIM_BATCH)
+                    if not sources or seen.issuperset(source.id for source in sources):
+                        break
+                    seen.update(source.id for source in sources)
+                    logger.info(f"Взято в работу RSS-источников: {len(sources)}")
+                    async with hold_leases(RSSSource, sources):
+                        await self._check_sources(sources, parser)
+
+            if not seen:
+                logger.info("Нет RSS-источников для проверки")
 
         except Exception as e:
             logger.critical(f"Критическая ошибка в check_rss_sources: {str(e)}", exc_info=True)
         finally:
-            db.close()
             execution_time = (datetime.utcnow() - start_time).total_seconds()
             logger.info(f"=== ПРОВЕРКА RSS-ИСТОЧНИКОВ ЗАВЕРШЕНА (время выполнения: {execution_time:.2f} сек) ===")
 
-    async def _process_new_entries(self, entries: List[Dict], source, db):
-
-        channel = source.channel
+    async def _check_sources(self, sources: List[RSSSource], parser: RSSParser):
+        """Конвейер по захваченным источникам: fetch -> parse -> select -> ai -> persist.
+
+        Записи ранжируются между всеми источниками канала, поэтому select ждёт, пока разобраны
+        все источники канала из пачки, а persist — пока AI обработал все отобранные записи канала,
+        и выделяет им время публикации одной записью в БД. Воркеры стадий работают одновременно,
+        поэтому каждый открывает свою сессию: AsyncSession нельзя делить между задачами.
+        """
+
+        loop = asyncio.get_running_loop()
+        sources_left = Counter(source.channel_id for source in sources)
+        entries_by_channel: Dict[int, List[Tuple[Dict, RSSSource]]] = defaultdict(list)
+        ai_left: Dict[int, int] = {}
+        processed_by_channel: Dict[int, List[Tuple[Dict, RSSSource, str, Optional[str]]]] = defaultdict(list)
+        channels: Dict[int, Channel] = {}
+        # Результаты проверки источников записываются одним коммитом после конвейера
+        checks: Dict[int, bool] = {}
+        found = Counter()
+
+        async def fetch(source: RSSSource):
+            logger.info(f"Проверка источника: {source.name} ({source.url})")
+            # Источник доходит до select при любой ошибке: иначе счётчик sources_left канала не обнулится
+            # и записи остальных источников канала пропадут
+            try:
+                data = await parser.fetch_feed(source.url)
+            except Exception as e:
+                logger.error(f"Ошибка загрузки источника {source.name}: {str(e)}")
+                data = None
+            return [(source, data)]
+
+        async def parse(item):
+            source, data = item
+            entries = []
+            checks[source.id] = False
+            try:
+                if data is None:
+                    raise ValueError("лента не загружена")
+                entries = await loop.run_in_executor(None, parser.parse_content, data, source.last_guid)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке источника {source.name}: {str(e)}")
+                checks[source.id] = True
+            return [(source, entries)]
+
+        async def select(item):
+            source, entries = item
+            if entries:
+                logger.info(f"Найдено новых записей в {source.name}: {len(entries)}")
+                found["entries"] += len(entries)
+            else:
+                logger.debug(f"В источнике {source.name} нет новых записей")
+
+            channel_id = source.channel_id
+            entries_by_channel[channel_id].extend((entry, source) for entry in entries)
+            sources_left[channel_id] -= 1
+            if sources_left[channel_id] or not entries_by_channel[channel_id]:
+                return []
+
+            channel = source.channel
+            async with AsyncSessionLocal() as db:
+                selected = await self._select_entries(entries_by_channel.pop(channel_id), db)
+            if selected:
+                channels[channel_id] = channel
+                ai_left[channel_id] = len(selected)
+            return [(channel, profile, entry, source) for profile, entry, source in selected]
+
+        async def rewrite(item):
+            channel, profile, entry, source = item
+            return [(channel.id, await self._rewrite_entry(channel, profile, entry, source))]
+
+        async def persist(item):
+            channel_id, result = item
+            if result:
+                processed_by_channel[channel_id].append(result)
+            ai_left[channel_id] -= 1
+            if ai_left[channel_id]:
+                return []
+            del ai_left[channel_id]
+            async with AsyncSessionLocal() as db:
+                await self._persist_entries(channels.pop(channel_id), processed_by_channel.pop(channel_id, []), db)
+            return []
+
+        await Pipeline(
+            Stage("fetch", fetch, FETCH_CONCURRENCY, PIPELINE_QUEUE_SIZE),
+            Stage("parse", parse, PARSE_CONCURRENCY, PIPELINE_QUEUE_SIZE),
+            Stage("select", select, 1, PIPELINE_QUEUE_SIZE),
+            Stage("ai", rewrite, AI_CONCURRENCY, PIPELINE_QUEUE_SIZE),
+            Stage("persist", persist, 1, PIPELINE_QUEUE_SIZE),
+        ).run(sources)
+
+        async with AsyncSessionLocal() as db:
+            await bulk_update_source_checks(
+                db, [(source.id, source.lease_token, checks[source.id]) for source in sources if source.id in checks])
+
+        logger.info(f"Найдено новых записей всего: {found['entries']}")
+
+    async def _select_entries(self, items: List[Tuple[Dict, RSSSource]], db) -> List[Tuple[dict, Dict, RSSSource]]:
+        """Фильтры, дедупликация и ранжирование записей канала; возвращает, что отправить в AI."""
+
+        channel = items[0][1].channel
         if not channel.is_active:
             logger.info(f"Канал {channel.channel_name} неактивен, пропускаем обработку")
-            return
+            return []
 
-        for entry in entries[:2]:
-            try:
+        profile = await get_topic_profile(db, channel)
 
-                if not entry.get('media'):
-                    logger.warning(f"Запись '{entry.get('title', '')}' пропущена: нет медиа")
-                    continue
+        entry_filter = get_channel_filter(channel.id, (channel.settings or {}).get("filters"))
+        if not entry_filter.is_empty:
+            kept = []
+            for entry, source in items:
+                reason = entry_filter.check(entry, source.url)
+                if reason:
+                    logger.info(f"Запись '{entry.get('title', '')}' отфильтрована: {reason}")
+                else:
+                    kept.append((entry, source))
+            logger.info(
+                f"Фильтры канала {channel.channel_name}: пропущено {len(kept)} из {len(items)} "
+                f"(всего {dict(entry_filter.stats)})")
+            items = kept
+
+        # Дубликаты отсекаем до ранжирования и AI, одним запросом на канал
+        items = [(entry, source) for entry, source in items if entry.get('media')]
+        hashes = [generate_post_hash(entry['title'] + " " + entry['content']) for entry, _ in items]
+        existing = await get_existing_hashes(db, channel.id, hashes)
+        candidates = []
+        seen = set()
+        for (entry, source), post_hash in zip(items, hashes):
+            if post_hash in existing or post_hash in seen:
+                logger.debug(f"Дубликат пропущен до обработки: {entry.get('title', '')}")
+                continue
+            seen.add(post_hash)
+            candidates.append((entry, source))
+
+        if not candidates:
+            logger.info(f"Для канала {channel.channel_name} нет новых записей после проверки дубликатов")
+            return []
+
+        history = await get_recent_post_texts(db, channel.id, RELEVANCE_HISTORY_SIZE)
+        top = rank_indices([entry for entry, _ in candidates], profile["topic"], history, MAX_AI_ENTRIES_PER_CHANNEL)
+        logger.info(
+            f"Канал {channel.channel_name}: из {len(candidates)} записей в AI отправляется {len(top)} самых релевантных")
+        return [(profile, *candidates[index]) for index in top]
 
-                logger.info(f"Обработка записи: {entry.get('title', '')}")
+    async def _rewrite_entry(self, channel: Channel, profile: dict, entry: Dict,
+                             source: RSSSource) -> Optional[Tuple[Dict, RSSSource, str, Optional[str]]]:
+        try:
+            logger.info(f"Обработка записи: {entry.get('title', '')}")
 
-                # обработка контента с помощью AI
-                processed_content = await self.ai_processor.process_content(
+            # обработка контента с помощью AI; картинка тем временем скачивается и готовится к отправке
+            processed_content, image_digest = await asyncio.gather(
+                self.ai_processor.process_content(
                     entry,
                     {
+                        'channel_id': channel.id,
                         'ai_model': channel.ai_model,
-                        'ai_prompt': channel.ai_prompt,
-                        'topic': channel.topic
+                        'profile': profile
                     }
-                )
-
-                logger.debug(f"Обработанный контент: {processed_content[:100]}...")
+                ),
+                self.publisher.prepare_image(entry.get('media'))
+            )
 
-                # проверка на дубликаты
-                post_hash = generate_post_hash(entry['title'] + " " + entry['content'])
-                existing_post = db.query(Post).filter(
-                    Post.channel_id == channel.id,
-                    Post.hash == post_hash
-                ).first()
+            logger.debug(f"Обработанный контент: {processed_content[:100]}...")
+            return entry, source, processed_content, image_digest
 
-                if existing_post:
-                    logger.info(f"Дубликат поста обнаружен и пропущен: {entry.get('title', '')}")
-                    continue
+        except Exception as e:
+            logger.error(f"Ошибка при обработке записи '{entry.get('title', '')}': {str(e)}", exc_info=True)
+            return None
+
+    async def _persist_entries(self, channel: Channel, processed: List[Tuple[Dict, RSSSource, str, Optional[str]]],
+                               db):
+
+        # Время публикации выделяется сразу на всю пачку (без дубликатов), а посты сохраняются одним коммитом
+        new_posts = await create_scheduled_posts(db, channel.id, [
+            {
+                'source_url': source.url,
+                'title': entry['title'],
+                'content': entry['content'],
+                'processed': processed_content,
+                'media': entry.get('media', []),
+                'image_digest': image_digest
+            }
+            for entry, source, processed_content, image_digest in processed
+        ])
+
+        for new_post in new_posts:
+            publish_timer.schedule(channel.id, new_post.scheduled_time)
+            logger.info(
+                f"Создан пост ID {new_post.id} для канала {channel.channel_name}, "
+                f"запланирован на {new_post.scheduled_time}")
+        if len(new_posts) < len(processed):
+            logger.warning(f"Не создано постов (дубликаты или ошибки записи): {len(processed) - len(new_posts)}")
 
+    async def publish_scheduled_posts(self, channel_id: Optional[int] = None):
+        """Публикует наступившие посты одного канала (по таймеру) или всех каналов (полный проход)."""
 
-                last_post = db.query(Post).filter(
-                    Post.channel_id == channel.id
-                ).order_by(Post.scheduled_time.desc()).first()
+        logger.info("=== НАЧАЛО ПУБЛИКАЦИИ ЗАПЛАНИРОВАННЫХ ПОСТОВ ===")
+        start_time = datetime.utcnow()
+        # Каналы, чей проход упал; None — упал весь проход
+        failed_channels: Optional[Set[int]] = set()
 
-                if last_post and last_post.scheduled_time > datetime.utcnow():
-                    next_time = last_post.scheduled_time + timedelta(seconds=channel.post_interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                if channel_id is None:
+                    now = datetime.utcnow()
+                    channel_ids = [cid for cid, due in (await get_next_pending_times(db)).items() if due <= now]
                 else:
-                    next_time = datetime.utcnow() + timedelta(minutes=5)
-
+                    channel_ids = [channel_id]
+                # Наступившие посты всех каналов захватываются одним запросом вместе с каналами
+                by_channel = await claim_pending_posts(db, WORKER_ID, LEASE_TTL, channel_ids) if channel_ids else {}
 
-                new_post = create_post(
-                    db, channel.id, source.url,
-                    entry['title'], entry['content'],
-                    processed_content, entry.get('media', []),
-                    next_time
-                )
+            # Каналы публикуются параллельно, посты внутри канала — по порядку; темп задаёт telegram_limiter
+            slots = asyncio.Semaphore(PUBLISH_CONCURRENCY)
 
-                if new_post:
-                    logger.info(
-                        f"Создан пост ID {new_post.id} для канала {channel.channel_name}, запланирован на {next_time}")
-                else:
-                    logger.warning("Не удалось создать пост (возможно, дубликат)")
+            async def run(cid: int, posts: List[Post]) -> Tuple[int, int]:
+                # Ошибка одного канала не прерывает остальные: общая аренда ниже освобождается,
+                # только когда закончили все каналы
+                try:
+                    # Таймер и полный проход могут сработать для канала одновременно; у каждого канала своя сессия
+                    async with slots, self._publish_locks[cid], AsyncSessionLocal() as channel_db:
+                        logger.info(f"Найдено постов для публикации в канале {cid}: {len(posts)}")
+                        return await self._publish_channel_posts(posts, channel_db)
+                except Exception as e:
+                    logger.error(f"Ошибка публикации постов канала {cid}: {str(e)}", exc_info=True)
+                    failed_channels.add(cid)
+                    return 0, len(posts)
 
-            except Exception as e:
-                logger.error(f"Ошибка при обработке записи '{entry.get('title', '')}': {str(e)}", exc_info=True)
-                continue
+            # Аренда продлевается для всех захваченных постов, в том числе ждущих своей очереди на slots
+            claimed = [post for posts in by_channel.values() for post in posts]
+            async with hold_leases(Post, claimed):
+                results = await asyncio.gather(*(run(cid, posts) for cid, posts in by_channel.items()))
+            published_count = sum(published for published, _ in results)
+            failed_count = sum(failed for _, failed in results)
 
-    async def publish_scheduled_posts(self):
+            logger.info(f"Публикация завершена: успешно {published_count}, неудачно {failed_count}")
 
-        logger.info("=== НАЧАЛО ПУБЛИКАЦИИ ЗАПЛАНИРОВАННЫХ ПОСТОВ ===")
-        start_time = datetime.utcnow()
+        except Exception as e:
+            logger.critical(f"Критическая ошибка в publish_scheduled_posts: {str(e)}", exc_info=True)
+            failed_channels = None if channel_id is None else {channel_id}
+        finally:
+            # Таймер взводится и после ошибки, иначе канал останется без следующего пробуждения
+            await self._rearm_publish_timer(channel_id, failed_channels)
+            execution_time = (datetime.utcnow() - start_time).total_seconds()
+            logger.info(
+                f"=== ПУБЛИКАЦИЯ ЗАПЛАНИРОВАННЫХ ПОСТОВ ЗАВЕРШЕНА (время выполнения: {execution_time:.2f} сек) ===")
 
-        db = SessionLocal()
+    @staticmethod
+    async def _rearm_publish_timer(channel_id: Optional[int], failed_channels: Optional[Set[int]]) -> None:
+        """Взводит таймер по БД; каналы failed_channels (None — все) будятся не раньше чем через
+        PUBLISH_RETRY_BASE: их посты остались наступившими, и таймер иначе срабатывал бы сразу же."""
         try:
-            posts = get_pending_posts(db)
-            logger.info(f"Найдено постов для публикации: {len(posts)}")
+            async with AsyncSessionLocal() as db:
+                next_times = await get_next_pending_times(db, None if channel_id is None else [channel_id])
+            retry_at = datetime.utcnow() + timedelta(seconds=PUBLISH_RETRY_BASE)
+            for cid, due in next_times.items():
+                if (failed_channels is None or cid in failed_channels) and due < retry_at:
+                    next_times[cid] = retry_at
+            publish_timer.replace(next_times, None if channel_id is None else [channel_id])
+        except Exception as e:
+            logger.error(f"Не удалось обновить таймер публикаций: {str(e)}", exc_info=True)
 
-            published_count = 0
-            failed_count = 0
+    async def _publish_channel_posts(self, posts: List[Post], db) -> Tuple[int, int]:
 
+        published_count = 0
+        failed_count = 0
+        channel = posts[0].channel
+        if not channel.is_active:
+            logger.info(f"Канал {channel.channel_name} неактивен, постов пропущено: {len(posts)}")
+            return 0, 0
+
+        if not channel.moderation_mode:
+            posts = await self._apply_catchup(channel, posts, db)
+
+        # Переходы статусов пишутся одним коммитом в конце; в обычной работе здесь один пост,
+        # так что после сбоя повторно отправленным может оказаться не больше пачки модерации
+        updates = []
+        try:
             for post in posts:
                 try:
-                    channel = post.channel
-                    if not channel.is_active:
-                        logger.info(f"Канал {channel.channel_name} неактивен, пост {post.id} пропущен")
-                        continue
-
                     logger.info(f"Публикация поста ID {post.id} в канал {channel.channel_name}")
 
                     if channel.moderation_mode:
                         logger.info(
                             f"Канал {channel.channel_name} в режиме модерации, пост {post.id} отправлен на модерацию")
-                        update_post_status(db, post.id, "moderation")
+                        updates.append((post.id, post.lease_token, post_status_values("moderation")))
                         continue
 
-
-                    message_id = await self.publisher.publish_post(
+                    result = await self.publisher.try_publish(
                         channel.channel_id,
                         post.processed_content,
-                        post.media_urls
+                        post.media_urls,
+                        post.image_digest,
+                        (channel.topic_profile or {}).get("category", "news")
                     )
 
-                    if message_id:
-                        update_post_status(db, post.id, "published", message_id)
+                    if result.message_id:
+                        updates.append((post.id, post.lease_token, post_status_values("published", result.message_id)))
                         published_count += 1
-                        logger.info(f"Пост {post.id} успешно опубликован с message_id={message_id}")
-                    else:
-                        update_post_status(db, post.id, "failed")
-                        failed_count += 1
-                        logger.error(f"Не удалось опубликовать пост {post.id}")
-
+                        logger.info(f"Пост {post.id} успешно опубликован с message_id={result.message_id}")
+                        continue
 
-                    await asyncio.sleep(2)
+                    failed_count += 1
+                    retry = self._retry_values(post, result)
+                    if retry:
+                        updates.append((post.id, post.lease_token, retry))
+                    else:
+                        updates.append((post.id, post.lease_token, post_status_values(
+                            "failed", error=f"{result.error_kind}: {result.error}")))
+                        logger.error(f"Не удалось опубликовать пост {post.id}: {result.error_kind}: {result.error}")
 
                 except Exception as e:
                     logger.error(f"Ошибка при публикации поста {post.id}: {str(e)}", exc_info=True)
-                    update_post_status(db, post.id, "failed")
+                    updates.append((post.id, post.lease_token, post_status_values("failed")))
                     failed_count += 1
-
-            logger.info(f"Публикация завершена: успешно {published_count}, неудачно {failed_count}")
-
-        except Exception as e:
-            logger.critical(f"Критическая ошибка в publish_scheduled_posts: {str(e)}", exc_info=True)
         finally:
-            db.close()
-            execution_time = (datetime.utcnow() - start_time).total_seconds()
+            # Отдельная сессия: откат неудачной пачки не должен сбросить загруженные посты и канал
+            async with AsyncSessionLocal() as write_db:
+                await bulk_update_post_status(write_db, updates)
+
+        return published_count, failed_count
+
+    @staticmethod
+    def _retry_values(post: Post, result: PublishResult) -> Optional[dict]:
+        """Откладывает пост после временной ошибки; None — ошибка постоянная или попытки кончились."""
+
+        attempts = (post.retry_count or 0) + 1
+        if result.error_kind != "retryable" or attempts >= PUBLISH_MAX_RETRIES:
+            return None
+        delay = min(PUBLISH_RETRY_BASE * 2 ** (attempts - 1), PUBLISH_RETRY_MAX_DELAY)
+        # Небольшой разброс, чтобы посты, упавшие вместе, не повторялись одновременно
+        delay = max(delay * random.uniform(0.9, 1.1), result.retry_after)
+        next_attempt = datetime.utcnow() + timedelta(seconds=delay)
+        logger.warning(
+            f"Пост {post.id} не опубликован ({result.error}), попытка {attempts} из {PUBLISH_MAX_RETRIES}, "
+            f"следующая в {next_attempt:%H:%M:%S}")
+        return post_retry_values(f"{result.error_kind}: {result.error}", next_attempt)
+
+    async def _apply_catchup(self, channel: Channel, posts: List[Post], db) -> List[Post]:
+        """Применяет политику канала к накопившимся постам; возвращает то, что публикуется сейчас."""
+
+        mode, max_age_hours = catchup_policy(channel.settings)
+        queue = await get_channel_queue(db, channel.id)
+        plan = plan_catchup(posts, queue, datetime.utcnow(), channel.post_interval, mode, max_age_hours)
+
+        async with AsyncSessionLocal() as write_db:
+            await bulk_update_post_status(
+                write_db, [(post.id, post.lease_token, post_status_values("expired")) for post in plan.expired])
+        if plan.expired:
+            logger.info(f"Канал {channel.channel_name}: отброшено устаревших постов: {len(plan.expired)}")
+
+        if plan.reschedule:
+            # Перенос — по lease_token, прочитанному вместе с постом: захваченные с тех пор посты не трогаем
+            tokens = {post.id: post.lease_token for post in queue}
+            tokens.update((post.id, post.lease_token) for post in posts)
+            await reschedule_posts(db, channel.id, [(post_id, tokens.get(post_id), scheduled)
+                                                    for post_id, scheduled in plan.reschedule.items()],
+                                   channel.post_interval)
             logger.info(
-                f"=== ПУБЛИКАЦИЯ ЗАПЛАНИРОВАННЫХ ПОСТОВ ЗАВЕРШЕНА (время выполнения: {execution_time:.2f} сек) ===")
+                f"Канал {channel.channel_name}: накопившиеся посты распределены по интервалу, "
+                f"перенесено {len(plan.reschedule)}")
+
+        if plan.digest:
+            profile = await get_topic_profile(db, channel)
+            # Заголовок обработанного поста уже переведён и очищен, исходный — запасной вариант
+            content = format_digest([post_title(post.processed_content) or post.original_title or ""
+                                     for post in plan.digest], pick_emoji(profile), pick_hashtags(profile))
+            result = await self.publisher.try_publish(channel.channel_id, content, category=profile["category"])
+            if result.message_id:
+                updates = [(post.id, post.lease_token, post_status_values("digest", result.message_id))
+                           for post in plan.digest]
+                logger.info(f"Канал {channel.channel_name}: {len(plan.digest)} постов сведены в дайджест")
+            else:
+                # Как и одиночные посты: временная ошибка откладывает весь дайджест, постоянная — завершает
+                updates = [(post.id, post.lease_token, self._retry_values(post, result) or post_status_values(
+                    "failed", error=f"{result.error_kind}: {result.error}")) for post in plan.digest]
+                logger.error(f"Канал {channel.channel_name}: дайджест из {len(plan.digest)} постов не опубликован: "
+                             f"{result.error_kind}: {result.error}")
+            async with AsyncSessionLocal() as write_db:
+                await bulk_update_post_status(write_db, updates)
+
+        return plan.publish_now
 
     def stop(self):
 
         logger.info("Остановка планировщика задач")
+        publish_timer.stop()
         self.scheduler.shutdown()
         logger.info("Планировщик остановлен")
\ No newline at end of file
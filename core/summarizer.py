@@ -0,0 +1,48 @@
+import re
+from collections import Counter
+from typing import List
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?…])\s+')
+_WORD = re.compile(r'[a-zа-яё0-9]{3,}')
+
+_STOP_WORDS = frozenset((
+    "это", "как", "так", "что", "чтобы", "для", "его", "она", "они", "оно", "был", "была", "были", "было",
+    "при", "над", "под", "без", "или", "уже", "еще", "ещё", "также", "этот", "эта", "эти", "того", "тем",
+    "который", "которая", "которые", "которых", "после", "более", "может", "будет", "сообщает", "заявил",
+    "the", "and", "for", "that", "with", "this", "from", "are", "was", "were", "has", "have", "will",
+))
+
+
+def split_sentences(text: str) -> List[str]:
+
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+def summarize(text: str, max_sentences: int = 3, min_length: int = 30) -> List[str]:
+    """Извлекающее резюме: предложения с самыми частотными словами текста, в исходном порядке.
+
+    Работает локально и детерминированно, поэтому годится как резерв, когда LLM недоступна.
+    """
+
+    sentences = [s for s in split_sentences(text) if len(s) >= min_length]
+    if len(sentences) <= max_sentences:
+        return sentences
+
+    tokenized = [[w for w in _WORD.findall(s.lower()) if w not in _STOP_WORDS] for s in sentences]
+    frequencies = Counter(w for words in tokenized for w in words)
+    if not frequencies:
+        return sentences[:max_sentences]
+    top = frequencies.most_common(1)[0][1]
+
+    scores = []
+    for position, words in enumerate(tokenized):
+        if not words:
+            scores.append(0.0)
+            continue
+        score = sum(frequencies[w] for w in set(words)) / top / len(words) ** 0.5
+        # Новости пишутся «перевёрнутой пирамидой»: начало текста важнее
+        score *= 1.0 + 1.0 / (position + 1)
+        scores.append(score)
+
+    best = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)[:max_sentences]
+    return [sentences[i] for i in sorted(best)]
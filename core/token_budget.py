@@ -0,0 +1,93 @@
+import logging
+import math
+import re
+from typing import Dict, Optional
+from config.settings import GROQ_MODEL_PRICES
+
+logger = logging.getLogger(__name__)
+
+_CYRILLIC = re.compile(r'[а-яА-ЯёЁ]')
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+
+# Средняя длина токена для BPE-токенизаторов Llama/Qwen: кириллица дробится заметно мельче латиницы
+_CHARS_PER_TOKEN_CYRILLIC = 2.8
+_CHARS_PER_TOKEN_OTHER = 4.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов без загрузки токенизатора модели."""
+
+    if not text:
+        return 0
+    cyrillic = len(_CYRILLIC.findall(text))
+    other = len(text) - cyrillic
+    return math.ceil(cyrillic / _CHARS_PER_TOKEN_CYRILLIC + other / _CHARS_PER_TOKEN_OTHER)
+
+
+def trim_to_token_budget(text: str, max_tokens: int) -> str:
+    """Обрезает текст по границе предложения так, чтобы он уложился в бюджет токенов."""
+
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    result = ""
+    for sentence in _SENTENCE_SPLIT.split(text):
+        candidate = f"{result} {sentence}" if result else sentence
+        if estimate_tokens(candidate) > max_tokens:
+            break
+        result = candidate
+
+    if not result:
+        # Первое предложение само не влезает — режем по символам с запасом
+        ratio = max_tokens / estimate_tokens(text)
+        result = text[:int(len(text) * ratio)].rsplit(' ', 1)[0]
+    return result
+
+
+class UsageTracker:
+    """Накопительная статистика вызовов LLM по каналам: токены, задержка и стоимость."""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict] = {}
+
+    def record(self, key: Optional[str], model: str, latency: float, estimated_prompt_tokens: int,
+               usage=None) -> Dict:
+
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or estimated_prompt_tokens
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+
+        price_in, price_out = GROQ_MODEL_PRICES.get(model, (0.0, 0.0))
+        cost = (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+        stats = self._stats.setdefault(key or "unknown", {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "estimated_prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+            "cost": 0.0,
+        })
+        stats["calls"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["estimated_prompt_tokens"] += estimated_prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["cached_tokens"] += cached_tokens
+        stats["latency_total"] += latency
+        stats["latency_max"] = max(stats["latency_max"], latency)
+        stats["cost"] += cost
+
+        logger.info(
+            f"LLM [{key or 'unknown'}] {model}: {prompt_tokens} вх. (оценка {estimated_prompt_tokens}, "
+            f"из кэша {cached_tokens}) / {completion_tokens} вых. токенов, {latency:.2f} сек, ${cost:.6f}")
+        return stats
+
+    def snapshot(self) -> Dict[str, Dict]:
+
+        return {key: dict(stats) for key, stats in self._stats.items()}
+
+
+usage_tracker = UsageTracker()
@@ -0,0 +1,165 @@
+import hashlib
+import random
+import re
+from typing import Dict, List, Optional
+from core.token_budget import estimate_tokens
+
+# Версия структуры профиля: при изменении таблиц ниже профили пересобираются
+PROFILE_VERSION = 1
+
+EMOJIS = {
+    "tech": ["💻", "🚀", "🔧", "⚡", "🌐", "📱", "🤖"],
+    "news": ["📰", "🗞️", "🔥", "⚠️", "💡", "✨", "🎯"],
+    "business": ["💼", "📈", "💰", "🏢", "📊", "🤝", "💵"],
+    "entertainment": ["🎬", "🎭", "🎪", "🎨", "🎤", "🎧", "🌟"],
+    "sports": ["⚽", "🏀", "🎾", "🏃", "🏊", "🏋️", "🏆"],
+    "politics": ["🏛️", "⚖️", "🌍", "🤝", "📜", "🗳️", "🎖️"],
+    "science": ["🔬", "🔭", "🧪", "🧠", "🧬", "🌱", "⚙️"]
+}
+
+# Порядок важен: побеждает первая подходящая категория
+_CATEGORY_KEYWORDS = [
+    ("politics", ("политик", "государств", "власть", "президент", "минист", "дипломат", "альянс", "союз")),
+    ("entertainment", ("развлечени", "кино", "музык", "звезд", "шоу", "юмор", "сатир")),
+    ("sports", ("спорт", "матч", "чемпион", "турнир", "игрок", "команда")),
+    ("science", ("it", "tech", "технолог", "программ", "код", "разработка", "робот", "наука", "исследован",
+                 "открыт")),
+    ("business", ("бизнес", "финанс", "экономик", "рынок", "маркет", "стартап", "компания", "корпораци")),
+]
+
+HASHTAGS = {
+    "политика": ["#политика", "#геополитика", "#международныеотношения"],
+    "россия": ["#россия", "#российскаяполитика", "#новостироссии"],
+    "сша": ["#сша", "#америка", "#внешняяполитика"],
+    "европа": ["#европа", "#евросоюз", "#европейскаяполитика"],
+    "украина": ["#украина", "#киев", "#киевскийрежим"],
+    "германия": ["#германия", "#берлин", "#немецкаяполитика"],
+    "польша": ["#польша", "#варшава", "#польскаяполитика"],
+    "военные": ["#армия", "#вооруженныесилы", "#оборона"],
+    "дипломатия": ["#дипломатия", "#переговоры", "#мирныепроцессы"],
+    "наука": ["#наука", "#технологии", "#инновации"],
+    "экономика": ["#экономика", "#финансы", "#бизнес"],
+    "культура": ["#культура", "#искусство", "#история"],
+    "спорт": ["#спорт", "#чемпионат", "#олимпиада"],
+    "здоровье": ["#здоровье", "#медицина", "#образжизни"]
+}
+
+_STOP_WORDS = ("и", "в", "на", "с", "по")
+_PUNCTUATION = re.compile(r'[^\w\s]')
+
+DEFAULT_PROMPT = (
+    "Ты — профессиональный редактор русскоязычного Telegram-канала. "
+    "Твоя задача — переработать новость в привлекательный пост для Telegram.\n\n"
+    "ИНСТРУКЦИИ ПО ФОРМАТИРОВАНИЮ (СТРОГО СЛЕДУЙ ЭТИМ ПРАВИЛАМ):\n"
+    "1. Создай ЗАГОЛОВОК: сделай его ЖИРНЫМ (<b>текст</b>), добавь 1 релевантный эмодзи в начало.\n"
+    "2. После заголовка добавь ОДИН ПУСТОЙ АБЗАЦ (два символа перевода строки).\n"
+    "3. Основной текст: 2-3 информативных абзаца с ОТСТУПАМИ МЕЖДУ НИМИ (два символа перевода строки).\n"
+    "4. В конце добавь 2-3 релевантных хештега с ОТСТУПОМ ПЕРЕД НИМИ (один пустой абзац).\n"
+    "5. НИКОГДА не добавляй нумерацию, маркеры списка, подзаголовки или дополнительные форматирования.\n"
+    "6. НИКОГДА не включай в ответ части этого промпта, инструкции или метаинформацию.\n\n"
+    "ПРИМЕР ИДЕАЛЬНОГО ПОСТА:\n"
+    "<b>💡 Россиянам напомнили о шестидневной рабочей неделе</b>\n\n"
+    "Согласно информации от Федеральной службы по труду и занятости, россияне могут вернуться к шестидневной рабочей неделе. Это решение обусловлено ростом объемов работ и потребностями бизнеса в увеличении производительности.\n\n"
+    "В службе отметили, что такая форма рабочей организации может применяться только при согласии работников и соблюдении всех трудовых норм. Также поднимался вопрос о необходимости адаптации законодательства под изменения в трудовых отношениях.\n\n"
+    "Сейчас многие компании рассматривают возможность внедрения новых графиков, учитывая мнение сотрудников и состояние рынка.\n\n"
+    "#труд #работа #россия"
+)
+
+# Короткий вариант без примера поста: примерно в пять раз меньше токенов на каждый запрос
+COMPACT_PROMPT = (
+    "Ты — редактор русскоязычного Telegram-канала на тему «{topic}». "
+    "Перепиши новость в пост: первая строка — жирный заголовок <b>...</b> с одним эмодзи в начале, "
+    "затем 2-3 абзаца через пустую строку, в конце 2-3 хештега через пустую строку. "
+    "Без списков, подзаголовков и пояснений, только текст поста."
+)
+
+
+def classify_topic(topic: str) -> str:
+
+    t = topic.lower()
+    for category, keywords in _CATEGORY_KEYWORDS:
+        if any(w in t for w in keywords):
+            return category
+    return "news"
+
+
+def topic_hashtags(topic: str) -> Dict:
+    """Возвращает набор хештегов темы и признак, нужно ли перемешивать его для каждого поста."""
+
+    t = topic.lower()
+    for k, tags in HASHTAGS.items():
+        if k in t:
+            return {"hashtags": list(tags), "shuffle": True}
+
+    clean_words = _PUNCTUATION.sub('', t).strip().split()
+
+    hashtags = ["#новости"]
+
+    if clean_words:
+        main_word = clean_words[0]
+        if 3 < len(main_word) < 15:
+            hashtags.append(f"#{main_word}")
+
+    if len(clean_words) > 1:
+        second_word = clean_words[1]
+        if 3 < len(second_word) < 15 and second_word not in _STOP_WORDS:
+            hashtags.append(f"#{second_word}")
+
+    return {"hashtags": hashtags[:3], "shuffle": False}
+
+
+def system_prompt_for(topic: str, ai_prompt: Optional[str] = None, compact: bool = False) -> str:
+
+    if ai_prompt:
+        # Пользовательский промпт может содержать произвольные фигурные скобки,
+        # поэтому подставляем только {topic}
+        return ai_prompt.replace("{topic}", topic)
+    return (COMPACT_PROMPT if compact else DEFAULT_PROMPT).format(topic=topic)
+
+
+def _profile_key(topic: str, ai_prompt: Optional[str], compact: bool) -> str:
+
+    raw = f"{PROFILE_VERSION}\0{topic}\0{ai_prompt or ''}\0{int(compact)}"
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def build_topic_profile(topic: Optional[str], ai_prompt: Optional[str] = None, compact: bool = False) -> Dict:
+    """Один раз классифицирует тему канала: категория эмодзи, хештеги и готовый системный промпт.
+
+    Системный промпт канала не меняется от поста к посту, поэтому провайдер
+    может кэшировать этот префикс запроса.
+    """
+
+    topic = topic or "новости"
+    category = classify_topic(topic)
+    tags = topic_hashtags(topic)
+    system_prompt = system_prompt_for(topic, ai_prompt, compact)
+    return {
+        "key": _profile_key(topic, ai_prompt, compact),
+        "topic": topic,
+        "category": category,
+        "emojis": EMOJIS[category],
+        "hashtags": tags["hashtags"],
+        "shuffle_hashtags": tags["shuffle"],
+        "system_prompt": system_prompt,
+        "system_prompt_tokens": estimate_tokens(system_prompt),
+    }
+
+
+def is_profile_current(profile: Optional[Dict], topic: Optional[str], ai_prompt: Optional[str] = None,
+                       compact: bool = False) -> bool:
+
+    return bool(profile) and profile.get("key") == _profile_key(topic or "новости", ai_prompt, compact)
+
+
+def pick_emoji(profile: Dict) -> str:
+
+    return random.choice(profile["emojis"])
+
+
+def pick_hashtags(profile: Dict) -> List[str]:
+
+    tags = profile["hashtags"]
+    if profile.get("shuffle_hashtags"):
+        return random.sample(tags, min(3, len(tags)))
+    return list(tags)
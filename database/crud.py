@@ -1,71 +1,93 @@
-from sqlalchemy.orm import Session
-from database.models import User, Channel, RSSSource, Post, SessionLocal
+import logging
+from sqlalchemy import Boolean, and_, bindparam, case, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, load_only
+from sqlalchemy.orm.attributes import set_committed_value
+from database.models import User, Channel, RSSSource, Post, MediaFile, AsyncSessionLocal
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 from utils.helpers import generate_post_hash
+from core.topic_profile import build_topic_profile, is_profile_current
 
+logger = logging.getLogger(__name__)
 
-def get_db():
-    db = SessionLocal()
-    try:
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def get_or_create_user(db: Session, telegram_id: int, username: str = None):
-    user = db.query(User).filter(User.telegram_id == telegram_id).first()
+async def get_or_create_user(db: AsyncSession, telegram_id: int, username: str = None):
+    user = await db.scalar(select(User).where(User.telegram_id == telegram_id))
     if not user:
         user = User(telegram_id=telegram_id, username=username)
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
     return user
 
 
-def create_channel(db: Session, user_id: int, channel_id: str, channel_name: str, topic: str):
+async def create_channel(db: AsyncSession, user_id: int, channel_id: str, channel_name: str, topic: str):
     channel = Channel(
         channel_id=channel_id,
         channel_name=channel_name,
         topic=topic,
-        owner_id=user_id
+        owner_id=user_id,
+        topic_profile=build_topic_profile(topic)
     )
     db.add(channel)
-    db.commit()
-    db.refresh(channel)
+    await db.commit()
+    await db.refresh(channel)
     return channel
 
 
-def get_user_channels(db: Session, user_id: int):
-    return db.query(Channel).filter(Channel.owner_id == user_id).all()
+def _build_channel_profile(channel: Channel) -> dict:
+    compact = bool((channel.settings or {}).get("compact_prompt"))
+    return build_topic_profile(channel.topic, channel.ai_prompt, compact)
+
+
+async def get_topic_profile(db: AsyncSession, channel: Channel) -> dict:
+    """Возвращает профиль темы канала, пересобирая его только если сменились тема или промпт."""
+    compact = bool((channel.settings or {}).get("compact_prompt"))
+    if not is_profile_current(channel.topic_profile, channel.topic, channel.ai_prompt, compact):
+        profile = _build_channel_profile(channel)
+        await db.execute(update(Channel).where(Channel.id == channel.id).values(topic_profile=profile))
+        await db.commit()
+        # Канал мог быть загружен другой сессией: обновляем значение, не помечая объект изменённым
+        set_committed_value(channel, "topic_profile", profile)
+    return channel.topic_profile
 
 
-def add_rss_source(db: Session, channel_id: int, url: str, name: str):
+async def get_user_channels(db: AsyncSession, user_id: int):
+    return (await db.scalars(select(Channel).where(Channel.owner_id == user_id))).all()
+
+
+async def add_rss_source(db: AsyncSession, channel_id: int, url: str, name: str):
     source = RSSSource(
         url=url,
         name=name,
         channel_id=channel_id
     )
     db.add(source)
-    db.commit()
-    db.refresh(source)
+    await db.commit()
+    await db.refresh(source)
     return source
 
 
-def get_active_sources(db: Session):
-    return db.query(RSSSource).filter(RSSSource.is_active == True).all()
+async def get_active_sources(db: AsyncSession):
+    return (await db.scalars(select(RSSSource).where(RSSSource.is_active == True))).all()
 
 
-def create_post(db: Session, channel_id: int, source_url: str, title: str, content: str, processed: str, media: list,
-                scheduled: datetime):
+async def create_post(db: AsyncSession, channel_id: int, source_url: str, title: str, content: str, processed: str,
+                      media: list, scheduled: datetime, image_digest: Optional[str] = None):
 
     post_hash = generate_post_hash(title + " " + content)
 
 
-    existing_post = db.query(Post).filter(
+    existing_post = await db.scalar(select(Post.id).where(
         Post.channel_id == channel_id,
         Post.hash == post_hash
-    ).first()
+    ).limit(1))
 
     if existing_post:
 
@@ -79,43 +101,454 @@ def create_post(db: Session, channel_id: int, source_url: str, title: str, conte
         processed_content=processed,
         media_urls=media,
         scheduled_time=scheduled,
-        hash=post_hash  # Сохраняем хэш
+        hash=post_hash,  # Сохраняем хэш
+        image_digest=image_digest
     )
     db.add(post)
-    db.commit()
-    db.refresh(post)
+    await db.commit()
+    await db.refresh(post)
     return post
 
 
-def get_pending_posts(db: Session):
+async def get_existing_hashes(db: AsyncSession, channel_id: int, hashes: List[str]) -> set:
+    if not hashes:
+        return set()
+    rows = await db.scalars(select(Post.hash).where(
+        Post.channel_id == channel_id,
+        Post.hash.in_(hashes)
+    ))
+    return set(rows)
+
+
+async def get_recent_post_texts(db: AsyncSession, channel_id: int, limit: int = 50) -> List[str]:
+    rows = await db.execute(select(Post.original_title, Post.original_content).where(
+        Post.channel_id == channel_id,
+        Post.status == "published"
+    ).order_by(Post.published_time.desc()).limit(limit))
+    return [f"{row.original_title or ''} {row.original_content or ''}" for row in rows]
+
+
+async def get_pending_posts(db: AsyncSession, channel_id: Optional[int] = None):
     now = datetime.utcnow()
-    return db.query(Post).filter(
+    query = select(Post).where(
+        Post.status == "pending",
+        Post.scheduled_time <= now,
+        attempt_due(now)
+    )
+    if channel_id is not None:
+        query = query.where(Post.channel_id == channel_id)
+    return (await db.scalars(query.order_by(Post.scheduled_time))).all()
+
+
+def post_due_time():
+    """Когда пост можно захватить: наступили и scheduled_time, и next_attempt_at (см. claim_pending_posts).
+
+    Догон может перенести scheduled_time позже next_attempt_at, поэтому срок — большее из двух:
+    прошедший next_attempt_at будил бы таймер снова и снова, хотя захватывать ещё нечего.
+    """
+    return case((Post.next_attempt_at > Post.scheduled_time, Post.next_attempt_at), else_=Post.scheduled_time)
+
+
+def next_pending_times_query(now: datetime, channel_ids: Optional[Iterable[int]] = None):
+    query = select(Post.channel_id, func.min(post_due_time())).join(Channel).where(
         Post.status == "pending",
-        Post.scheduled_time <= now
-    ).all()
+        Channel.is_active == True,
+        lease_free(Post, now)
+    )
+    if channel_ids is not None:
+        query = query.where(Post.channel_id.in_(list(channel_ids)))
+    return query.group_by(Post.channel_id)
+
+
+async def get_next_pending_times(db: AsyncSession,
+                                 channel_ids: Optional[Iterable[int]] = None) -> Dict[int, datetime]:
+    """Время ближайшего ожидающего поста для каждого активного канала."""
+    rows = await db.execute(next_pending_times_query(datetime.utcnow(), channel_ids))
+    return {channel_id: scheduled for channel_id, scheduled in rows if scheduled}
+
+
+async def allocate_post_slots(db: AsyncSession, channel_id: int, count: int = 1,
+                              first_delay: timedelta = timedelta(minutes=5)) -> List[datetime]:
+    """Выдаёт count времён публикации с шагом post_interval канала одной записью в БД.
+
+    next_slot_time обновляется сравнением-с-заменой: если параллельный обработчик успел
+    занять слоты раньше, UPDATE не затронет строк и выделение повторится с новым значением.
+    """
+    if count <= 0:
+        return []
+    while True:
+        current, interval = (await db.execute(select(Channel.next_slot_time, Channel.post_interval).where(
+            Channel.id == channel_id))).one()
+        start = datetime.utcnow() + first_delay
+        if current is None:
+            # Канал, созданный до появления next_slot_time: продолжаем его текущую очередь
+            last = await db.scalar(select(func.max(Post.scheduled_time)).where(Post.channel_id == channel_id))
+            if last and last > datetime.utcnow():
+                start = max(start, last + timedelta(seconds=interval))
+        else:
+            start = max(start, current)
+
+        slots = [start + timedelta(seconds=interval * i) for i in range(count)]
+        expected = Channel.next_slot_time.is_(None) if current is None else Channel.next_slot_time == current
+        result = await db.execute(
+            update(Channel)
+            .where(Channel.id == channel_id, expected)
+            .values(next_slot_time=start + timedelta(seconds=interval * count))
+        )
+        await db.commit()
+        if result.rowcount == 1:
+            return slots
+
+
+async def reschedule_posts(db: AsyncSession, channel_id: int, moves: Sequence[Tuple[int, Optional[int], datetime]],
+                           interval: int) -> None:
+    """Переносит посты канала на новое время и сдвигает next_slot_time за последний из них.
+
+    moves — тройки (post_id, lease_token, новое время); пост, который после чтения захватил
+    другой воркер (lease_token сменился), не переносится. interval — post_interval канала;
+    вызывающий код уже загрузил канал.
+    """
+    if not moves:
+        return
+    posts = Post.__table__
+    # Один executemany на все посты вместо UPDATE на каждый
+    await db.execute(
+        update(posts).where(posts.c.id == bindparam("post_id"), posts.c.status == "pending",
+                            func.coalesce(posts.c.lease_token, 0) == bindparam("token"))
+        .values(scheduled_time=bindparam("scheduled")),
+        [{"post_id": post_id, "token": token or 0, "scheduled": scheduled} for post_id, token, scheduled in moves]
+    )
+    after_last = max(scheduled for _, _, scheduled in moves) + timedelta(seconds=interval)
+    # Только вперёд: параллельный allocate_post_slots мог уже выдать более поздние слоты
+    await db.execute(
+        update(Channel)
+        .where(Channel.id == channel_id,
+               or_(Channel.next_slot_time.is_(None), Channel.next_slot_time < after_last))
+        .values(next_slot_time=after_last)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
 
 
-def get_channel_queue(db: Session, channel_id: int):
-    return db.query(Post).filter(
+def lease_free(model, now: datetime):
+    return or_(model.lease_expires_at.is_(None), model.lease_expires_at < now)
+
+
+def claim_query(model, now: datetime, *criteria, order_by=None, limit: Optional[int] = None):
+    """SELECT id свободных строк model под criteria — первый шаг claim_leases."""
+    query = select(model.id).where(lease_free(model, now), *criteria)
+    if order_by is not None:
+        query = query.order_by(order_by)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+async def claim_leases(db: AsyncSession, model, owner: str, ttl: int, *criteria, order_by=None,
+                       limit: Optional[int] = None, options: Sequence = ()):
+    """Атомарно берёт в аренду свободные строки model (RSSSource или Post), подходящие под criteria.
+
+    Захват — один UPDATE с повторной проверкой свободности, так что из нескольких воркеров
+    строку получает ровно один. Каждый захват увеличивает lease_token; по нему воркер, чья
+    аренда истекла и перешла другому, не сможет продлить её или записать результат.
+    options — опции загрузки захваченных строк (связи нужно загрузить сразу: ленивая загрузка
+    в асинхронной сессии невозможна).
+    """
+    now = datetime.utcnow()
+    expires = now + timedelta(seconds=ttl)
+    ids = (await db.scalars(claim_query(model, now, *criteria, order_by=order_by, limit=limit))).all()
+    if not ids:
+        return []
+
+    claim = (
+        update(model)
+        .where(model.id.in_(ids), lease_free(model, now))
+        .values(lease_owner=owner, lease_expires_at=expires, lease_token=func.coalesce(model.lease_token, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if db.bind.dialect.update_returning:
+        # Захваченные строки возвращает сам UPDATE (SQLite 3.35+, PostgreSQL)
+        ids = (await db.scalars(claim.returning(model.id))).all()
+        await db.commit()
+        mine = [model.id.in_(ids)]
+    else:
+        await db.execute(claim)
+        await db.commit()
+        # Без RETURNING свои строки узнаём по id из этого вызова, владельцу и сроку аренды
+        mine = [model.id.in_(ids), model.lease_owner == owner, model.lease_expires_at == expires]
+    if not ids:
+        return []
+    claimed = select(model).where(*mine).options(*options)
+    if order_by is not None:
+        claimed = claimed.order_by(order_by)
+    return (await db.scalars(claimed)).all()
+
+
+def _held_leases(model, owner: str, held: Sequence[Tuple[int, int]]):
+    return and_(
+        model.lease_owner == owner,
+        or_(*(and_(model.id == row_id, model.lease_token == token) for row_id, token in held))
+    )
+
+
+async def renew_leases(db: AsyncSession, model, owner: str, held: Sequence[Tuple[int, int]], ttl: int) -> int:
+    """Продлевает аренду строк held — пар (id, lease_token); возвращает, сколько продлено."""
+    if not held:
+        return 0
+    result = await db.execute(
+        update(model)
+        .where(_held_leases(model, owner, held))
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=ttl))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def release_leases(db: AsyncSession, model, owner: str, held: Sequence[Tuple[int, int]]) -> None:
+    if not held:
+        return
+    await db.execute(
+        update(model)
+        .where(_held_leases(model, owner, held))
+        .values(lease_owner=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+# Столбцы канала, которые читают проверка источников и публикация (настройки, профиль темы, AI);
+# канал подтягивается JOIN'ом в том же запросе, что и захваченные строки
+_CHANNEL_COLUMNS = (
+    Channel.id, Channel.channel_id, Channel.channel_name, Channel.topic, Channel.is_active, Channel.post_interval,
+    Channel.moderation_mode, Channel.ai_model, Channel.ai_prompt, Channel.settings, Channel.topic_profile,
+)
+# raiseload: обращение к незагруженному столбцу — сразу ошибка, а не скрытый SELECT на каждую строку
+_SOURCE_LOAD = (
+    load_only(RSSSource.id, RSSSource.url, RSSSource.name, RSSSource.channel_id, RSSSource.last_guid,
+              RSSSource.lease_token, raiseload=True),
+    joinedload(RSSSource.channel).load_only(*_CHANNEL_COLUMNS, raiseload=True),
+)
+# Исходный текст, хэш и служебные поля публикации не нужны: пост отправляется из processed_content
+_POST_LOAD = (
+    load_only(Post.id, Post.channel_id, Post.original_title, Post.processed_content, Post.media_urls,
+              Post.image_digest, Post.scheduled_time, Post.retry_count, Post.lease_token, raiseload=True),
+    joinedload(Post.channel).load_only(*_CHANNEL_COLUMNS, raiseload=True),
+)
+
+
+def stale_sources_criteria(checked_before: datetime) -> list:
+    return [
+        RSSSource.is_active == True,
+        or_(RSSSource.last_checked.is_(None), RSSSource.last_checked < checked_before),
+    ]
+
+
+def due_posts_criteria(now: datetime, channel_ids: Optional[Iterable[int]] = None) -> list:
+    criteria = [Post.status == "pending", Post.scheduled_time <= now, attempt_due(now)]
+    if channel_ids is not None:
+        criteria.append(Post.channel_id.in_(list(channel_ids)))
+    return criteria
+
+
+async def claim_sources(db: AsyncSession, owner: str, ttl: int, checked_before: datetime, limit: int):
+    """Берёт в аренду активные источники, которые никто не проверял после checked_before."""
+    return await claim_leases(
+        db, RSSSource, owner, ttl,
+        *stale_sources_criteria(checked_before),
+        order_by=RSSSource.id,
+        limit=limit,
+        options=_SOURCE_LOAD
+    )
+
+
+async def claim_pending_posts(db: AsyncSession, owner: str, ttl: int,
+                              channel_ids: Optional[Iterable[int]] = None) -> Dict[int, List[Post]]:
+    """Берёт в аренду наступившие посты каналов channel_ids (всех каналов, если None) одним запросом.
+
+    Посты, арендованные другим воркером, пропускаются. Возвращает посты, сгруппированные
+    по каналу, каждая группа — по возрастанию scheduled_time.
+    """
+    posts = await claim_leases(db, Post, owner, ttl, *due_posts_criteria(datetime.utcnow(), channel_ids),
+                               order_by=Post.scheduled_time, options=_POST_LOAD)
+    by_channel: Dict[int, List[Post]] = {}
+    for post in posts:
+        by_channel.setdefault(post.channel_id, []).append(post)
+    return by_channel
+
+
+async def count_pending_posts(db: AsyncSession) -> Dict[str, int]:
+    """Число ожидающих публикации постов по каналам (ключ — channel_id в Telegram)."""
+    rows = await db.execute(select(Channel.channel_id, func.count(Post.id)).join(Post).where(
+        Post.status == "pending"
+    ).group_by(Channel.channel_id))
+    return dict(rows.all())
+
+
+async def get_channel_queue(db: AsyncSession, channel_id: int):
+    # Очереди (меню и планированию догона) нужны только время и заголовок, не тексты постов
+    return (await db.scalars(select(Post).where(
         Post.channel_id == channel_id,
         Post.status == "pending"
-    ).order_by(Post.scheduled_time).all()
+    ).order_by(Post.scheduled_time).options(
+        load_only(Post.id, Post.channel_id, Post.original_title, Post.scheduled_time, Post.lease_token,
+                  raiseload=True)
+    ))).all()
+
 
+def attempt_due(now: datetime):
+    return or_(Post.next_attempt_at.is_(None), Post.next_attempt_at <= now)
 
-def update_post_status(db: Session, post_id: int, status: str, message_id: int = None):
-    post = db.query(Post).filter(Post.id == post_id).first()
+
+async def _commit_batch(db: AsyncSession, items: Sequence, apply: Callable[[Any], Awaitable[Any]]) -> List:
+    """Применяет apply к каждому элементу и фиксирует всё одним коммитом.
+
+    Если пачка не проходит целиком, она откатывается и повторяется по одному элементу
+    с отдельным коммитом: сбойный элемент не мешает остальным. Точки сохранения не
+    используются — драйвер sqlite3 сам управляет транзакциями и ломает их вложенность.
+    Откат сбрасывает все объекты сессии, поэтому пакетные функции стоит вызывать с сессией,
+    объекты которой дальше не читаются. Возвращает результаты apply для записанных элементов.
+    """
+    if not items:
+        return []
+    try:
+        results = [await apply(item) for item in items]
+        await db.commit()
+        return results
+    except Exception as e:
+        await db.rollback()
+        logger.warning(f"Пакетная запись ({len(items)} шт.) не удалась, повтор по одному: {str(e)}")
+
+    applied = []
+    for item in items:
+        try:
+            result = await apply(item)
+            await db.commit()
+            # Записанное отсоединяем, чтобы откат следующего элемента не сбросил его атрибуты
+            db.expunge_all()
+            applied.append(result)
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Не удалось записать {item!r}: {str(e)}")
+    return applied
+
+
+async def _fresh_entries(db: AsyncSession, channel_id: int, entries: Sequence[dict]) -> List[Tuple[dict, str]]:
+    """Пары (запись, хэш) без дубликатов — уже сохранённых в канале и повторов внутри пачки."""
+    hashes = [generate_post_hash(entry["title"] + " " + entry["content"]) for entry in entries]
+    seen = await get_existing_hashes(db, channel_id, hashes)
+    fresh = []
+    for entry, post_hash in zip(entries, hashes):
+        if post_hash not in seen:
+            seen.add(post_hash)
+            fresh.append((entry, post_hash))
+    return fresh
+
+
+async def bulk_create_posts(db: AsyncSession, channel_id: int, entries: Sequence[dict]) -> List[Post]:
+    """Создаёт посты канала одним коммитом; дубликаты (по хэшу, в БД и внутри пачки) пропускаются.
+
+    entries — словари с ключами аргументов create_post: source_url, title, content, processed,
+    media, scheduled и необязательным image_digest.
+    """
+    return await _insert_posts(db, channel_id, await _fresh_entries(db, channel_id, entries))
+
+
+async def create_scheduled_posts(db: AsyncSession, channel_id: int, entries: Sequence[dict]) -> List[Post]:
+    """Как bulk_create_posts, но scheduled не передаётся: время выдаёт allocate_post_slots.
+
+    Слоты выделяются после отсева дубликатов, так что пропущенная запись не оставляет
+    в расписании канала пустого интервала и не сдвигает next_slot_time.
+    """
+    fresh = await _fresh_entries(db, channel_id, entries)
+    slots = await allocate_post_slots(db, channel_id, len(fresh))
+    return await _insert_posts(db, channel_id, [
+        ({**entry, "scheduled": scheduled}, post_hash) for (entry, post_hash), scheduled in zip(fresh, slots)
+    ])
+
+
+async def _insert_posts(db: AsyncSession, channel_id: int, fresh: Sequence[Tuple[dict, str]]) -> List[Post]:
+
+    async def add(item: Tuple[dict, str]) -> Post:
+        # Объект создаётся заново при каждой попытке: после отката у старого остался бы выданный id
+        entry, post_hash = item
+        post = Post(
+            channel_id=channel_id,
+            source_url=entry["source_url"],
+            original_title=entry["title"],
+            original_content=entry["content"],
+            processed_content=entry["processed"],
+            media_urls=entry["media"],
+            scheduled_time=entry["scheduled"],
+            hash=post_hash,
+            image_digest=entry.get("image_digest")
+        )
+        db.add(post)
+        return post
+
+    return await _commit_batch(db, fresh, add)
+
+
+def post_status_values(status: str, message_id: Optional[int] = None, error: Optional[str] = None) -> dict:
+    """Значения столбцов для перехода поста в status — то же, что делает update_post_status."""
+    values = {"status": status}
+    if message_id:
+        values["message_id"] = message_id
+    if status == "published":
+        values["published_time"] = datetime.utcnow()
+    if error:
+        values["last_error"] = error[:500]
+    return values
+
+
+def post_retry_values(error: str, next_attempt: datetime) -> dict:
+    """Пост остаётся в очереди до next_attempt; ошибка неудачной попытки запоминается."""
+    return {
+        "retry_count": func.coalesce(Post.retry_count, 0) + 1,
+        "next_attempt_at": next_attempt,
+        "last_error": error[:500]
+    }
+
+
+async def bulk_update_post_status(db: AsyncSession, updates: Sequence[Tuple[int, Optional[int], dict]]) -> int:
+    """Применяет к постам значения (post_status_values/post_retry_values) одним коммитом.
+
+    updates — тройки (post_id, lease_token, значения). Как и в update_post_status, при заданном
+    lease_token пост, перехваченный другим воркером, не меняется. Возвращает число изменённых постов.
+    """
+
+    async def apply(item: Tuple[int, Optional[int], dict]) -> int:
+        post_id, lease_token, values = item
+        query = update(Post).where(Post.id == post_id)
+        if lease_token is not None:
+            query = query.where(Post.lease_token == lease_token)
+        result = await db.execute(query.values(**values).execution_options(synchronize_session=False))
+        return result.rowcount
+
+    return sum(await _commit_batch(db, updates, apply))
+
+
+async def update_post_status(db: AsyncSession, post_id: int, status: str, message_id: int = None,
+                             lease_token: Optional[int] = None, error: Optional[str] = None):
+    query = select(Post).where(Post.id == post_id)
+    if lease_token is not None:
+        # Запись результата только по действующей аренде: если пост уже перехвачен, ничего не меняем
+        query = query.where(Post.lease_token == lease_token)
+    post = await db.scalar(query)
     if post:
         post.status = status
         if message_id:
             post.message_id = message_id
         if status == "published":
             post.published_time = datetime.utcnow()
-        db.commit()
+        if error:
+            post.last_error = error[:500]
+        await db.commit()
     return post
 
 
-def update_source_check(db: Session, source_id: int, last_guid: str = None, error: bool = False):
-    source = db.query(RSSSource).filter(RSSSource.id == source_id).first()
+async def update_source_check(db: AsyncSession, source_id: int, last_guid: str = None, error: bool = False):
+    source = await db.scalar(select(RSSSource).where(RSSSource.id == source_id))
     if source:
         source.last_checked = datetime.utcnow()
         if last_guid:
@@ -124,58 +557,116 @@ def update_source_check(db: Session, source_id: int, last_guid: str = None, erro
             source.error_count += 1
         else:
             source.error_count = 0
-        db.commit()
+        await db.commit()
     return source
 
 
-def toggle_channel_active(db: Session, channel_id: int):
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+async def bulk_update_source_checks(db: AsyncSession, checks: Sequence[Tuple[int, int, bool]]) -> None:
+    """Отмечает проверку источников одним коммитом; checks — тройки (source_id, lease_token, была ли ошибка).
+
+    Как и в bulk_update_post_status, источник, перехваченный другим воркером после истечения
+    аренды (lease_token сменился), не меняется.
+    """
+    if not checks:
+        return
+    sources = RSSSource.__table__
+    await db.execute(
+        update(sources).where(sources.c.id == bindparam("source_id"), sources.c.lease_token == bindparam("token"))
+        .values(last_checked=datetime.utcnow(), error_count=case(
+            (bindparam("failed", type_=Boolean), func.coalesce(sources.c.error_count, 0) + 1), else_=0)),
+        [{"source_id": source_id, "token": token, "failed": error} for source_id, token, error in checks]
+    )
+    await db.commit()
+
+
+async def toggle_channel_active(db: AsyncSession, channel_id: int):
+    channel = await db.scalar(select(Channel).where(Channel.id == channel_id))
     if channel:
         channel.is_active = not channel.is_active
-        db.commit()
+        await db.commit()
     return channel
 
 
-def toggle_rss_source(db: Session, source_id: int):
-    source = db.query(RSSSource).filter(RSSSource.id == source_id).first()
+async def toggle_rss_source(db: AsyncSession, source_id: int):
+    source = await db.scalar(select(RSSSource).where(RSSSource.id == source_id))
     if source:
         source.is_active = not source.is_active
-        db.commit()
+        await db.commit()
     return source
 
 
-def update_channel_settings(db: Session, channel_id: int, **kwargs):
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+async def update_channel_settings(db: AsyncSession, channel_id: int, **kwargs):
+    channel = await db.scalar(select(Channel).where(Channel.id == channel_id))
     if channel:
         for key, value in kwargs.items():
             if hasattr(channel, key):
                 setattr(channel, key, value)
-        db.commit()
+        if "topic" in kwargs or "ai_prompt" in kwargs:
+            channel.topic_profile = _build_channel_profile(channel)
+        await db.commit()
     return channel
 
 
-def delete_rss_source(db: Session, source_id: int):
-    source = db.query(RSSSource).filter(RSSSource.id == source_id).first()
+async def set_channel_setting(db: AsyncSession, channel_id: int, key: str, value):
+    channel = await db.scalar(select(Channel).where(Channel.id == channel_id))
+    if channel:
+        # JSON-столбец не отслеживает изменения на месте, поэтому присваиваем новый словарь
+        channel.settings = {**(channel.settings or {}), key: value}
+        if key == "compact_prompt":
+            channel.topic_profile = _build_channel_profile(channel)
+        await db.commit()
+    return channel
+
+
+async def delete_rss_source(db: AsyncSession, source_id: int):
+    source = await db.scalar(select(RSSSource).where(RSSSource.id == source_id))
     if source:
-        db.delete(source)
-        db.commit()
+        await db.delete(source)
+        await db.commit()
         return True
     return False
 
 
-def delete_channel(db: Session, channel_id: int):
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+async def delete_channel(db: AsyncSession, channel_id: int):
+    channel = await db.scalar(select(Channel).where(Channel.id == channel_id))
     if channel:
-        db.query(Post).filter(Post.channel_id == channel_id).delete()
-        db.query(RSSSource).filter(RSSSource.channel_id == channel_id).delete()
-        db.delete(channel)
-        db.commit()
+        await db.execute(delete(Post).where(Post.channel_id == channel_id))
+        await db.execute(delete(RSSSource).where(RSSSource.channel_id == channel_id))
+        await db.delete(channel)
+        await db.commit()
         return True
     return False
 
 
-def get_moderation_posts(db: Session, channel_id: int):
-    return db.query(Post).filter(
+async def get_moderation_posts(db: AsyncSession, channel_id: int):
+    return (await db.scalars(select(Post).where(
         Post.channel_id == channel_id,
         Post.status == "moderation"
-    ).all()
\ No newline at end of file
+    ))).all()
+
+
+async def get_media_file_id(db: AsyncSession, digest: str) -> Optional[str]:
+    media = await db.scalar(select(MediaFile).where(MediaFile.digest == digest))
+    if not media:
+        return None
+    media.last_used_at = datetime.utcnow()
+    await db.commit()
+    return media.file_id
+
+
+async def save_media_file_id(db: AsyncSession, digest: str, file_id: str):
+    media = await db.scalar(select(MediaFile).where(MediaFile.digest == digest))
+    if media:
+        media.file_id = file_id
+        media.last_used_at = datetime.utcnow()
+    else:
+        media = MediaFile(digest=digest, file_id=file_id)
+        db.add(media)
+    await db.commit()
+    return media
+
+
+async def delete_media_file_id(db: AsyncSession, digest: str) -> bool:
+    result = await db.execute(delete(MediaFile).where(MediaFile.digest == digest))
+    await db.commit()
+    return bool(result.rowcount)
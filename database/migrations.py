@@ -0,0 +1,114 @@
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, JSON, MetaData, String, Table, Text, inspect, select
+from sqlalchemy.engine import Connection, Engine
+
+from database.models import Base, Post, RSSSource
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+# Номер последней применённой миграции; таблица с одной строкой на каждую применённую миграцию
+schema_version = Table(
+    "schema_version", _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+def _add_column(conn: Connection, table: str, column: Column) -> None:
+    """ALTER TABLE ADD COLUMN в синтаксисе текущей БД; уже существующий столбец пропускается."""
+
+    if column.name in {c["name"] for c in inspect(conn).get_columns(table)}:
+        return
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    conn.exec_driver_sql(ddl)
+    logger.info(f"Добавлен столбец {table}.{column.name}")
+
+
+def _added_columns(conn: Connection) -> None:
+    # Столбцы, которые раньше добавлял main.migrate_db; в базах разного возраста их набор разный
+    for table, column in [
+        ("posts", Column("hash", String)),
+        ("channels", Column("topic_profile", JSON)),
+        ("posts", Column("image_digest", String)),
+        ("channels", Column("next_slot_time", DateTime)),
+        ("rss_sources", Column("lease_owner", String)),
+        ("rss_sources", Column("lease_expires_at", DateTime)),
+        ("rss_sources", Column("lease_token", Integer, server_default="0")),
+        ("posts", Column("lease_owner", String)),
+        ("posts", Column("lease_expires_at", DateTime)),
+        ("posts", Column("lease_token", Integer, server_default="0")),
+        ("posts", Column("retry_count", Integer, server_default="0")),
+        ("posts", Column("next_attempt_at", DateTime)),
+        ("posts", Column("last_error", Text)),
+    ]:
+        _add_column(conn, table, column)
+
+
+def _hot_query_indexes(conn: Connection) -> None:
+    # Очередь публикации, очередь канала и дедупликация по хэшу; одиночный индекс по hash
+    # больше не нужен: хэш всегда ищется вместе с каналом
+    existing = {index["name"] for index in inspect(conn).get_indexes("posts")}
+    if "ix_posts_hash" in existing:
+        conn.exec_driver_sql("DROP INDEX ix_posts_hash")
+    # Индекс очереди канала заменён миграцией 3 и в моделях его уже нет
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_posts_channel_status_scheduled ON posts (channel_id, status, scheduled_time)")
+    for table, name in [
+        (Post.__table__, "ix_posts_status_scheduled"),
+        (Post.__table__, "ix_posts_channel_hash"),
+        (RSSSource.__table__, "ix_rss_sources_is_active"),
+    ]:
+        _model_index(table, name).create(conn, checkfirst=True)
+
+
+def _pending_due_index(conn: Connection) -> None:
+    # Срок ближайшего поста по всем каналам читался полным просмотром индекса очереди канала;
+    # новый индекс начинается со status и покрывает срок и аренду, а очередь канала обслуживает так же
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_posts_channel_status_scheduled")
+    _model_index(Post.__table__, "ix_posts_status_channel_due").create(conn, checkfirst=True)
+
+
+def _model_index(table: Table, name: str):
+    return next(index for index in table.indexes if index.name == name)
+
+
+# (версия, описание, функция); новые миграции добавляются только в конец списка
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "столбцы, добавленные после первого релиза", _added_columns),
+    (2, "индексы для очереди публикации, дедупликации и активных источников", _hot_query_indexes),
+    (3, "покрывающий индекс ожидающих постов по каналу и сроку", _pending_due_index),
+]
+
+
+def current_version(conn: Connection) -> int:
+    return max(conn.execute(select(schema_version.c.version)).scalars(), default=0)
+
+
+def upgrade(engine: Engine) -> int:
+    """Применяет к базе все ещё не применённые миграции, каждую в своей транзакции; возвращает версию схемы.
+
+    Недостающие таблицы сначала создаются по моделям, так что пустая база тоже доводится до текущей схемы.
+    """
+
+    Base.metadata.create_all(engine)
+    schema_version.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        version = current_version(conn)
+
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        logger.info(f"Миграция {number}: {description}")
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_version.insert().values(version=number, description=description))
+        version = number
+
+    return version
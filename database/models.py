@@ -1,13 +1,70 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, DateTime, ForeignKey, Index, Text, JSON
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from datetime import datetime
-from config.settings import DATABASE_URL, DEFAULT_AI_MODEL
+from config.settings import DATABASE_URL, DEFAULT_AI_MODEL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, \
+    SQLITE_PERFORMANCE, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB
+
+# Асинхронные драйверы для синхронных URL из DATABASE_URL
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def _async_url(url: str):
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if parsed.drivername == backend and backend in _ASYNC_DRIVERS:
+        return parsed.set(drivername=_ASYNC_DRIVERS[backend])
+    # Драйвер указан явно (например, postgresql+asyncpg) — оставляем как есть
+    return parsed
+
+
+def _sqlite_tuned(url) -> bool:
+    return SQLITE_PERFORMANCE and url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _pool_options(url) -> dict:
+    if url.get_backend_name() == "sqlite":
+        if not _sqlite_tuned(url):
+            # Без WAL запись блокирует всю базу: остаётся пул SQLAlchemy по умолчанию
+            return {}
+        return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_pre_ping": True}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    # journal_mode=WAL хранится в файле базы, остальные настройки действуют на соединение
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    # Отрицательное значение — размер в килобайтах, а не в страницах
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.close()
+
 
 Base = declarative_base()
-engine = create_engine(DATABASE_URL)
+# Синхронный движок — только для создания схемы и миграций при старте
+engine = create_engine(DATABASE_URL, **_pool_options(make_url(DATABASE_URL)))
 SessionLocal = sessionmaker(bind=engine)
 
+# Всё, что работает в event loop (обработчики, планировщик), ходит в БД через асинхронный движок
+_async_database_url = _async_url(DATABASE_URL)
+async_engine = create_async_engine(_async_database_url, **_pool_options(_async_database_url))
+# Объекты остаются доступны после commit: обработчики читают их уже после закрытия сессии
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+if _sqlite_tuned(_async_database_url):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
 
 class User(Base):
     __tablename__ = "users"
@@ -36,6 +93,9 @@ class Channel(Base):
     rss_sources = relationship("RSSSource", back_populates="channel")
     posts = relationship("Post", back_populates="channel")
     settings = Column(JSON, default={})
+    topic_profile = Column(JSON)
+    # Ближайшее свободное время для нового поста; выдаётся атомарно в crud.allocate_post_slots
+    next_slot_time = Column(DateTime)
 
 
 class RSSSource(Base):
@@ -48,8 +108,17 @@ class RSSSource(Base):
     last_checked = Column(DateTime)
     last_guid = Column(String)
     error_count = Column(Integer, default=0)
+    # Аренда строки воркером: владелец, срок и номер захвата (fencing token), см. crud.claim_leases
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    lease_token = Column(Integer, default=0)
     channel = relationship("Channel", back_populates="rss_sources")
 
+    # Индексы создаются и миграцией database/migrations.py для уже существующих баз
+    __table_args__ = (
+        Index("ix_rss_sources_is_active", "is_active"),
+    )
+
 
 class Post(Base):
     __tablename__ = "posts"
@@ -64,8 +133,36 @@ class Post(Base):
     scheduled_time = Column(DateTime)
     published_time = Column(DateTime)
     message_id = Column(Integer)
-    hash = Column(String, index=True, nullable=True)
+    hash = Column(String, nullable=True)
+    image_digest = Column(String, nullable=True)
+    # Повторные попытки публикации после временных ошибок: см. crud.post_retry_values
+    retry_count = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    lease_token = Column(Integer, default=0)
     channel = relationship("Channel", back_populates="posts")
 
+    __table_args__ = (
+        # Наступившие посты всех каналов по времени (claim_pending_posts)
+        Index("ix_posts_status_scheduled", "status", "scheduled_time"),
+        # Очередь канала по времени (get_channel_queue, claim по каналу) и срок ближайшего поста
+        # каждого канала (get_next_pending_times): остальные столбцы срока и аренды — чтобы не читать строки
+        Index("ix_posts_status_channel_due", "status", "channel_id", "scheduled_time", "next_attempt_at",
+              "lease_expires_at"),
+        # Дедупликация: хэш всегда ищется в пределах канала
+        Index("ix_posts_channel_hash", "channel_id", "hash"),
+    )
+
+
+class MediaFile(Base):
+    """Telegram file_id уже загруженного изображения по sha256 его байтов."""
+    __tablename__ = "media_files"
+    digest = Column(String, primary_key=True)
+    file_id = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+
 
 Base.metadata.create_all(engine)
\ No newline at end of file
@@ -5,12 +5,16 @@ from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand
-from config.settings import BOT_TOKEN, GROQ_API_KEY
+from config.settings import BOT_TOKEN, GROQ_API_KEY, METRICS_HOST, METRICS_PORT
 from bot.handlers import router
 from admin.panel import admin_router
 from core.scheduler import Scheduler
-from database.models import engine, Base
-from sqlalchemy import text
+from core.images import shutdown_image_workers
+from core.placeholders import load_placeholders
+from core.metrics import LoopLagMonitor, PENDING_POSTS, instrument_engine, register_collector, start_metrics_server
+from database import migrations
+from database.models import engine, async_engine, AsyncSessionLocal
+from database.crud import count_pending_posts
 
 # Настройка логирования с поддержкой UTF-8
 logging.basicConfig(
@@ -36,30 +40,16 @@ async def set_main_menu(bot: Bot):
 
 
 def migrate_db():
-    """Безопасная миграция базы данных"""
+    """Приводит схему базы данных к текущей версии"""
     logger.info("🔍 Проверка необходимости миграции базы данных...")
+    version = migrations.upgrade(engine)
+    logger.info(f"✅ Схема базы данных актуальна (версия {version})")
 
-    with engine.connect() as conn:
-        try:
-            # Проверяем, существует ли столбец hash в таблице posts
-            result = conn.execute(text("""
-                SELECT name FROM pragma_table_info('posts') WHERE name = 'hash'
-            """))
-
-            if not result.fetchone():
-                logger.info("🔧 Столбец 'hash' отсутствует в таблице posts. Выполняем миграцию...")
-                conn.execute(text("ALTER TABLE posts ADD COLUMN hash TEXT"))
-                conn.commit()
-                logger.info("✅ Миграция успешна: добавлен столбец hash в таблицу posts")
-            else:
-                logger.info("✅ Столбец 'hash' уже существует в таблице posts, миграция не требуется")
-
-        except Exception as e:
-            logger.error(f"❌ Ошибка при миграции базы данных: {str(e)}", exc_info=True)
-            logger.info("🔧 Попытка восстановления структуры базы данных...")
-            # Создаем таблицы, если они не существуют
-            Base.metadata.create_all(engine)
-            logger.info("✅ Структура базы данных восстановлена")
+
+async def collect_pending_posts():
+    async with AsyncSessionLocal() as db:
+        pending = await count_pending_posts(db)
+    PENDING_POSTS.replace({(channel,): count for channel, count in pending.items()})
 
 
 async def main():
@@ -72,7 +62,12 @@ async def main():
         return
 
 
-    migrate_db()
+    try:
+        migrate_db()
+    except Exception as e:
+        logger.critical(f"❌ Ошибка при миграции базы данных: {str(e)}", exc_info=True)
+        return
+    load_placeholders()
 
     bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
     dp = Dispatcher(storage=MemoryStorage())
@@ -85,12 +80,27 @@ async def main():
     scheduler = Scheduler(bot)
     scheduler.start()
 
+    lag_monitor = LoopLagMonitor()
+    lag_monitor.start()
+
+    metrics_runner = None
+    if METRICS_PORT:
+        instrument_engine(async_engine.sync_engine)
+        register_collector(collect_pending_posts)
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
     try:
         logger.info("✅ Бот запущен и готов к работе")
         await bot.delete_webhook(drop_pending_updates=True)
         await dp.start_polling(bot)
     finally:
+        await lag_monitor.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
         scheduler.stop()
+        await scheduler.publisher.close()
+        shutdown_image_workers()
+        await async_engine.dispose()
         await bot.session.close()
         logger.info("🛑 Бот остановлен")
 
@@ -0,0 +1,43 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Настройки читаются при импорте config.settings, а движок БД создаётся при импорте
+# database.models, поэтому окружение задаётся до импорта кода бота
+_db_dir = tempfile.mkdtemp(prefix="newsbot-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fresh_db():
+    """Пустая схема перед тестом: все тесты делят одну временную базу."""
+    from database.models import Base, engine
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield engine
+
+
+@pytest.fixture
+def arun():
+    """asyncio.run, который закрывает соединения асинхронного движка в том же event loop.
+
+    Соединения aiosqlite привязаны к loop, в котором открыты; у каждого теста loop свой.
+    """
+    from database.models import async_engine
+
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,26 @@
+import json
+import os
+
+import pytest
+
+from core.formatter import format_fallback_post, format_plain_post, format_post
+
+# Ожидаемые ответы собраны прежней реализацией из AIProcessor (benchmarks/legacy_formatter.py)
+with open(os.path.join(os.path.dirname(__file__), "fixtures", "formatter_corpus.json"), encoding="utf-8") as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize("case", CORPUS)
+def test_format_post_matches_legacy(case):
+    assert format_post(case["raw"], case["topic"], case["emoji"], case["hashtags"]) == case["expected_post"]
+
+
+@pytest.mark.parametrize("case", CORPUS)
+def test_format_plain_post_matches_legacy(case):
+    assert format_plain_post(case["raw"], case["emoji"], case["hashtags"]) == case["expected_plain"]
+
+
+@pytest.mark.parametrize("case", CORPUS)
+def test_format_fallback_post_matches_legacy(case):
+    assert format_fallback_post(case["title"], case["raw"], case["emoji"], case["hashtags"]) == \
+        case["expected_fallback"]
@@ -0,0 +1,22 @@
+import asyncio
+import os
+
+from core.image_cache import ImageCache
+
+
+def test_put_get_and_evict_oldest(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=2500)
+
+    async def scenario():
+        first = await cache.put(b"a" * 1000)
+        # Разные mtime, чтобы порядок вытеснения не зависел от точности часов ФС
+        os.utime(cache._path(first), (1, 1))
+        second = await cache.put(b"b" * 1000)
+        third = await cache.put(b"c" * 1000)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert asyncio.run(cache.get(first)) is None
+    assert asyncio.run(cache.get(second)) == b"b" * 1000
+    assert asyncio.run(cache.get(third)) == b"c" * 1000
+    assert asyncio.run(cache.get(None)) is None
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+import database.crud as crud
+from config.settings import LEASE_TTL, WORKER_ID
+from database.crud import (add_rss_source, bulk_update_source_checks, claim_pending_posts, claim_sources,
+                           create_channel, create_post, get_channel_queue, get_or_create_user, reschedule_posts)
+from database.models import AsyncSessionLocal, Post, RSSSource, async_engine
+
+
+async def _seed(channels=("a", "b")):
+    ids = []
+    async with AsyncSessionLocal() as db:
+        user = await get_or_create_user(db, 1, "owner")
+        for name in channels:
+            channel = await create_channel(db, user.id, f"@{name}", name, "Спорт")
+            await add_rss_source(db, channel.id, f"http://{name}", name)
+            await create_post(db, channel.id, "u", name, name, f"<b>{name}</b>", [],
+                              datetime.utcnow() - timedelta(minutes=1))
+            ids.append(channel.id)
+    return ids
+
+
+async def _steal(model, row_id):
+    # Аренда истекла, и строку захватил другой воркер: номер захвата сменился
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(model).where(model.id == row_id)
+                         .values(lease_owner="other", lease_token=model.lease_token + 1))
+        await db.commit()
+
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_same_clock_claims_do_not_pick_up_each_others_rows(fresh_db, arun, monkeypatch, returning):
+    now = datetime.utcnow()
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return now
+
+    # Два захвата одного воркера с одинаковым показанием часов получают одинаковый срок аренды
+    monkeypatch.setattr(crud, "datetime", FrozenDatetime)
+    monkeypatch.setattr(async_engine.dialect, "update_returning", returning)
+
+    async def scenario():
+        first, second = await _seed()
+        async with AsyncSessionLocal() as db:
+            claimed_first = await claim_pending_posts(db, WORKER_ID, LEASE_TTL, [first])
+            claimed_second = await claim_pending_posts(db, WORKER_ID, LEASE_TTL, [second])
+        return first, second, claimed_first, claimed_second
+
+    first, second, claimed_first, claimed_second = arun(scenario())
+    assert list(claimed_first) == [first]
+    assert list(claimed_second) == [second]
+
+
+def test_source_check_is_not_written_after_lease_moved(fresh_db, arun):
+    async def scenario():
+        await _seed()
+        async with AsyncSessionLocal() as db:
+            kept, lost = await claim_sources(db, WORKER_ID, LEASE_TTL, datetime.utcnow(), 10)
+        await _steal(RSSSource, lost.id)
+        async with AsyncSessionLocal() as db:
+            await bulk_update_source_checks(db, [(kept.id, kept.lease_token, True), (lost.id, lost.lease_token, True)])
+            return (await db.execute(select(RSSSource.error_count, RSSSource.last_checked)
+                                     .order_by(RSSSource.id))).all()
+
+    (kept_errors, kept_checked), (lost_errors, lost_checked) = arun(scenario())
+    assert kept_errors == 1 and kept_checked is not None
+    assert lost_errors == 0 and lost_checked is None
+
+
+def test_reschedule_skips_posts_claimed_since_they_were_read(fresh_db, arun):
+    async def scenario():
+        channel_id, _ = await _seed()
+        async with AsyncSessionLocal() as db:
+            await create_post(db, channel_id, "u", "later", "later", "<b>later</b>", [],
+                              datetime.utcnow() + timedelta(minutes=1))
+            queue = await get_channel_queue(db, channel_id)
+        await _steal(Post, queue[0].id)
+        moved_to = datetime.utcnow() + timedelta(hours=2)
+        async with AsyncSessionLocal() as db:
+            await reschedule_posts(db, channel_id, [(post.id, post.lease_token, moved_to) for post in queue], 3600)
+            times = (await db.scalars(select(Post.scheduled_time).where(Post.id.in_([post.id for post in queue]))
+                                      .order_by(Post.id))).all()
+        return queue, times, moved_to
+
+    queue, times, moved_to = arun(scenario())
+    assert times[0] == queue[0].scheduled_time
+    assert times[1] == moved_to
@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from core.metrics import Counter, Histogram, instrument_engine, DB_QUERY_SECONDS
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_latency_seconds", "Тестовая гистограмма", ["op"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, op="a")
+    histogram.observe(0.5, op="a")
+    histogram.observe(5, op="a")
+
+    lines = histogram.render()
+    assert 'test_latency_seconds_bucket{op="a",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{op="a",le="1"} 2' in lines
+    assert 'test_latency_seconds_bucket{op="a",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{op="a"} 3' in lines
+
+
+def test_counter_escapes_label_values():
+    counter = Counter("test_events_total", "Тестовый счётчик", ["result"])
+    counter.inc(result='bad "quote"')
+    assert 'test_events_total{result="bad \\"quote\\""} 1' in counter.render()
+
+
+def _select_count() -> int:
+    state = DB_QUERY_SECONDS._values.get(("SELECT",))
+    return state[2] if state else 0
+
+
+def test_failed_query_does_not_skew_later_timings():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    before = _select_count()
+
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing_table"))
+        conn.execute(text("SELECT 1"))
+        # Ничего не копится на соединении между запросами
+        assert "query_started" not in conn.info
+
+    assert _select_count() == before + 1
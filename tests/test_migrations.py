@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, insert, inspect, select, text
+
+from database import migrations
+from database.crud import claim_query, due_posts_criteria, next_pending_times_query, stale_sources_criteria
+from database.models import Channel, Post, RSSSource
+
+NOW = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def migrated(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    version = migrations.upgrade(engine)
+    yield engine, version
+    engine.dispose()
+
+
+def _seed(engine, channels=20, posts_per_channel=500):
+    # Данных достаточно, чтобы полный просмотр таблицы был заметно дороже поиска по индексу
+    statuses = ["published"] * 8 + ["pending", "failed"]
+    with engine.begin() as conn:
+        conn.execute(insert(Channel), [{"id": c, "channel_id": f"@c{c}", "is_active": True}
+                                       for c in range(1, channels + 1)])
+        conn.execute(insert(RSSSource), [{"channel_id": c, "url": f"http://{c}", "is_active": c % 5 == 0}
+                                         for c in range(1, channels + 1)])
+        conn.execute(insert(Post), [
+            {"channel_id": c, "status": statuses[i % len(statuses)], "hash": f"{c}-{i}",
+             "scheduled_time": NOW + timedelta(minutes=i)}
+            for c in range(1, channels + 1) for i in range(posts_per_channel)
+        ])
+        conn.exec_driver_sql("ANALYZE")
+
+
+def _plan(engine, query) -> str:
+    sql = str(query.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return "\n".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+# Запросы собираются теми же функциями, что и в database/crud.py
+HOT_QUERIES = {
+    "claim_pending_posts": (
+        claim_query(Post, NOW, *due_posts_criteria(NOW), order_by=Post.scheduled_time),
+        "ix_posts_status_scheduled",
+    ),
+    "claim_pending_posts по каналам": (
+        claim_query(Post, NOW, *due_posts_criteria(NOW, [3, 4]), order_by=Post.scheduled_time),
+        "ix_posts_status_channel_due",
+    ),
+    "get_next_pending_times": (next_pending_times_query(NOW), "ix_posts_status_channel_due"),
+    "get_next_pending_times по каналу": (next_pending_times_query(NOW, [3]), "ix_posts_status_channel_due"),
+    "get_channel_queue": (
+        select(Post.id).where(Post.channel_id == 3, Post.status == "pending").order_by(Post.scheduled_time),
+        "ix_posts_status_channel_due",
+    ),
+    "get_existing_hashes": (
+        select(Post.hash).where(Post.channel_id == 3, Post.hash.in_(["3-1", "3-2"])),
+        "ix_posts_channel_hash",
+    ),
+    "claim_sources": (
+        claim_query(RSSSource, NOW, *stale_sources_criteria(NOW), order_by=RSSSource.id, limit=50),
+        "ix_rss_sources_is_active",
+    ),
+}
+
+# Схема базы до этой серии изменений: её раньше доводил main.migrate_db
+PRE_SERIES_SCHEMA = """
+CREATE TABLE users (id INTEGER NOT NULL, telegram_id INTEGER, username VARCHAR, is_admin BOOLEAN,
+    created_at DATETIME, PRIMARY KEY (id));
+CREATE UNIQUE INDEX ix_users_telegram_id ON users (telegram_id);
+CREATE TABLE channels (id INTEGER NOT NULL, channel_id VARCHAR, channel_name VARCHAR, topic VARCHAR,
+    owner_id INTEGER, is_active BOOLEAN, post_interval INTEGER, moderation_mode BOOLEAN, ai_model VARCHAR,
+    ai_prompt TEXT, created_at DATETIME, settings JSON, PRIMARY KEY (id), UNIQUE (channel_id),
+    FOREIGN KEY(owner_id) REFERENCES users (id));
+CREATE TABLE rss_sources (id INTEGER NOT NULL, url VARCHAR, name VARCHAR, channel_id INTEGER, is_active BOOLEAN,
+    last_checked DATETIME, last_guid VARCHAR, error_count INTEGER, PRIMARY KEY (id),
+    FOREIGN KEY(channel_id) REFERENCES channels (id));
+CREATE TABLE posts (id INTEGER NOT NULL, channel_id INTEGER, source_url VARCHAR, original_title VARCHAR,
+    original_content TEXT, processed_content TEXT, media_urls JSON, status VARCHAR, scheduled_time DATETIME,
+    published_time DATETIME, message_id INTEGER, hash VARCHAR, PRIMARY KEY (id),
+    FOREIGN KEY(channel_id) REFERENCES channels (id));
+CREATE INDEX ix_posts_hash ON posts (hash);
+INSERT INTO channels (id, channel_id, is_active, post_interval) VALUES (1, '@old', 1, 3600);
+INSERT INTO rss_sources (id, url, channel_id, is_active, error_count) VALUES (1, 'http://old', 1, 1, 2);
+INSERT INTO posts (id, channel_id, status, scheduled_time, hash)
+    VALUES (1, 1, 'pending', '2025-12-31 10:00:00.000000', 'h');
+"""
+
+
+def test_upgrade_creates_schema_and_indexes_on_empty_database(migrated):
+    engine, version = migrated
+    assert version == migrations.MIGRATIONS[-1][0]
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("posts")}
+    assert {"ix_posts_status_scheduled", "ix_posts_status_channel_due", "ix_posts_channel_hash"} <= indexes
+    assert not {"ix_posts_hash", "ix_posts_channel_status_scheduled"} & indexes
+
+
+def test_upgrade_is_idempotent(migrated):
+    engine, version = migrated
+    assert migrations.upgrade(engine) == version
+    with engine.connect() as conn:
+        applied = conn.execute(select(migrations.schema_version.c.version)).scalars().all()
+    assert applied == [number for number, _, _ in migrations.MIGRATIONS]
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_queries_use_indexes(migrated, name):
+    engine, _ = migrated
+    _seed(engine)
+    query, index = HOT_QUERIES[name]
+    plan = _plan(engine, query)
+    assert index in plan, plan
+    assert "SCAN posts" not in plan and "SCAN rss_sources" not in plan, plan
+
+
+def test_upgrade_brings_pre_series_database_to_current_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.connection.executescript(PRE_SERIES_SCHEMA)
+
+    assert migrations.upgrade(engine) == migrations.MIGRATIONS[-1][0]
+
+    inspector = inspect(engine)
+    for table in (Post.__table__, RSSSource.__table__, Channel.__table__):
+        assert {column.name for column in table.columns} <= {c["name"] for c in inspector.get_columns(table.name)}
+    assert {index.name for index in Post.__table__.indexes} == {i["name"] for i in inspector.get_indexes("posts")}
+    assert "media_files" in inspector.get_table_names()
+
+    # Старые строки на месте и видны новым запросам: поля аренды и повторов пусты
+    with engine.connect() as conn:
+        assert dict(conn.execute(next_pending_times_query(NOW)).all()) == {1: datetime(2025, 12, 31, 10)}
+        assert conn.execute(claim_query(Post, NOW, *due_posts_criteria(NOW))).scalars().all() == [1]
+        assert conn.execute(claim_query(RSSSource, NOW, *stale_sources_criteria(NOW))).scalars().all() == [1]
+        assert conn.scalar(select(Post.lease_token)) == conn.scalar(select(RSSSource.lease_token)) == 0
+    engine.dispose()
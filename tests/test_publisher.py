@@ -0,0 +1,92 @@
+import asyncio
+import types
+
+import aiohttp
+import pytest
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
+from aiogram.methods import SendPhoto
+
+import core.publisher as publisher_module
+from core.publisher import Publisher
+
+
+class _DirectLimiter:
+    """Без пауз между запросами: тесту важен порядок отправок, а не темп."""
+
+    async def call(self, chat_id, request, method):
+        return await request()
+
+
+class _PhotoFailingBot:
+    def __init__(self, error):
+        self.error = error
+        self.calls = []
+
+    async def send_photo(self, chat_id, photo, caption=None, parse_mode=None):
+        self.calls.append("photo")
+        raise self.error
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.calls.append("text")
+        return types.SimpleNamespace(message_id=42)
+
+
+def _publish(bot, monkeypatch, arun):
+    monkeypatch.setattr(publisher_module, "telegram_limiter", _DirectLimiter())
+    publisher = Publisher(bot)
+
+    async def download(url):
+        return b"\xff\xd8" + url.encode()
+
+    publisher._download_image = download
+    return arun(publisher.try_publish("-100", "<b>пост</b>", ["http://img/1"]))
+
+
+def test_bad_media_falls_back_to_text(monkeypatch, arun):
+    bot = _PhotoFailingBot(TelegramBadRequest(method=SendPhoto(chat_id="-100", photo="x"),
+                                              message="Bad Request: IMAGE_PROCESS_FAILED"))
+    result = _publish(bot, monkeypatch, arun)
+
+    assert result.message_id == 42
+    # Скачанное фото, затем заглушка, затем текст
+    assert bot.calls == ["photo", "photo", "text"]
+
+
+@pytest.mark.parametrize("message", [
+    "Bad Request: chat not found",
+    "Bad Request: not enough rights to send photos to the chat",
+    "Bad Request: can't parse entities: Unsupported start tag",
+])
+def test_non_media_bad_request_skips_fallback(monkeypatch, arun, message):
+    bot = _PhotoFailingBot(TelegramBadRequest(method=SendPhoto(chat_id="-100", photo="x"), message=message))
+    result = _publish(bot, monkeypatch, arun)
+
+    # Другая картинка или текст такую ошибку не исправят: одна отправка, ошибка уходит в классификацию
+    assert result.message_id is None
+    assert result.error_kind == "permanent"
+    assert bot.calls == ["photo"]
+
+
+@pytest.mark.parametrize("error", [
+    TelegramNetworkError(method=SendPhoto(chat_id="-100", photo="x"), message="timeout"),
+    asyncio.TimeoutError(),
+])
+def test_transient_error_is_not_retried_through_fallback(monkeypatch, arun, error):
+    bot = _PhotoFailingBot(error)
+    result = _publish(bot, monkeypatch, arun)
+
+    # Фото могло дойти до Telegram: повтор остаётся планировщику, запасные отправки не делаются
+    assert result.message_id is None
+    assert result.error_kind == "retryable"
+    assert bot.calls == ["photo"]
+
+
+def test_close_releases_http_session():
+    async def scenario():
+        async with Publisher(bot=None) as publisher:
+            publisher._http = aiohttp.ClientSession()
+            session = publisher._http
+        await publisher.close()
+        return session
+
+    assert asyncio.run(scenario()).closed
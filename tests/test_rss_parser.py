@@ -0,0 +1,42 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import core.rss_parser as rss_parser
+from core.rss_parser import RSSParser
+
+
+async def _stream(request):
+    # Тело уходит частями без Content-Length, как у лент, которые генерируются на лету
+    size = int(request.query["size"])
+    response = web.StreamResponse()
+    await response.prepare(request)
+    chunk = b"x" * 100_000
+    sent = 0
+    while sent < size:
+        part = chunk[:size - sent]
+        await response.write(part)
+        sent += len(part)
+        await asyncio.sleep(0)
+    await response.write_eof()
+    return response
+
+
+async def _fetch(size):
+    app = web.Application()
+    app.router.add_get("/feed", _stream)
+    async with TestServer(app) as server:
+        async with RSSParser() as parser:
+            return await parser.fetch_feed(str(server.make_url(f"/feed?size={size}")))
+
+
+def test_fetch_feed_reads_the_whole_streamed_body():
+    data = asyncio.run(_fetch(3_000_011))
+    assert data is not None
+    assert len(data) == 3_000_011
+
+
+def test_fetch_feed_rejects_body_over_limit(monkeypatch):
+    monkeypatch.setattr(rss_parser, "_MAX_FEED_SIZE", 1_000_000)
+    assert asyncio.run(_fetch(1_500_000)) is None
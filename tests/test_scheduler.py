@@ -0,0 +1,340 @@
+import asyncio
+import types
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import SendMessage
+from sqlalchemy import event, func, select, update
+from sqlalchemy.exc import InvalidRequestError
+
+import core.scheduler as scheduler_module
+from core.publish_timer import publish_timer
+from core.scheduler import Scheduler
+from config.settings import LEASE_TTL, MAX_AI_ENTRIES_PER_CHANNEL, PUBLISH_RETRY_BASE, WORKER_ID
+from database.crud import add_rss_source, claim_pending_posts, claim_sources, create_channel, create_post, \
+    get_or_create_user, update_channel_settings
+from database.models import AsyncSessionLocal, Base, Channel, Post, RSSSource, async_engine
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.sent.append(chat_id)
+        return types.SimpleNamespace(message_id=len(self.sent))
+
+
+class FakeAI:
+    async def process_content(self, entry, settings):
+        return f"<b>{entry['title']}</b>"
+
+
+def make_scheduler(bot=None) -> Scheduler:
+    scheduler = Scheduler(bot or FakeBot())
+    scheduler.ai_processor = FakeAI()
+
+    async def no_image(media):
+        return None
+
+    scheduler.publisher.prepare_image = no_image
+    return scheduler
+
+
+async def seed_channel(name: str, sources: int = 0):
+    async with AsyncSessionLocal() as db:
+        user = await get_or_create_user(db, 1, "owner")
+        channel = await create_channel(db, user.id, f"@{name}", name, "Спорт")
+        for number in range(sources):
+            await add_rss_source(db, channel.id, f"http://{name}/{number}", f"{name}-{number}")
+    return channel
+
+
+def test_failed_fetch_does_not_drop_other_sources_of_channel(fresh_db, arun, monkeypatch):
+    class FlakyParser:
+        def __init__(self):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            pass
+
+        async def fetch_feed(self, url):
+            if url.endswith("/0"):
+                raise RuntimeError("сбой вне перехватываемых ошибок сети")
+            return url
+
+        def parse_content(self, data, last_guid):
+            return [{"title": f"Новость {data}", "content": "спорт", "media": ["http://img"]}]
+
+    monkeypatch.setattr(scheduler_module, "RSSParser", FlakyParser)
+
+    async def scenario():
+        channel = await seed_channel("sport", sources=2)
+        await make_scheduler().check_rss_sources()
+        publish_timer.stop()
+        async with AsyncSessionLocal() as db:
+            posts = await db.scalar(select(func.count(Post.id)).where(Post.channel_id == channel.id))
+            errors = (await db.scalars(select(RSSSource.error_count).order_by(RSSSource.id))).all()
+        return posts, errors
+
+    posts, errors = arun(scenario())
+    assert posts == 1
+    assert errors == [1, 0]
+
+
+def test_rescheduled_retry_does_not_rearm_timer_in_the_past(fresh_db, arun):
+    async def scenario():
+        channel = await seed_channel("news")
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            for title, minutes in [("a", 10), ("b", 9), ("retry", 5)]:
+                await create_post(db, channel.id, "u", title, title, f"<b>{title}</b>", [],
+                                  now - timedelta(minutes=minutes))
+            # Пост ждёт повторной попытки, срок которой уже наступил
+            await db.execute(update(Post).where(Post.original_title == "retry")
+                             .values(retry_count=1, next_attempt_at=now - timedelta(seconds=1)))
+            await db.commit()
+
+        bot = FakeBot()
+        await make_scheduler(bot).publish_scheduled_posts()
+        due = publish_timer._due.get(channel.id)
+        publish_timer.stop()
+
+        async with AsyncSessionLocal() as db:
+            retry = await db.scalar(select(Post).where(Post.original_title == "retry"))
+        return bot.sent, due, retry
+
+    sent, due, retry = arun(scenario())
+    # Догон публикует один пост, остальные переносятся на интервал вперёд
+    assert len(sent) == 1
+    assert retry.scheduled_time > datetime.utcnow() > retry.next_attempt_at
+    # Таймер взведён на будущее время, а не на прошедший next_attempt_at
+    assert due is not None and due > datetime.utcnow()
+
+
+def test_failing_channel_keeps_other_leases_and_rearms_timer(fresh_db, arun, monkeypatch):
+    class SlowBot(FakeBot):
+        def __init__(self):
+            super().__init__()
+            self.leases_during_send = []
+
+        async def send_message(self, chat_id, text, parse_mode=None):
+            # Пока канал b отправляет, канал a уже упал: аренда поста b должна оставаться за воркером
+            await asyncio.sleep(0.05)
+            async with AsyncSessionLocal() as db:
+                self.leases_during_send.append(
+                    await db.scalar(select(Post.lease_owner).where(Post.original_title == "b")))
+            return await super().send_message(chat_id, text, parse_mode)
+
+    async def scenario():
+        failing = await seed_channel("a")
+        working = await seed_channel("b")
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            for channel, title in [(failing, "a"), (working, "b")]:
+                await create_post(db, channel.id, "u", title, title, f"<b>{title}</b>", [],
+                                  now - timedelta(minutes=1))
+
+        scheduler = make_scheduler(SlowBot())
+        original = scheduler._publish_channel_posts
+
+        async def publish(posts, db):
+            if posts[0].channel_id == failing.id:
+                raise RuntimeError("сбой канала a")
+            return await original(posts, db)
+
+        monkeypatch.setattr(scheduler, "_publish_channel_posts", publish)
+        started = datetime.utcnow()
+        await scheduler.publish_scheduled_posts()
+        due = dict(publish_timer._due)
+        publish_timer.stop()
+
+        async with AsyncSessionLocal() as db:
+            posts = {post.original_title: post for post in (await db.scalars(select(Post))).all()}
+        return scheduler.bot, posts, due, failing.id, started
+
+    bot, posts, due, failing_id, started = arun(scenario())
+    assert bot.leases_during_send == [WORKER_ID]
+    assert posts["b"].status == "published"
+    # Пост упавшего канала свободен для следующего прохода, а таймер канала отложен, а не взведён на прошлое
+    assert posts["a"].status == "pending" and posts["a"].lease_owner is None
+    assert due[failing_id] >= started + timedelta(seconds=PUBLISH_RETRY_BASE)
+
+
+class StatementCounter:
+    def __init__(self):
+        self.counts = Counter()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.counts[statement.split(None, 1)[0].upper()] += 1
+
+    def __enter__(self):
+        event.listen(async_engine.sync_engine, "before_cursor_execute", self)
+        return self.counts
+
+    def __exit__(self, *exc):
+        event.remove(async_engine.sync_engine, "before_cursor_execute", self)
+
+
+def _publish_cycle_statements(posts_per_channel: int, arun) -> Counter:
+    async def scenario():
+        now = datetime.utcnow()
+        for name in ("a", "b", "c"):
+            channel = await seed_channel(name)
+            async with AsyncSessionLocal() as db:
+                for number in range(posts_per_channel):
+                    await create_post(db, channel.id, "u", f"{name}{number}", f"{name}{number}", "<b>пост</b>", [],
+                                      now - timedelta(minutes=30 - number))
+        bot = FakeBot()
+        with StatementCounter() as counts:
+            await make_scheduler(bot).publish_scheduled_posts()
+        publish_timer.stop()
+        # Догон публикует по одному посту на канал, остальные распределяются по интервалу
+        assert len(bot.sent) == 3
+        return counts
+
+    return arun(scenario())
+
+
+def test_publish_cycle_statement_count_does_not_grow_with_posts(fresh_db, arun):
+    few = _publish_cycle_statements(2, arun)
+    Base.metadata.drop_all(fresh_db)
+    Base.metadata.create_all(fresh_db)
+    many = _publish_cycle_statements(8, arun)
+    assert few == many
+
+
+def _rss_cycle_statements(sources_per_channel: int, arun, monkeypatch) -> Counter:
+    class Parser:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            pass
+
+        async def fetch_feed(self, url):
+            return url
+
+        def parse_content(self, data, last_guid):
+            return [{"title": f"Новость {data}", "content": "спорт", "media": ["http://img"]}]
+
+    monkeypatch.setattr(scheduler_module, "RSSParser", Parser)
+
+    async def scenario():
+        channels = [await seed_channel(name, sources=sources_per_channel) for name in ("a", "b", "c")]
+        with StatementCounter() as counts:
+            await make_scheduler().check_rss_sources()
+        publish_timer.stop()
+        async with AsyncSessionLocal() as db:
+            created = await db.scalar(select(func.count(Post.id)))
+        # В AI уходят не больше MAX_AI_ENTRIES_PER_CHANNEL записей канала
+        assert created == len(channels) * min(sources_per_channel, MAX_AI_ENTRIES_PER_CHANNEL)
+        return counts
+
+    return arun(scenario())
+
+
+def test_rss_cycle_statement_count_does_not_grow_with_sources(fresh_db, arun, monkeypatch):
+    few = _rss_cycle_statements(MAX_AI_ENTRIES_PER_CHANNEL, arun, monkeypatch)
+    Base.metadata.drop_all(fresh_db)
+    Base.metadata.create_all(fresh_db)
+    many = _rss_cycle_statements(MAX_AI_ENTRIES_PER_CHANNEL + 5, arun, monkeypatch)
+    assert few == many
+
+
+def test_claims_load_only_the_columns_the_scheduler_reads(fresh_db, arun):
+    async def scenario():
+        channel = await seed_channel("a", sources=1)
+        async with AsyncSessionLocal() as db:
+            await create_post(db, channel.id, "u", "t", "original", "<b>t</b>", [], datetime.utcnow())
+        async with AsyncSessionLocal() as db:
+            post = (await claim_pending_posts(db, WORKER_ID, LEASE_TTL))[channel.id][0]
+            source = (await claim_sources(db, WORKER_ID, LEASE_TTL, datetime.utcnow(), 10))[0]
+            # Всё, что читает планировщик, загружено вместе с захватом
+            for name in ("id", "channel_id", "original_title", "processed_content", "media_urls", "image_digest",
+                         "scheduled_time", "retry_count", "lease_token"):
+                getattr(post, name)
+            for name in ("id", "url", "name", "channel_id", "last_guid", "lease_token"):
+                getattr(source, name)
+            for claimed in (post.channel, source.channel):
+                for name in ("id", "channel_id", "channel_name", "topic", "is_active", "post_interval",
+                             "moderation_mode", "ai_model", "ai_prompt", "settings", "topic_profile"):
+                    getattr(claimed, name)
+            # Остальное не загружено, и обращение к нему — ошибка, а не скрытый запрос на каждую строку
+            for instance, name in [(post, "original_content"), (source, "error_count"), (post.channel, "owner_id")]:
+                with pytest.raises(InvalidRequestError, match="raiseload"):
+                    getattr(instance, name)
+
+    arun(scenario())
+
+
+def _digest_pass(bot, arun):
+    async def scenario():
+        channel = await seed_channel("digest")
+        async with AsyncSessionLocal() as db:
+            await update_channel_settings(db, channel.id, settings={"catchup": {"mode": "digest"}})
+            for number in range(3):
+                await create_post(db, channel.id, "u", f"Source headline {number}", "текст",
+                                  f"<b>⚽ Заголовок &amp; новость {number}</b>\n\nТекст", [],
+                                  datetime.utcnow() - timedelta(hours=1, minutes=number))
+        await make_scheduler(bot).publish_scheduled_posts()
+        publish_timer.stop()
+        async with AsyncSessionLocal() as db:
+            return (await db.scalars(select(Post).order_by(Post.id))).all()
+
+    return arun(scenario())
+
+
+def test_digest_uses_processed_titles(fresh_db, arun):
+    class TextBot(FakeBot):
+        async def send_message(self, chat_id, text, parse_mode=None):
+            self.text = text
+            return await super().send_message(chat_id, text, parse_mode)
+
+    bot = TextBot()
+    posts = _digest_pass(bot, arun)
+
+    assert [post.status for post in posts] == ["digest"] * 3
+    assert "• Заголовок &amp; новость 0" in bot.text and "Source headline" not in bot.text
+
+
+def test_failed_digest_is_retried_like_single_posts(fresh_db, arun):
+    class DownBot(FakeBot):
+        async def send_message(self, chat_id, text, parse_mode=None):
+            raise TelegramNetworkError(method=SendMessage(chat_id=chat_id, text=text), message="timeout")
+
+    posts = _digest_pass(DownBot(), arun)
+
+    # Временная ошибка не теряет накопившиеся посты: они ждут следующей попытки
+    assert [post.status for post in posts] == ["pending"] * 3
+    assert all(post.retry_count == 1 and post.next_attempt_at > datetime.utcnow() for post in posts)
+    assert all("TelegramNetworkError" in post.last_error for post in posts)
+
+
+def test_duplicates_do_not_reserve_publish_slots(fresh_db, arun):
+    async def scenario():
+        channel = await seed_channel("slots")
+        async with AsyncSessionLocal() as db:
+            await create_post(db, channel.id, "u", "Старая", "текст", "<b>Старая</b>", [], datetime.utcnow())
+        source = types.SimpleNamespace(url="http://slots")
+        processed = [({"title": title, "content": "текст"}, source, f"<b>{title}</b>", None)
+                     for title in ("Старая", "Новая", "Новая", "Ещё одна")]
+        async with AsyncSessionLocal() as db:
+            await make_scheduler()._persist_entries(channel, processed, db)
+        publish_timer.stop()
+        async with AsyncSessionLocal() as db:
+            times = (await db.scalars(select(Post.scheduled_time).where(Post.original_title != "Старая")
+                                      .order_by(Post.scheduled_time))).all()
+            next_slot = await db.scalar(select(Channel.next_slot_time).where(Channel.id == channel.id))
+        return times, next_slot, channel.post_interval
+
+    times, next_slot, interval = arun(scenario())
+    # Два новых поста подряд, а следующий слот сразу за ними: дубликаты места в расписании не заняли
+    step = timedelta(seconds=interval)
+    assert len(times) == 2 and times[1] - times[0] == step
+    assert next_slot == times[1] + step